@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+"""
+Centrality measures over a CSR line graph.
+
+These replace the networkx centralities of the metrics cell in
+build_graph.ipynb and give the same values (normalized like networkx) when
+computed exactly:
+
+    in_degree, out_degree   degree / (n - 1)
+    betweenness             Brandes, normalized by 1 / ((n - 1)(n - 2))
+    closeness               inward distances, Wasserman-Faust scaling
+    pagerank                power iteration, dangling nodes spread uniformly
+    eigenvector             power iteration with A + I, like networkx
+
+Betweenness and closeness share one breadth-first search that runs from a
+batch of sources at once and, level by level, only follows the CSR rows of
+the frontier, so a long chain costs no more per edge than a bushy graph.
+Up to exact_limit nodes
+every node is a source and the result is exact. Above that, a random sample
+of pivot sources is used (Brandes & Pich; Eppstein & Wang) and the result is
+scaled up. The sample is sized so that, with probability 1 - delta, every
+normalized betweenness is within epsilon of the true value, and every
+average inward distance (the reciprocal of closeness) is within epsilon
+times the largest distance seen. The bound reached is returned as
+"<measure>_bound".
+
+Results are cached on disk keyed by a hash of the graph and the parameters,
+and function_centrality() computes the measures on each function of a
+LineGraph separately, across a process pool.
+
+    python centrality.py test_files/quicksort.c
+    python centrality.py --chain 5000      # time against networkx on a chain
+
+With --profile FILE every measure is computed on its own, bypassing the
+cache, and its time and memory are written as JSON (see test_files/profiling.py).
+"""
+
+import functools
+import hashlib
+import math
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from cfg_cache import CACHE_DIR
+from propagation import ConvergenceError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_files"))
+from profiling import from_argv
+
+MEASURES = ("in_degree", "out_degree", "pagerank", "betweenness", "closeness", "eigenvector")
+EXACT_LIMIT = 5000
+# Largest n x batch block of the breadth-first search, in elements
+BFS_BUDGET = 1 << 22
+
+
+def graph_hash(A):
+    """Hash of the structure of a CSR adjacency matrix."""
+    A = A.tocsr()
+    A.sort_indices()
+    h = hashlib.sha256()
+    h.update(np.array(A.shape, dtype=np.int64).tobytes())
+    h.update(A.indptr.astype(np.int64).tobytes())
+    h.update(A.indices.astype(np.int64).tobytes())
+    return h.hexdigest()
+
+
+def degree_centrality(A, direction="in"):
+    n = A.shape[0]
+    if n <= 1:
+        return np.ones(n)
+    axis = 0 if direction == "in" else 1
+    return np.asarray((A != 0).sum(axis=axis)).ravel() / (n - 1)
+
+
+def pagerank(A, alpha=0.85, tol=1e-6, max_iter=100):
+    """PageRank by power iteration; converged when the L1 change is below n * tol."""
+    n = A.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    out_degree = np.asarray(A.sum(axis=1)).ravel()
+    dangling = out_degree == 0
+    # Column-stochastic transpose: x_next = alpha * P^T x + teleport
+    PT = A.T.tocsr().astype(np.float64)
+    PT.data = PT.data / np.where(dangling, 1.0, out_degree)[PT.indices]
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        x_next = alpha * (PT @ x + x[dangling].sum() / n) + (1 - alpha) / n
+        if np.abs(x_next - x).sum() < n * tol:
+            return x_next
+        x = x_next
+    raise ConvergenceError(f"PageRank did not converge in {max_iter} iterations")
+
+
+def eigenvector(A, tol=1e-6, max_iter=1000):
+    """Eigenvector centrality by power iteration with A + I, as networkx does."""
+    n = A.shape[0]
+    if n == 0:
+        return np.zeros(0)
+    AT = A.T.tocsr()
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        x_next = x + AT @ x
+        x_next /= np.linalg.norm(x_next) or 1.0
+        if np.abs(x_next - x).sum() < n * tol:
+            return x_next
+        x = x_next
+    raise ConvergenceError(f"Eigenvector centrality did not converge in {max_iter} iterations")
+
+
+def _expand(indptr, indices, keys, b):
+    """
+    Follow the CSR rows of the nodes in keys (flat node * b + source
+    indices). Returns the flat keys of the neighbours and, for each, the
+    position in keys it was reached from.
+    """
+    nodes, cols = np.divmod(keys, b)
+    starts = indptr[nodes]
+    counts = indptr[nodes + 1] - starts
+    origin = np.repeat(np.arange(len(keys)), counts)
+    offsets = np.arange(len(origin)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return indices[starts[origin] + offsets] * b + cols[origin], origin
+
+
+def _search(A, AT, sources):
+    """
+    Breadth-first search from a batch of sources, as (n x batch) arrays.
+
+    Returns the dependency of every node on every source (Brandes), and the
+    hop distance from every source (-1 where unreachable). Each level only
+    follows the CSR rows of its frontier, so the work is O(batch * edges)
+    whatever the depth of the graph.
+    """
+    n, b = A.shape[0], len(sources)
+    dist = np.full(n * b, -1, dtype=np.int32)
+    sigma = np.zeros(n * b)
+    roots = np.asarray(sources, dtype=np.int64) * b + np.arange(b)
+    dist[roots] = 0
+    sigma[roots] = 1.0
+
+    # Forward: count shortest paths level by level
+    levels = [roots]
+    while True:
+        reached, origin = _expand(A.indptr, A.indices, levels[-1], b)
+        fresh = dist[reached] < 0
+        if not fresh.any():
+            break
+        new, slot = np.unique(reached[fresh], return_inverse=True)
+        sigma[new] = np.bincount(slot, sigma[levels[-1][origin[fresh]]], len(new))
+        dist[new] = len(levels)
+        levels.append(new)
+
+    # Backward: accumulate dependencies from the deepest level up
+    delta = np.zeros(n * b)
+    for depth in range(len(levels) - 1, 0, -1):
+        level = levels[depth]
+        parents, origin = _expand(AT.indptr, AT.indices, level, b)
+        on_path = dist[parents] == depth - 1
+        parents, origin = parents[on_path], origin[on_path]
+        coef = (1 + delta[level]) / sigma[level]
+        np.add.at(delta, parents, sigma[parents] * coef[origin])
+    delta[roots] = 0.0
+    return delta.reshape(n, b), dist.reshape(n, b)
+
+
+def pivots_needed(n, epsilon, delta):
+    """Number of sampled sources for an epsilon bound with probability 1 - delta."""
+    if n < 3:
+        return n
+    scale = n / (n - 1)
+    return math.ceil(scale ** 2 * math.log(2 * n / delta) / (2 * epsilon ** 2))
+
+
+def path_centrality(A, exact_limit=EXACT_LIMIT, epsilon=0.05, delta=0.1, seed=0):
+    """
+    Betweenness and closeness, exact up to exact_limit nodes, sampled above.
+
+    Returns {"betweenness", "closeness", "betweenness_bound", "closeness_bound"}
+    with bounds of 0 for exact results.
+    """
+    n = A.shape[0]
+    A = A.tocsr().astype(np.float64)
+    A.sum_duplicates()
+    A.eliminate_zeros()
+    AT = A.T.tocsr()
+    k = n if n <= exact_limit else min(n, pivots_needed(n, epsilon, delta))
+    if k == n:
+        sources = np.arange(n)
+    else:
+        sources = np.sort(np.random.default_rng(seed).choice(n, k, replace=False))
+
+    dependency = np.zeros(n)
+    distance_sum = np.zeros(n)
+    reach = np.zeros(n)
+    longest = 0
+    batch = max(1, BFS_BUDGET // max(n, 1))
+    for start in range(0, k, batch):
+        delta_s, dist = _search(A, AT, sources[start:start + batch])
+        dependency += delta_s.sum(axis=1)
+        reached = dist > 0
+        distance_sum += np.where(reached, dist, 0).sum(axis=1)
+        reach += reached.sum(axis=1)
+        longest = max(longest, int(dist.max(initial=0)))
+
+    # Scale sampled sums up to all n sources
+    dependency *= n / k
+    distance_sum *= n / k
+    reach *= n / k
+
+    betweenness = dependency / ((n - 1) * (n - 2)) if n > 2 else np.zeros(n)
+    closeness = np.zeros(n)
+    if n > 1:
+        nonzero = distance_sum > 0
+        closeness[nonzero] = (reach[nonzero] / distance_sum[nonzero]) * (reach[nonzero] / (n - 1))
+
+    if k == n:
+        bounds = (0.0, 0.0)
+    else:
+        epsilon_k = (n / (n - 1)) * math.sqrt(math.log(2 * n / delta) / (2 * k))
+        bounds = (epsilon_k, epsilon_k * longest)
+    return {
+        "betweenness": betweenness,
+        "closeness": closeness,
+        "betweenness_bound": bounds[0],
+        "closeness_bound": bounds[1],
+    }
+
+
+def _compute(A, measures, exact_limit, epsilon, delta, seed):
+    results = {}
+    if "in_degree" in measures:
+        results["in_degree"] = degree_centrality(A, "in")
+    if "out_degree" in measures:
+        results["out_degree"] = degree_centrality(A, "out")
+    if "pagerank" in measures:
+        results["pagerank"] = pagerank(A)
+    if "eigenvector" in measures:
+        results["eigenvector"] = eigenvector(A)
+    if "betweenness" in measures or "closeness" in measures:
+        paths = path_centrality(A, exact_limit, epsilon, delta, seed)
+        for name in ("betweenness", "closeness"):
+            if name in measures:
+                results[name] = paths[name]
+                results[name + "_bound"] = paths[name + "_bound"]
+    return results
+
+
+def cache_path(A, measures, exact_limit, epsilon, delta, seed, cache_dir=CACHE_DIR):
+    params = f"{','.join(sorted(measures))} {exact_limit} {epsilon} {delta} {seed}"
+    key = hashlib.sha256((graph_hash(A) + " " + params).encode()).hexdigest()
+    return os.path.join(cache_dir, "centrality", key[:2], key + ".npz")
+
+
+def centrality(A, measures=MEASURES, exact_limit=EXACT_LIMIT, epsilon=0.05, delta=0.1, seed=0, cache_dir=CACHE_DIR):
+    """
+    Compute the requested measures of a CSR adjacency matrix as {name: array}.
+
+    Results are read from and written to the cache unless cache_dir is None.
+    """
+    measures = tuple(measures)
+    path = None
+    if cache_dir is not None:
+        path = cache_path(A, measures, exact_limit, epsilon, delta, seed, cache_dir)
+        if os.path.exists(path):
+            with np.load(path) as cached:
+                return {key: cached[key] if cached[key].ndim else float(cached[key]) for key in cached.files}
+
+    results = _compute(A, measures, exact_limit, epsilon, delta, seed)
+    if path is not None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary name first so concurrent readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **results)
+        os.replace(tmp_path, path)
+    return results
+
+
+def function_centrality(graph, measures=MEASURES, processes=None, **kwargs):
+    """
+    Compute the measures on the subgraph of every function of a LineGraph.
+
+    Each function is one task of a process pool; values are scattered back
+    into whole-graph arrays (lines outside any function get 0). Bounds are
+    the largest over all functions.
+    """
+    A = graph.adjacency.tocsr()
+    groups = [graph.function_nodes(f) for f in range(len(graph.function_names))]
+    groups = [nodes for nodes in groups if len(nodes)]
+    subgraphs = [A[nodes][:, nodes] for nodes in groups]
+
+    compute = functools.partial(centrality, measures=measures, **kwargs)
+    if processes == 1 or len(subgraphs) <= 1:
+        parts = list(map(compute, subgraphs))
+    else:
+        with Pool(processes) as pool:
+            parts = pool.map(compute, subgraphs, chunksize=1)
+
+    results = {}
+    for nodes, part in zip(groups, parts):
+        for name, values in part.items():
+            if name.endswith("_bound"):
+                results[name] = max(results.get(name, 0.0), values)
+            else:
+                results.setdefault(name, np.zeros(graph.n_nodes))[nodes] = values
+    return results
+
+
+def chain_benchmark(n):
+    """
+    Time exact betweenness and closeness against networkx on an n-node
+    chain, the deepest graph there is for its size. Returns both times and
+    the largest difference of the values.
+    """
+    import networkx as nx
+    import scipy.sparse as sp
+
+    A = sp.diags(np.ones(max(n - 1, 0)), 1, shape=(n, n), format="csr")
+    start = time.perf_counter()
+    ours = path_centrality(A, exact_limit=n)
+    seconds = time.perf_counter() - start
+
+    G = nx.from_scipy_sparse_array(A, create_using=nx.DiGraph)
+    start = time.perf_counter()
+    theirs = {"betweenness": nx.betweenness_centrality(G), "closeness": nx.closeness_centrality(G)}
+    networkx_seconds = time.perf_counter() - start
+    error = max(
+        float(np.abs(ours[name] - np.array([theirs[name][i] for i in range(n)])).max(initial=0.0))
+        for name in theirs
+    )
+    return {"seconds": seconds, "networkx_seconds": networkx_seconds, "max_error": error}
+
+
+def main():
+    profiler, sources = from_argv("centrality.py", sys.argv[1:])
+    if len(sources) == 2 and sources[0] == "--chain":
+        timing = chain_benchmark(int(sources[1]))
+        print(f"{sources[1]}-node chain: {timing['seconds']:.2f}s, networkx {timing['networkx_seconds']:.2f}s, "
+              f"largest difference {timing['max_error']:.2e}")
+        sys.exit(0 if timing["max_error"] < 1e-9 and timing["seconds"] < timing["networkx_seconds"] else 1)
+    if not sources:
+        print("Usage: python centrality.py [--profile FILE] [--cprofile DIR] <file.c> [file.c ...]")
+        print("       python centrality.py --chain N")
+        sys.exit(1)
+
+    from line_graph import load_line_graph
+
+    with profiler:
+        with profiler.stage("graph") as stage:
+            graph = load_line_graph(sources)
+            stage.items = graph.n_nodes
+        if profiler.enabled:
+            # One measure at a time and without the cache, so each gets its own timing
+            results = {}
+            for name in MEASURES:
+                with profiler.stage(name, items=graph.n_nodes):
+                    results.update(centrality(graph.adjacency, [name], cache_dir=None))
+        else:
+            results = centrality(graph.adjacency)
+    print(f"{graph.n_nodes} lines, {graph.n_edges} edges")
+    for name in MEASURES:
+        if name in results:
+            top = int(np.argmax(results[name]))
+            bound = results.get(name + "_bound")
+            suffix = f" (bound {bound:.4f})" if bound else ""
+            print(f"  {name}: max {results[name][top]:.4f} at {graph.label(top)}{suffix}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of parsed control flow graphs.
+
+Each entry is keyed by a hash of the source file contents, its file name
+(the CFG refers to lines as "file.c:line"), the compiler version, the
+compiler flags and the version of the array format. On a miss the source is
+compiled with a CFG dump in a scratch directory, parsed with cfg_parser.py
+(graphs and call sites), deduplicated and renamed, and the result is stored
+in the cache in the integer array format of cfg_format.py; on a hit neither
+gcc nor the parser runs.
+
+    python cfg_cache.py test_files/tcas*.c          # warm the cache
+    python cfg_cache.py --export test_files/tcas3.c # also write tcas3_cfg_all_functions.json
+
+The cache lives in .cfg_cache/ next to this file unless CFG_CACHE_DIR is set.
+"""
+
+import functools
+import glob
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from multiprocessing import Pool
+
+from cfg_format import FORMAT_VERSION, encode_graphs, load_cfg, save_cfg
+from cfg_parser import parse_call_sites, parse_to_graphs
+
+CACHE_DIR = os.environ.get("CFG_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cfg_cache"))
+DEFAULT_FLAGS = ("-O0", "-fdump-tree-cfg-lineno")
+
+
+@functools.lru_cache(maxsize=None)
+def compiler_version(compiler="gcc"):
+    result = subprocess.run([compiler, "-dumpfullversion"], stdout=subprocess.PIPE, text=True, check=True)
+    return result.stdout.strip()
+
+
+def cache_key(source, flags=DEFAULT_FLAGS, compiler="gcc"):
+    """Hash of everything that determines the CFG of a source file."""
+    h = hashlib.sha256()
+    h.update(f"cfg format {FORMAT_VERSION}\0".encode())
+    h.update(f"{compiler} {compiler_version(compiler)}\0".encode())
+    h.update(("\0".join(flags) + "\0").encode())
+    h.update((os.path.basename(source) + "\0").encode())
+    with open(source, "rb") as f:
+        h.update(f.read())
+    return h.hexdigest()
+
+
+def entry_path(key, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, key[:2], key + ".npz")
+
+
+def write_dump(source, work_dir, flags=DEFAULT_FLAGS, compiler="gcc"):
+    """Compile a copy of source in work_dir with a CFG dump; returns the path of the dump."""
+    name = os.path.basename(source)
+    if os.path.abspath(source) != os.path.abspath(os.path.join(work_dir, name)):
+        shutil.copy(source, os.path.join(work_dir, name))
+    subprocess.run(
+        [compiler, *flags, "-c", name, "-o", os.devnull],
+        cwd=work_dir,
+        check=True
+    )
+    dumps = glob.glob(os.path.join(work_dir, name + ".*.cfg"))
+    if not dumps:
+        raise FileNotFoundError(f"{compiler} {' '.join(flags)} produced no CFG dump for {source}")
+    return dumps[0]
+
+
+def dump_cfg(source, flags=DEFAULT_FLAGS, compiler="gcc"):
+    """
+    Compile source with a CFG dump in a scratch directory and parse the dump.
+
+    Returns (per-function JSON graphs, call sites).
+    """
+    with tempfile.TemporaryDirectory(prefix="cfg_") as work_dir:
+        dump = write_dump(source, work_dir, flags, compiler)
+        return parse_to_graphs(dump), parse_call_sites(dump)
+
+
+def load_compact(source, flags=DEFAULT_FLAGS, compiler="gcc", cache_dir=CACHE_DIR):
+    """Return the CompactCFG of a source file, compiling and parsing only on a cache miss."""
+    return _load(source, flags, compiler, cache_dir)[0]
+
+
+def load_graphs(source, flags=DEFAULT_FLAGS, compiler="gcc", cache_dir=CACHE_DIR):
+    """Return the JSON-style per-function graphs of a source file (see load_compact)."""
+    return load_compact(source, flags, compiler, cache_dir).to_graphs()
+
+
+def _load(source, flags=DEFAULT_FLAGS, compiler="gcc", cache_dir=CACHE_DIR):
+    """load_compact() that also reports whether the entry was already cached."""
+    path = entry_path(cache_key(source, flags, compiler), cache_dir)
+    if os.path.exists(path):
+        return load_cfg(path), True
+
+    cfg = encode_graphs(*dump_cfg(source, flags, compiler))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary name first so concurrent readers never see a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        save_cfg(cfg, f)
+    os.replace(tmp_path, path)
+    return cfg, False
+
+
+def load_many(sources, flags=DEFAULT_FLAGS, compiler="gcc", cache_dir=CACHE_DIR, processes=None):
+    """Load many sources in parallel; returns [(CompactCFG, was cached)] in order."""
+    load = functools.partial(_load, flags=flags, compiler=compiler, cache_dir=cache_dir)
+    with Pool(processes) as pool:
+        return pool.map(load, sources, chunksize=1)
+
+
+def main():
+    args = sys.argv[1:]
+    export = "--export" in args
+    sources = [a for a in args if a != "--export"]
+    if not sources:
+        print("Usage: python cfg_cache.py [--export] <file.c> [file.c ...]")
+        sys.exit(1)
+
+    results = load_many(sources) if len(sources) > 1 else [_load(sources[0])]
+    for source, (cfg, cached) in zip(sources, results):
+        print(f"{source}: {'cached' if cached else 'parsed'} ({cfg.n_functions} functions)")
+        if export:
+            output_file = os.path.basename(source).split(".")[0] + "_cfg_all_functions.json"
+            with open(output_file, "w") as f:
+                json.dump(cfg.to_graphs(), f, indent=2)
+            print(f"  exported to `{output_file}`")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Compact array format for the parsed CFGs of cfg_parser.py.
+
+Instead of nested JSON with "bbN" labels and "file.c:line" strings, every
+function is stored as integer arrays in a single .npz file:
+
+    files               string table of source file names
+    function_names      one name per function
+    function_block_ptr  blocks of function f are [ptr[f], ptr[f+1]) globally
+    edge_ptr, edge_dst  CSR successors of every block (dst is function-local)
+    line_ptr            lines of block b are [line_ptr[b], line_ptr[b+1])
+    line_file, line_no  file index and line number of every block line
+    call_function       calling function of every call site
+    call_file, call_line
+                        file index and line number of every call site
+    call_callee         callee of every call site, indexing callee_names
+
+Block bbK of a function is local block K-1 and "bbend" is its last block,
+matching the renumbering done by compress_function.
+"""
+
+import json
+import os
+import sys
+
+import numpy as np
+
+LINE_SHIFT = 32
+# Bumped whenever the arrays change, so cached entries are rebuilt
+FORMAT_VERSION = 2
+CALL_ARRAYS = ("call_function", "call_file", "call_line", "call_callee")
+
+
+class CompactCFG:
+    """Integer-array view of all function CFGs of one source file."""
+
+    def __init__(self, arrays):
+        self.files = [str(f) for f in arrays["files"]]
+        self.function_names = [str(f) for f in arrays["function_names"]]
+        self.function_block_ptr = arrays["function_block_ptr"]
+        self.edge_ptr = arrays["edge_ptr"]
+        self.edge_dst = arrays["edge_dst"]
+        self.line_ptr = arrays["line_ptr"]
+        self.line_file = arrays["line_file"]
+        self.line_no = arrays["line_no"]
+        # Files written before call sites were recorded have none
+        self.callee_names = [str(f) for f in arrays.get("callee_names", [])]
+        for key in CALL_ARRAYS:
+            setattr(self, key, arrays.get(key, np.zeros(0, dtype=np.int32)))
+        self._line_edges = None
+
+    @property
+    def n_functions(self):
+        return len(self.function_names)
+
+    @property
+    def n_blocks(self):
+        return len(self.line_ptr) - 1
+
+    @property
+    def n_calls(self):
+        return len(self.call_callee)
+
+    def block_function(self):
+        """Function index of every block."""
+        return np.repeat(np.arange(self.n_functions), np.diff(self.function_block_ptr))
+
+    def block_edges(self):
+        """(src, dst) arrays of block edges with global block indices."""
+        src = np.repeat(np.arange(self.n_blocks), np.diff(self.edge_ptr))
+        dst = self.edge_dst + self.function_block_ptr[self.block_function()[src]]
+        return src, dst
+
+    def line_keys(self):
+        """One integer per block line identifying (file, line): file << 32 | line."""
+        return (self.line_file.astype(np.int64) << LINE_SHIFT) | self.line_no.astype(np.int64)
+
+    def call_keys(self):
+        """Line key (see line_keys) of every call site."""
+        return (self.call_file.astype(np.int64) << LINE_SHIFT) | self.call_line.astype(np.int64)
+
+    def line_edges(self):
+        """
+        Edges of the line graph built in build_graph.ipynb as line-key arrays.
+
+        Consecutive lines of a block are connected, and the last line of a
+        block is connected to the first line of each non-empty successor.
+        Returns (src keys, dst keys, function index of each edge).
+        """
+        keys = self.line_keys()
+        block_of_line = np.repeat(np.arange(self.n_blocks), np.diff(self.line_ptr))
+        func_of_block = self.block_function()
+
+        # Lines that follow each other inside one block
+        pos = np.arange(len(keys) - 1)
+        inside = pos[block_of_line[pos] == block_of_line[pos + 1]]
+
+        # Last line of a block to the first line of a successor, both non-empty
+        src_block, dst_block = self.block_edges()
+        sizes = np.diff(self.line_ptr)
+        across = (sizes[src_block] > 0) & (sizes[dst_block] > 0)
+        src_block, dst_block = src_block[across], dst_block[across]
+
+        src = np.concatenate([keys[inside], keys[self.line_ptr[src_block + 1] - 1]])
+        dst = np.concatenate([keys[inside + 1], keys[self.line_ptr[dst_block]]])
+        func = np.concatenate([func_of_block[block_of_line[inside]], func_of_block[src_block]])
+        return src, dst, func
+
+    def function_line_graph(self, f):
+        """
+        (nodes, src, dst) line-number arrays of the line graph of function f.
+
+        Nodes are the distinct line numbers in the function, as used by
+        build_graph.ipynb once it relabels "file.c:line" nodes to integers.
+        """
+        start, end = self.function_block_ptr[f], self.function_block_ptr[f + 1]
+        nodes = np.unique(self.line_no[self.line_ptr[start]:self.line_ptr[end]])
+        if self._line_edges is None:
+            self._line_edges = self.line_edges()
+        src, dst, func = self._line_edges
+        mask = func == f
+        line_mask = (1 << LINE_SHIFT) - 1
+        return nodes, src[mask] & line_mask, dst[mask] & line_mask
+
+    def to_graphs(self):
+        """Rebuild the JSON-style graphs of compress_function."""
+        graphs = []
+        for f, name in enumerate(self.function_names):
+            start, end = self.function_block_ptr[f], self.function_block_ptr[f + 1]
+            n = end - start
+            labels = [f"bb{k + 1}" for k in range(n - 1)] + ["bbend"]
+            nodes, edges = {}, []
+            for local, b in enumerate(range(start, end)):
+                lo, hi = self.line_ptr[b], self.line_ptr[b + 1]
+                if hi > lo:
+                    nodes[labels[local]] = {
+                        "lines": [f"{self.files[i]}:{line}" for i, line in zip(self.line_file[lo:hi], self.line_no[lo:hi])]
+                    }
+                else:
+                    nodes[labels[local]] = {}
+                for dst in self.edge_dst[self.edge_ptr[b]:self.edge_ptr[b + 1]]:
+                    edges.append([labels[local], labels[dst]])
+            graphs.append({"function": name, "edges": sorted(edges), "nodes": nodes})
+        return graphs
+
+
+def _block_index(label, n_blocks):
+    return n_blocks - 1 if label == "bbend" else int(label[2:]) - 1
+
+
+def encode_graphs(graphs, calls=()):
+    """
+    Convert the JSON-style graphs of compress_function into CompactCFG arrays.
+
+    calls are (caller, "file.c:line", callee) tuples as parsed by
+    cfg_parser.iter_call_sites; calls from unknown functions are dropped.
+    """
+    files = {}
+    function_block_ptr = [0]
+    edge_ptr, edge_dst = [0], []
+    line_ptr, line_file, line_no = [0], [], []
+
+    for graph in graphs:
+        n = len(graph["nodes"])
+        successors = [[] for _ in range(n)]
+        for src, dst in graph["edges"]:
+            successors[_block_index(src, n)].append(_block_index(dst, n))
+        block_lines = [[] for _ in range(n)]
+        for label, info in graph["nodes"].items():
+            block_lines[_block_index(label, n)] = info.get("lines", [])
+
+        for b in range(n):
+            edge_dst.extend(sorted(successors[b]))
+            edge_ptr.append(len(edge_dst))
+            for location in block_lines[b]:
+                filename, line = location.rsplit(":", 1)
+                line_file.append(files.setdefault(filename, len(files)))
+                line_no.append(int(line))
+            line_ptr.append(len(line_no))
+        function_block_ptr.append(function_block_ptr[-1] + n)
+
+    function_index = {}
+    for f, graph in enumerate(graphs):
+        function_index.setdefault(graph["function"], f)
+    callees = {}
+    call_function, call_file, call_line, call_callee = [], [], [], []
+    for caller, location, callee in calls:
+        if caller not in function_index:
+            continue
+        filename, line = location.rsplit(":", 1)
+        call_function.append(function_index[caller])
+        call_file.append(files.setdefault(filename, len(files)))
+        call_line.append(int(line))
+        call_callee.append(callees.setdefault(callee, len(callees)))
+
+    return CompactCFG({
+        "files": np.array(list(files), dtype=str),
+        "function_names": np.array([g["function"] for g in graphs], dtype=str),
+        "function_block_ptr": np.array(function_block_ptr, dtype=np.int64),
+        "edge_ptr": np.array(edge_ptr, dtype=np.int64),
+        "edge_dst": np.array(edge_dst, dtype=np.int32),
+        "line_ptr": np.array(line_ptr, dtype=np.int64),
+        "line_file": np.array(line_file, dtype=np.int32),
+        "line_no": np.array(line_no, dtype=np.int32),
+        "callee_names": np.array(list(callees), dtype=str),
+        "call_function": np.array(call_function, dtype=np.int32),
+        "call_file": np.array(call_file, dtype=np.int32),
+        "call_line": np.array(call_line, dtype=np.int32),
+        "call_callee": np.array(call_callee, dtype=np.int32),
+    })
+
+
+def save_cfg(cfg, path):
+    """Write a CompactCFG to an .npz file (path or open binary file)."""
+    np.savez(
+        path,
+        files=np.array(cfg.files, dtype=str),
+        function_names=np.array(cfg.function_names, dtype=str),
+        function_block_ptr=cfg.function_block_ptr,
+        edge_ptr=cfg.edge_ptr,
+        edge_dst=cfg.edge_dst,
+        line_ptr=cfg.line_ptr,
+        line_file=cfg.line_file,
+        line_no=cfg.line_no,
+        callee_names=np.array(cfg.callee_names, dtype=str),
+        **{key: getattr(cfg, key) for key in CALL_ARRAYS},
+    )
+
+
+def load_cfg(path):
+    """Load a CompactCFG from an .npz file written by save_cfg()."""
+    with np.load(path) as arrays:
+        return CompactCFG({key: arrays[key] for key in arrays.files})
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python cfg_format.py <in.json | in.npz> <out.npz | out.json>")
+        sys.exit(1)
+
+    source, target = sys.argv[1], sys.argv[2]
+    if source.endswith(".json"):
+        with open(source, "r") as f:
+            save_cfg(encode_graphs(json.load(f)), target)
+    else:
+        with open(target, "w") as f:
+            json.dump(load_cfg(source).to_graphs(), f, indent=2)
+    print(f"{source} ({os.path.getsize(source)} bytes) -> {target} ({os.path.getsize(target)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
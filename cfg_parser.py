@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Streaming parser for GCC control flow graph dumps (*.c.015t.cfg).
+
+This is the parser from parser.ipynb as a reusable module. The dump is read
+line by line and each function is yielded as soon as the next one starts, so
+memory is bounded by the largest function rather than the whole file. The
+line patterns are compiled once, and a whole directory of dumps can be
+parsed across a process pool.
+
+    python cfg_parser.py tcas3.c.015t.cfg          # -> tcas3_cfg_all_functions.json
+    python cfg_parser.py bin/ [processes]          # every *.cfg dump in bin/
+
+--profile FILE records the parsing time, memory and functions per second
+as JSON (see test_files/profiling.py).
+"""
+
+import glob
+import json
+import os
+import re
+import sys
+from collections import defaultdict
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_files"))
+from profiling import from_argv
+
+
+# One anchored pattern for the structural lines: function header,
+# successor list (;; 1 succs { 2 3 }) and basic block header (<bb 2>:)
+STRUCTURE_PATTERN = re.compile(
+    r";; Function (?P<function>\w+)"
+    r"|;;\s*(?P<from_bb>\d+)\s+succs\s+\{(?P<to_bbs>[^}]*)\}"
+    r"|\s*<bb\s+(?P<bb>\d+)>"
+)
+# Source references inside a block, e.g. [tcas3.c:57:9]
+CODE_PATTERN = re.compile(r"\[(\w+\.c:\d+):\d+[\w\s]*\]")
+# Call statements, e.g. [quicksort.c:42:16] index = partition (left, right);
+CALL_PATTERN = re.compile(r"\s*\[(\w+\.c:\d+):\d+[\w\s]*\]\s+(?:\S+ = )?(\w+) \(")
+# Statements that look like calls in the dump but are not
+NOT_CALLS = frozenset(["if", "switch"])
+
+
+def iter_functions(lines):
+    """
+    Parse CFG dump lines, yielding (function, successors, basic_blocks) per function.
+
+    successors maps a block number to its successor block numbers and
+    basic_blocks maps a block number to the "file.c:line" references in it.
+    """
+    current_function = None
+    successors = defaultdict(list)
+    basic_blocks = defaultdict(list)
+    current_bb = None
+
+    for line in lines:
+        match = STRUCTURE_PATTERN.match(line)
+        if match:
+            if match.group("function"):
+                # Hand back the previously parsed function
+                if current_function:
+                    yield current_function, dict(successors), dict(basic_blocks)
+                    successors = defaultdict(list)
+                    basic_blocks = defaultdict(list)
+                current_function = match.group("function")
+                current_bb = None
+                continue
+            if match.group("from_bb"):
+                successors[int(match.group("from_bb"))].extend(map(int, match.group("to_bbs").split()))
+            else:
+                current_bb = int(match.group("bb"))
+                continue
+
+        # Collect source code references inside each basic block
+        if current_bb is not None and "[" in line:
+            code_match = CODE_PATTERN.search(line)
+            if code_match:
+                basic_blocks[current_bb].append(code_match.group(1))
+
+    # Add the last function if present
+    if current_function:
+        yield current_function, dict(successors), dict(basic_blocks)
+
+
+def iter_call_sites(lines):
+    """
+    Parse CFG dump lines, yielding (caller, "file.c:line", callee) per call statement.
+
+    Calls through function pointers and to functions defined elsewhere are
+    yielded too; resolving callees is left to the caller.
+    """
+    current_function = None
+    for line in lines:
+        if line.startswith(";; Function "):
+            current_function = line.split()[2]
+            continue
+        match = CALL_PATTERN.match(line)
+        if match and current_function and match.group(2) not in NOT_CALLS:
+            yield current_function, match.group(1), match.group(2)
+
+
+def parse_cfg_file(path):
+    """Stream one dump file, yielding its functions as they are parsed."""
+    with open(path, "r") as f:
+        yield from iter_functions(f)
+
+
+def compress_function(func_name, edges, blocks):
+    """
+    Build the JSON graph of one function.
+
+    Blocks with exactly the same set of lines are merged, edges are remapped
+    onto the merged blocks (self loops dropped, unknown targets go to
+    "bbend"), and blocks are renumbered bb1, bb2, ... in order.
+    """
+    # 1. Deduplicate blocks by an *exact* set of lines.
+    content_to_bb = {}
+    bb_mapping = {}
+
+    for bb, lines in blocks.items():
+        key = frozenset(lines)
+        if key not in content_to_bb:
+            content_to_bb[key] = f"bb{bb}"
+        bb_mapping[f"bb{bb}"] = content_to_bb[key]
+
+    # Remap edges to basic block names using the deduplication mapping.
+    edge_list = set()
+    for src, dsts in edges.items():
+        src_bb = bb_mapping.get(f"bb{src}", f"bb{src}")
+        for dst in dsts:
+            dst_bb = bb_mapping.get(f"bb{dst}", "bbend")
+            if src_bb != dst_bb:
+                edge_list.add((src_bb, dst_bb))
+
+    # Generate compressed nodes dictionary.
+    node_dict = {}
+    for lines_set, block_label in content_to_bb.items():
+        node_dict[block_label] = {
+            "lines": sorted(lines_set, key=lambda x: int(x.split(":")[1])),
+        }
+
+    # 2. Collect all unique basic block labels from edges and nodes.
+    unique_blocks = set(["bbend"])
+    for src, dst in edge_list:
+        unique_blocks.add(src)
+        unique_blocks.add(dst)
+    unique_blocks.update(node_dict.keys())
+
+    # 3. Sort the remaining blocks by their numeric value.
+    sorted_blocks = sorted(unique_blocks, key=lambda bb: int(bb[2:]) if bb[2:].isdigit() else float("inf"))
+
+    rename = {
+        sorted_blocks[i]: f"bb{i+1}" if sorted_blocks[i][2:].isdigit() else sorted_blocks[i]
+        for i in range(len(sorted_blocks))
+    }
+
+    # 4. Update the edge list and node dictionary with the new names.
+    edge_list = [[rename[src], rename[dst]] for src, dst in edge_list]
+    new_nodes = {}
+    for bb in sorted_blocks:
+        new_nodes[rename[bb]] = node_dict.get(bb, {})
+
+    return {
+        "function": func_name,
+        "edges": sorted([list(edge) for edge in edge_list]),
+        "nodes": new_nodes
+    }
+
+
+def parse_to_graphs(path):
+    """Parse one dump into the list of per-function JSON graphs."""
+    return [compress_function(*function) for function in parse_cfg_file(path)]
+
+
+def parse_call_sites(path):
+    """Parse one dump into a list of (caller, "file.c:line", callee) call sites."""
+    with open(path, "r") as f:
+        return list(iter_call_sites(f))
+
+
+def output_name(path):
+    """tcas3.c.015t.cfg -> tcas3_cfg_all_functions.json, next to the dump."""
+    base = os.path.basename(path).split(".")[0]
+    return os.path.join(os.path.dirname(path), base + "_cfg_all_functions.json")
+
+
+def export_graphs(path, output_file=None):
+    """Parse one dump and write its graphs as JSON; returns (output file, function count)."""
+    output_file = output_file or output_name(path)
+    graphs = parse_to_graphs(path)
+    with open(output_file, "w") as f:
+        json.dump(graphs, f, indent=2)
+    return output_file, len(graphs)
+
+
+def parse_directory(directory, pattern="*.cfg", processes=None):
+    """Export every dump in a directory in parallel; returns [(output file, function count)]."""
+    paths = sorted(glob.glob(os.path.join(directory, pattern)))
+    with Pool(processes) as pool:
+        return pool.map(export_graphs, paths, chunksize=1)
+
+
+def main():
+    profiler, args = from_argv("cfg_parser.py", sys.argv[1:])
+    if not args:
+        print("Usage: python cfg_parser.py [--profile FILE] [--cprofile DIR] <file.c.015t.cfg | directory> [processes]")
+        sys.exit(1)
+
+    target = args[0]
+    with profiler:
+        with profiler.stage("parse") as stage:
+            if os.path.isdir(target):
+                processes = int(args[1]) if len(args) > 1 else None
+                results = parse_directory(target, processes=processes)
+            else:
+                results = [export_graphs(target)]
+            stage.items = sum(count for _, count in results)
+
+    for output_file, count in results:
+        print(f"Compressed {count} CFGs exported to `{output_file}`")
+
+
+if __name__ == "__main__":
+    main()
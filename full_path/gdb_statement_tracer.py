@@ -2,6 +2,11 @@ import gdb
 import os
 import sys
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from trace_format import TraceWriter, parse_mode, write_dot
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_files"))
+from profiling import from_command
+
 class StatementTracer(gdb.Command):
     """Trace execution at the statement level and log the control flow."""
     
@@ -10,106 +15,99 @@ class StatementTracer(gdb.Command):
         self.last_file = None
         self.last_line = None
         self.trace_count = 0
-        self.nodes = {}  # Store nodes as file:line -> node_id
-        self.edges = []  # Store edges as (from_node, to_node)
-        self.node_count = 0
+        self.writer = None  # TraceWriter: interns locations and counts edges
         
     def get_node_id(self, file, line):
         """Get or create a node ID for a file:line location."""
-        key = f"{file}:{line}"
-        if key not in self.nodes:
-            self.node_count += 1
-            self.nodes[key] = self.node_count
-        return self.nodes[key]
+        return self.writer.node_id(file, line)
     
     def invoke(self, arg, from_tty):
         # Disable pagination to avoid interruptions
         gdb.execute("set pagination off")
         
+        # "--compact" selects the binary trace format (see trace_format.py)
+        compact, arg = parse_mode(arg)
+        # Then "--profile FILE" / "--cprofile DIR" time the trace (see test_files/profiling.py)
+        profiler, arg = from_command("gdb_statement_tracer.py", arg)
+        
         # Start program if not already running
         try:
             gdb.execute("start " + arg)
         except gdb.error:
             print("Program already running, continuing with tracing")
         
-        trace_file = "statement_trace.txt"
+        trace_file = "statement_trace.bin" if compact else "statement_trace.txt"
         dot_file = "control_flow.dot"
         
         print(f"Tracing program execution to {trace_file}")
         print("This may take a while for programs with many statements or iterations.")
         print("Press Ctrl+C to stop tracing at any time.")
         
-        with open(trace_file, "w") as f:
+        with profiler.stage("trace") as stage:
+            self.writer = TraceWriter(trace_file, compact)
             try:
-                # Initial frame
-                frame = gdb.selected_frame()
-                sal = frame.find_sal()
-                
-                if sal.symtab:
-                    self.last_file = sal.symtab.filename
-                    self.last_line = sal.line
-                    f.write(f"START -> {self.last_file}:{self.last_line}\n")
-                
-                # Main tracing loop
-                while True:
-                    # Execute one machine instruction
-                    gdb.execute("stepi", to_string=True)
-                    
+                try:
+                    # Initial frame
                     frame = gdb.selected_frame()
                     sal = frame.find_sal()
                     
-                    # Only record source lines, not assembly
-                    if sal.symtab is not None and sal.line > 0:
-                        current_file = sal.symtab.filename
-                        current_line = sal.line
+                    if sal.symtab:
+                        self.last_file = sal.symtab.filename
+                        self.last_line = sal.line
+                        self.writer.start(self.get_node_id(self.last_file, self.last_line))
+                    
+                    # Main tracing loop
+                    while True:
+                        # Execute one machine instruction
+                        gdb.execute("stepi", to_string=True)
                         
-                        # Only record when we move to a new line
-                        if current_file != self.last_file or current_line != self.last_line:
-                            # Record the edge
-                            from_node = self.get_node_id(self.last_file, self.last_line)
-                            to_node = self.get_node_id(current_file, current_line)
-                            self.edges.append((from_node, to_node))
-                            
-                            # Write to trace file
-                            f.write(f"{self.last_file}:{self.last_line} -> {current_file}:{current_line}\n")
-                            
-                            # Update current position
-                            self.last_file = current_file
-                            self.last_line = current_line
-                            self.trace_count += 1
+                        frame = gdb.selected_frame()
+                        sal = frame.find_sal()
+                        
+                        # Only record source lines, not assembly
+                        if sal.symtab is not None and sal.line > 0:
+                            current_file = sal.symtab.filename
+                            current_line = sal.line
                             
-                            # Occasional progress update
-                            if self.trace_count % 100 == 0:
-                                print(f"Traced {self.trace_count} statement transitions...")
-                    
-            except KeyboardInterrupt:
-                print("Tracing stopped by user.")
-            except gdb.error as e:
-                print(f"Program execution completed or error occurred: {e}")
-            
-            print(f"Traced {self.trace_count} statement transitions.")
+                            # Only record when we move to a new line
+                            if current_file != self.last_file or current_line != self.last_line:
+                                # Record the edge
+                                from_node = self.get_node_id(self.last_file, self.last_line)
+                                to_node = self.get_node_id(current_file, current_line)
+                                
+                                # Write to trace file and count the edge
+                                self.writer.transition(from_node, to_node)
+                                
+                                # Update current position
+                                self.last_file = current_file
+                                self.last_line = current_line
+                                self.trace_count += 1
+                                
+                                # Occasional progress update
+                                if self.trace_count % 100 == 0:
+                                    print(f"Traced {self.trace_count} statement transitions...")
+                        
+                except KeyboardInterrupt:
+                    print("Tracing stopped by user.")
+                except gdb.error as e:
+                    print(f"Program execution completed or error occurred: {e}")
+                
+                print(f"Traced {self.trace_count} statement transitions.")
+            finally:
+                self.writer.close()
+                stage.items = self.trace_count
             
         # Generate DOT file for visualization
-        self.generate_dot_file(dot_file)
+        with profiler.stage("dot", items=len(self.writer.edge_counts)):
+            self.generate_dot_file(dot_file)
         print(f"Control flow graph saved to {dot_file}")
         print("You can visualize this file using Graphviz:")
         print(f"  dot -Tpng {dot_file} -o control_flow.png")
+        profiler.close()
     
     def generate_dot_file(self, filename):
-        """Generate a DOT file for Graphviz visualization."""
-        with open(filename, "w") as f:
-            f.write("digraph ControlFlow {\n")
-            f.write("  node [shape=box, style=filled, fillcolor=lightblue];\n")
-            
-            # Write nodes
-            for loc, node_id in self.nodes.items():
-                f.write(f'  node{node_id} [label="{loc}"];\n')
-            
-            # Write edges
-            for from_node, to_node in self.edges:
-                f.write(f"  node{from_node} -> node{to_node};\n")
-            
-            f.write("}\n")
+        """Generate a DOT file for Graphviz visualization, one weighted edge per transition."""
+        write_dot(filename, self.writer.nodes, self.writer.edge_counts)
 
 StatementTracer()
-print("Statement tracer loaded. Run 'trace-statements [program args]' to begin tracing.")
\ No newline at end of file
+print("Statement tracer loaded. Run 'trace-statements [--compact] [--profile FILE] [program args]' to begin tracing.")
\ No newline at end of file
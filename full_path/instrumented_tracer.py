@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Statement tracer based on compiler instrumentation instead of gdb stepping.
+
+The program is compiled with -fsanitize-coverage=trace-pc (a hook at the
+start of every basic block) and -finstrument-functions (hooks on function
+entry and exit), and linked with trace_runtime.c, which writes one 64-bit
+record per hook into a ring buffer shared through a memory-mapped file.
+The program runs at native speed while this script drains the ring.
+
+Records are turned back into source lines with the binary itself: the
+disassembly gives the address range of every basic block, and the DWARF
+line table gives the statements inside it in address order. Calls split a
+block at the call site, so lines after a call are only reported once the
+callee returns. The result is the same "file:line -> file:line"
+transitions that the gdb tracers write to statement_trace.txt, for the
+program's own source: library code is not instrumented and does not appear.
+
+    python instrumented_tracer.py ../test_files/tcas2.c 627 0 0 621 216 382 1 400 641 1 1 0
+    python instrumented_tracer.py -o trace.txt quicksort.c   # options go before the source
+
+On tcas2 with the arguments above (test 2 of tests.csv) this yields exactly
+the tcas2.c lines of statement_trace.txt.
+"""
+
+import argparse
+import bisect
+import mmap
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_files"))
+from profiling import Profiler, add_arguments
+
+RUNTIME_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trace_runtime.c")
+INSTRUMENT_FLAGS = ["-O0", "-g", "-fsanitize-coverage=trace-pc", "-finstrument-functions"]
+
+# Layout of struct ring in trace_runtime.c, in 64-bit words
+RING_CAPACITY, RING_DONE, RING_HEAD, RING_TAIL = 0, 1, 8, 16
+RING_HEADER = 24 * 8
+DEFAULT_CAPACITY = 1 << 20
+
+KIND_SHIFT = 62
+ADDRESS_MASK = (1 << KIND_SHIFT) - 1
+BLOCK, ENTER, EXIT = 0, 1, 2
+
+POLL_INTERVAL = 0.0005
+
+FUNCTION_PATTERN = re.compile(r"^([0-9a-f]+) <(.+)>:$")
+INSTRUCTION_PATTERN = re.compile(r"^\s*([0-9a-f]+):\s*(.*)$")
+LINE_ROW_PATTERN = re.compile(r"^(\S+)\s+(\d+)\s+(0x[0-9a-f]+)(?:\s+\d+)?\s*(x?)\s*$")
+
+
+def build(source, output=None, compiler="gcc"):
+    """Compile source with the tracing hooks and the runtime; returns the binary path."""
+    source = os.path.abspath(source)
+    output = output or os.path.splitext(source)[0] + "_traced"
+    with tempfile.TemporaryDirectory(prefix="tracer_") as work_dir:
+        runtime = os.path.join(work_dir, "trace_runtime.o")
+        subprocess.run([compiler, "-O2", "-c", RUNTIME_SOURCE, "-o", runtime], check=True)
+        # Compile in the source directory so file names match what gdb reports
+        subprocess.run(
+            [compiler, "-w", *INSTRUMENT_FLAGS, os.path.basename(source), runtime, "-o", os.path.abspath(output)],
+            cwd=os.path.dirname(source),
+            check=True
+        )
+    return output
+
+
+def _run(*command):
+    return subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+
+
+class BinaryMap:
+    """Basic blocks of an instrumented binary and the source lines inside each."""
+
+    def __init__(self, binary):
+        self.base = self._load_base(binary)
+        rows = [(address - self.base, location) for address, location in self._line_rows(binary)]
+        functions, sites, exits = self._disassemble(binary)
+
+        self.function_starts = [start for start, _, _ in functions]
+        self.function_ends = [end for _, end, _ in functions]
+        self.function_names = [name for _, _, name in functions]
+        row_addresses = [address for address, _ in rows]
+
+        # sites maps the recorded (return) address of every block hook to
+        # (statement rows, function index, is entry block, is after the exit hook)
+        self.sites = {}
+        for f, (start, end, _) in enumerate(functions):
+            calls = [site for site in sites if start <= site[0] < end]
+            exit_call = next((a for a in exits if start <= a < end), end)
+            # The entry block starts where gdb skips the prologue to: the second line row
+            lo = bisect.bisect_left(row_addresses, start)
+            prologue_end = row_addresses[lo + 1] if lo + 1 < len(rows) and row_addresses[lo + 1] < end else start
+            for i, (call, returned) in enumerate(calls):
+                block_start = prologue_end if i == 0 else call
+                block_end = calls[i + 1][0] if i + 1 < len(calls) else end
+                self.sites[returned] = (
+                    self._block_rows(rows, row_addresses, block_start, block_end), f, i == 0, call > exit_call
+                )
+
+    @staticmethod
+    def _load_base(binary):
+        """Lowest PT_LOAD address, which is where __executable_start points."""
+        loads = [int(line.split()[2], 16) for line in _run("readelf", "-lW", binary).splitlines()
+                 if line.strip().startswith("LOAD")]
+        return min(loads) if loads else 0
+
+    @staticmethod
+    def _line_rows(binary):
+        """Sorted (address, "file:line") statement rows of the DWARF line table."""
+        rows = []
+        for line in _run("objdump", "--dwarf=decodedline", "--wide", binary).splitlines():
+            match = LINE_ROW_PATTERN.match(line)
+            if match and match.group(4):
+                rows.append((int(match.group(3), 16), f"{match.group(1)}:{match.group(2)}"))
+        rows.sort()
+        return rows
+
+    def _disassemble(self, binary):
+        """
+        Return the instrumented functions as (start, end, name), the block hooks
+        as (call address, return address) and the function exit hook addresses,
+        all relative to the load base.
+        """
+        functions, sites, exits = [], [], []
+        pending_call = None
+        current = None
+        for line in _run("objdump", "-d", "--no-show-raw-insn", binary).splitlines():
+            header = FUNCTION_PATTERN.match(line)
+            if header:
+                if current:
+                    functions.append(current)
+                current = [int(header.group(1), 16) - self.base, None, header.group(2), 0]
+                continue
+            instruction = INSTRUCTION_PATTERN.match(line)
+            if not instruction or current is None:
+                continue
+            address = int(instruction.group(1), 16) - self.base
+            current[1] = address + 1
+            if pending_call is not None:
+                sites.append((pending_call, address))
+                pending_call = None
+            text = instruction.group(2)
+            if text.startswith("call") and text.endswith("<__sanitizer_cov_trace_pc>"):
+                pending_call = address
+                current[3] += 1
+            elif text.startswith("call") and text.endswith("<__cyg_profile_func_exit>"):
+                exits.append(address)
+        if current:
+            functions.append(current)
+        # Keep only functions that contain block hooks
+        return [(start, end, name) for start, end, name, hooks in functions if hooks], sites, exits
+
+    @staticmethod
+    def _block_rows(rows, row_addresses, start, end):
+        """Statement rows in [start, end), starting with the row in effect at start."""
+        first = bisect.bisect_right(row_addresses, start) - 1
+        block = [(start, rows[first][1])] if first >= 0 else []
+        for address, location in rows[first + 1:bisect.bisect_left(row_addresses, end)]:
+            block.append((address, location))
+        return block
+
+    def function_of(self, address):
+        """Index of the instrumented function containing address, or -1."""
+        f = bisect.bisect_right(self.function_starts, address) - 1
+        return f if f >= 0 and address < self.function_ends[f] else -1
+
+
+class TraceDecoder:
+    """Turns ring records into the sequence of executed source lines."""
+
+    def __init__(self, binary_map):
+        self.map = binary_map
+        self.frames = []      # [rows, next row, function] per active call, innermost last
+        self.pending = None   # entry block whose function entry record is still to come
+        self.locations = []   # executed lines, consecutive repeats removed
+
+    def _emit(self, frame, stop=None):
+        """Report the rows of a frame's block up to (not including) address stop."""
+        rows, position = frame[0], frame[1]
+        locations = self.locations
+        while position < len(rows) and (stop is None or rows[position][0] < stop):
+            location = rows[position][1]
+            if not locations or locations[-1] != location:
+                locations.append(location)
+            position += 1
+        frame[1] = position
+
+    def feed(self, records):
+        sites = self.map.sites
+        for record in records.tolist():
+            kind, address = record >> KIND_SHIFT, record & ADDRESS_MASK
+            if kind == BLOCK:
+                site = sites.get(address)
+                if site is None or site[3]:
+                    continue
+                rows, function, is_entry, _ = site
+                if is_entry:
+                    self.pending = (rows, function)
+                elif self.frames:
+                    self._emit(self.frames[-1])
+                    self.frames[-1] = [rows, 0, function]
+                else:
+                    self.frames.append([rows, 0, function])
+            elif kind == ENTER:
+                # Lines of the caller up to the call site ran before the callee
+                if self.frames and self.map.function_of(address) == self.frames[-1][2]:
+                    self._emit(self.frames[-1], address)
+                rows, function = self.pending or ([], -1)
+                self.frames.append([rows, 0, function])
+                self.pending = None
+            elif kind == EXIT and self.frames:
+                self._emit(self.frames.pop())
+
+    def finish(self):
+        """Flush the innermost block, e.g. when the program called exit()."""
+        if self.frames:
+            self._emit(self.frames[-1])
+        self.frames = []
+        return self.locations
+
+
+def _drain(ring, capacity, process, decoder):
+    """
+    Feed ring records to the decoder until the program is done (or, if it
+    crashed before setting done, has exited) and the ring is empty.
+    """
+    header = np.frombuffer(ring, dtype=np.uint64, count=RING_HEADER // 8)
+    slots = np.frombuffer(ring, dtype=np.uint64, offset=RING_HEADER, count=capacity)
+    tail = 0
+    while True:
+        head = int(header[RING_HEAD])
+        if head == tail:
+            # done is written after the last record, so head is re-read after it
+            finished = int(header[RING_DONE]) or process.poll() is not None
+            if finished and int(header[RING_HEAD]) == tail:
+                return
+            time.sleep(POLL_INTERVAL)
+            continue
+        start, end = tail % capacity, head % capacity
+        if start < end:
+            records = slots[start:end].copy()
+        else:
+            records = np.concatenate([slots[start:], slots[:end]])
+        header[RING_TAIL] = head
+        tail = head
+        decoder.feed(records)
+
+
+def trace(binary, args=(), binary_map=None, capacity=DEFAULT_CAPACITY, stdout=subprocess.DEVNULL):
+    """
+    Run an instrumented binary and return (executed source lines, exit code).
+
+    capacity (a power of two) is the number of records the ring holds; the
+    program waits whenever the tracer falls that far behind.
+    """
+    binary = os.path.abspath(binary)
+    binary_map = binary_map or BinaryMap(binary)
+    decoder = TraceDecoder(binary_map)
+    shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    size = RING_HEADER + 8 * capacity
+
+    with tempfile.NamedTemporaryFile(prefix="trace_ring_", dir=shm_dir) as ring_file:
+        ring_file.truncate(size)
+        ring = mmap.mmap(ring_file.fileno(), size)
+        try:
+            header = np.frombuffer(ring, dtype=np.uint64, count=RING_HEADER // 8)
+            header[RING_CAPACITY] = capacity
+            del header
+            env = dict(os.environ, TRACE_RING=ring_file.name)
+            process = subprocess.Popen([binary, *args], env=env, stdout=stdout, stderr=subprocess.DEVNULL)
+            try:
+                _drain(ring, capacity, process, decoder)
+            except BaseException:
+                process.kill()
+                raise
+            finally:
+                process.wait()
+        finally:
+            # The ring can only be unmapped once no array views into it remain
+            ring.close()
+
+    return decoder.finish(), process.returncode
+
+
+def write_trace(locations, trace_file):
+    """Write locations in the statement_trace.txt format of the gdb tracers."""
+    with open(trace_file, "w") as f:
+        if not locations:
+            f.write("START -> Unknown\n")
+            return
+        f.write(f"START -> {locations[0]}\n")
+        for previous, current in zip(locations, locations[1:]):
+            f.write(f"{previous} -> {current}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace the source lines a C program executes, without gdb.")
+    parser.add_argument("source", help="program source, e.g. tcas0.c")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="program arguments")
+    parser.add_argument("-o", "--output", default="statement_trace.txt")
+    parser.add_argument("--binary", help="where to put the instrumented binary (default: next to the source)")
+    add_arguments(parser)
+    options = parser.parse_args()
+
+    with Profiler("instrumented_tracer.py", options.profile, options.cprofile) as profiler:
+        with profiler.stage("build"):
+            binary = build(options.source, options.binary)
+        with profiler.stage("trace") as stage:
+            start = time.perf_counter()
+            locations, returncode = trace(binary, options.args)
+            elapsed = time.perf_counter() - start
+            stage.items = len(locations)
+        with profiler.stage("write", items=len(locations)):
+            write_trace(locations, options.output)
+    print(f"Traced {len(locations)} statements in {elapsed:.3f}s (exit code {returncode})")
+    print(f"Trace written to {options.output}")
+
+
+if __name__ == "__main__":
+    main()
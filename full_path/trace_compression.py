@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""
+Loop-aware compression of statement traces.
+
+A trace is read as the sequence of executed locations (START, then the
+target of every transition). Loops show up as the same run of locations
+repeated back to back, so the sequence is folded by run-length encoding
+over cycles: wherever a block of up to max_period symbols repeats
+immediately, the repetitions are replaced by one rule symbol that stands
+for "body x count". Folding is repeated on the result, so an outer loop
+whose iterations are identical (inner loops included) folds again, up to
+max_levels times. Equal (body, count) pairs share one rule.
+
+The result is a small grammar:
+
+    locations   symbol i < len(locations) is a "file:line" string
+    rules       symbol len(locations) + k expands to body_k repeated count_k times
+    sequence    the top-level symbols
+
+Hit counts, edge counts and first occurrences are computed on the grammar
+directly, in time linear in its size rather than in the trace length. A
+transition into START (a tracer restarting) is not counted as an edge.
+
+    python trace_compression.py statement_trace.txt            # writes statement_trace.txt.loops.json
+    python trace_compression.py --expand statement_trace.txt.loops.json -o trace.txt
+"""
+
+import argparse
+import json
+from array import array
+
+from trace_visualizer import parse_trace_file
+
+FORMAT_VERSION = 1
+MAX_PERIOD = 256
+MAX_LEVELS = 8
+# Periods tried at each position, following later occurrences of its symbol
+CANDIDATES = 4
+
+
+class CompressedTrace:
+    """A trace folded into repeated cycles, queryable without expanding it."""
+
+    def __init__(self, locations, rules, sequence):
+        self.locations = locations
+        self.rules = rules
+        self.sequence = sequence
+        n_locations = len(locations)
+        # Expanded length, first and last location of every symbol, bottom-up
+        self.lengths = [1] * n_locations
+        self.firsts = list(range(n_locations))
+        self.lasts = list(range(n_locations))
+        for body, count in rules:
+            self.lengths.append(count * sum(self.lengths[s] for s in body))
+            self.firsts.append(self.firsts[body[0]])
+            self.lasts.append(self.lasts[body[-1]])
+
+    def __len__(self):
+        return sum(self.lengths[s] for s in self.sequence)
+
+    @property
+    def size(self):
+        """Number of symbols stored: the sequence plus every rule body and count."""
+        return len(self.sequence) + sum(len(body) + 1 for body, _ in self.rules)
+
+    def expand(self, symbols=None):
+        """Yield the executed locations in order."""
+        n_locations = len(self.locations)
+        for s in self.sequence if symbols is None else symbols:
+            if s < n_locations:
+                yield self.locations[s]
+            else:
+                body, count = self.rules[s - n_locations]
+                for _ in range(count):
+                    yield from self.expand(body)
+
+    def transitions(self):
+        """Yield (source, target) pairs as in statement_trace.txt."""
+        previous = None
+        for location in self.expand():
+            if previous is not None and location != "START":
+                yield previous, location
+            previous = location
+
+    def _multiplicities(self):
+        """How many times every symbol occurs in the expansion, top-down."""
+        n_locations = len(self.locations)
+        multiplicity = [0] * (n_locations + len(self.rules))
+        for s in self.sequence:
+            multiplicity[s] += 1
+        # Rules only refer to earlier symbols, so walk them newest first
+        for k in range(len(self.rules) - 1, -1, -1):
+            m = multiplicity[n_locations + k]
+            if m:
+                body, count = self.rules[k]
+                for s in body:
+                    multiplicity[s] += m * count
+        return multiplicity
+
+    def hit_counts(self):
+        """Number of times each location was executed."""
+        multiplicity = self._multiplicities()
+        return {location: multiplicity[i] for i, location in enumerate(self.locations) if multiplicity[i]}
+
+    def edge_counts(self):
+        """Number of times each (source, target) transition was taken."""
+        multiplicity = self._multiplicities()
+        n_locations = len(self.locations)
+        counts = {}
+
+        def add(a, b, times):
+            if times:
+                key = (self.lasts[a], self.firsts[b])
+                counts[key] = counts.get(key, 0) + times
+
+        for a, b in zip(self.sequence, self.sequence[1:]):
+            add(a, b, 1)
+        for k, (body, count) in enumerate(self.rules):
+            m = multiplicity[n_locations + k]
+            if m:
+                for a, b in zip(body, body[1:]):
+                    add(a, b, m * count)
+                # From the end of one repetition back to the start of the next
+                add(body[-1], body[0], m * (count - 1))
+
+        start = self.locations.index("START") if "START" in self.locations else -1
+        return {
+            (self.locations[a], self.locations[b]): c for (a, b), c in counts.items() if b != start
+        }
+
+    def first_occurrences(self):
+        """
+        Position of the first execution of each location (START is 0).
+
+        The first time a rule is reached its first repetition is walked; any
+        later use of it cannot contain a location that is new.
+        """
+        n_locations = len(self.locations)
+        first = {}
+        walked = set()
+        position = 0
+
+        def walk(symbols):
+            nonlocal position
+            for s in symbols:
+                if s < n_locations:
+                    first.setdefault(s, position)
+                    position += 1
+                elif s in walked:
+                    position += self.lengths[s]
+                else:
+                    walked.add(s)
+                    end = position + self.lengths[s]
+                    walk(self.rules[s - n_locations][0])
+                    position = end
+
+        walk(self.sequence)
+        return {self.locations[s]: p for s, p in first.items()}
+
+    def first_occurrence(self, location):
+        """Position of the first execution of location, or None."""
+        return self.first_occurrences().get(location)
+
+    def to_json(self):
+        return {
+            "version": FORMAT_VERSION,
+            "locations": self.locations,
+            "rules": [[list(body), count] for body, count in self.rules],
+            "sequence": self.sequence,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported compressed trace version {data.get('version')}")
+        return cls(data["locations"], [(tuple(body), count) for body, count in data["rules"]], data["sequence"])
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_json(), f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_json(json.load(f))
+
+
+def _fold_cycles(seq, intern, max_period, candidates):
+    """One folding pass: replace every immediately repeated block with a rule symbol."""
+    n = len(seq)
+    # following[i]: next position holding the same symbol as i (n if none)
+    following = [n] * n
+    last = {}
+    for i in range(n - 1, -1, -1):
+        following[i] = last.get(seq[i], n)
+        last[seq[i]] = i
+
+    folded = []
+    i = 0
+    while i < n:
+        best_period = best_repeats = 0
+        j = following[i]
+        tries = 0
+        while j < n and tries < candidates:
+            period = j - i
+            if period > max_period or i + 2 * period > n:
+                break
+            body = seq[i:j]
+            if seq[j:j + period] == body:
+                repeats = 2
+                while seq[i + repeats * period:i + (repeats + 1) * period] == body:
+                    repeats += 1
+                if period * repeats > best_period * best_repeats:
+                    best_period, best_repeats = period, repeats
+            j = following[j]
+            tries += 1
+
+        if best_repeats:
+            folded.append(intern(tuple(seq[i:i + best_period]), best_repeats))
+            i += best_period * best_repeats
+        else:
+            folded.append(seq[i])
+            i += 1
+    return folded
+
+
+def compress(locations, max_period=MAX_PERIOD, max_levels=MAX_LEVELS, candidates=CANDIDATES):
+    """Compress a sequence of executed location strings into a CompressedTrace."""
+    table = {}
+    names = []
+    seq = array("I")
+    for location in locations:
+        s = table.get(location)
+        if s is None:
+            s = table[location] = len(names)
+            names.append(location)
+        seq.append(s)
+
+    rules = []
+    rule_index = {}
+
+    def intern(body, count):
+        key = (body, count)
+        s = rule_index.get(key)
+        if s is None:
+            s = rule_index[key] = len(names) + len(rules)
+            rules.append(key)
+        return s
+
+    seq = list(seq)
+    for _ in range(max_levels):
+        n_rules = len(rules)
+        seq = _fold_cycles(seq, intern, max_period, candidates)
+        if len(rules) == n_rules:
+            break
+    return CompressedTrace(names, rules, seq)
+
+
+def executed_locations(transitions):
+    """Turn (source, target) transitions back into the sequence of executed locations."""
+    previous = None
+    for source, target in transitions:
+        if source != previous:
+            yield source
+        yield target
+        previous = target
+
+
+def compress_trace(trace_file, **kwargs):
+    """Compress a statement trace file (text or compact) into a CompressedTrace."""
+    return compress(executed_locations(parse_trace_file(trace_file)), **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compress a statement trace by folding repeated loop iterations.")
+    parser.add_argument("trace", help="statement_trace.txt / .bin, or a .loops.json file with --expand")
+    parser.add_argument("-o", "--output", help="output file (default: <trace>.loops.json)")
+    parser.add_argument("--expand", action="store_true", help="write a compressed trace back as text")
+    parser.add_argument("--max-period", type=int, default=MAX_PERIOD, help="longest loop body to fold")
+    options = parser.parse_args()
+
+    if options.expand:
+        compressed = CompressedTrace.load(options.trace)
+        output = options.output or "statement_trace.txt"
+        with open(output, "w") as f:
+            for source, target in compressed.transitions():
+                f.write(f"{source} -> {target}\n")
+        print(f"Expanded {len(compressed)} locations to {output}")
+        return
+
+    compressed = compress_trace(options.trace, max_period=options.max_period)
+    output = options.output or options.trace + ".loops.json"
+    compressed.save(output)
+    length = len(compressed)
+    print(f"{length} executed locations, {len(compressed.locations)} distinct")
+    print(f"Folded into {len(compressed.rules)} cycles, {compressed.size} symbols "
+          f"({length / max(compressed.size, 1):.1f}x smaller): {output}")
+    hits = compressed.hit_counts()
+    for location in sorted(hits, key=hits.get, reverse=True)[:5]:
+        print(f"  {hits[location]:8d}  {location}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Trace output shared by the gdb statement tracers.
+
+In the default text mode every transition is written as
+"file:line -> file:line", as before. In compact mode locations are interned
+to integer IDs and every transition is a fixed-width binary record,
+buffered in memory and written in blocks:
+
+    magic "STRACE01"
+    uint64 record count, uint64 byte offset of the location table
+    record count x (uint32 from ID, uint32 to ID)     ID 0 is START
+    location table: JSON list, entry i is the "file:line" of ID i
+
+Either way the tracer only keeps a (from, to) -> count dictionary instead
+of every dynamic transition, and write_dot() emits one edge per distinct
+transition, weighted by how often it was taken.
+
+    python trace_format.py statement_trace.bin     # print it in the text format
+"""
+
+import json
+import struct
+import sys
+from array import array
+
+MAGIC = b"STRACE01"
+HEADER = struct.Struct("<8sQQ")
+START_ID = 0
+# Records buffered before each write
+BUFFER_RECORDS = 1 << 16
+
+
+def parse_mode(arg):
+    """Split a leading "--compact" off a tracer command's arguments: (compact, rest)."""
+    words = arg.split(None, 1)
+    if words and words[0] == "--compact":
+        return True, words[1] if len(words) > 1 else ""
+    return False, arg
+
+
+class TraceWriter:
+    """Interns locations and writes the transitions of one trace in text or compact form."""
+
+    def __init__(self, path, compact=False):
+        self.path = path
+        self.compact = compact
+        self.nodes = {}              # "file:line" -> node ID, from 1
+        self.locations = ["START"]   # node ID -> "file:line"
+        self.edge_counts = {}        # (from_node, to_node) -> number of times taken
+        self.count = 0
+        self.buffer = array("I")
+        if compact:
+            self.file = open(path, "wb")
+            self.file.write(HEADER.pack(MAGIC, 0, 0))
+        else:
+            self.file = open(path, "w")
+
+    def node_id(self, file, line):
+        """Get or create the node ID of a file:line location."""
+        key = f"{file}:{line}"
+        node = self.nodes.get(key)
+        if node is None:
+            node = self.nodes[key] = len(self.locations)
+            self.locations.append(key)
+        return node
+
+    def start(self, node=None):
+        """Record the first location (None if it is unknown)."""
+        if self.compact:
+            if node is not None:
+                self._record(START_ID, node)
+        else:
+            self.file.write(f"START -> {self.locations[node] if node is not None else 'Unknown'}\n")
+
+    def transition(self, from_node, to_node):
+        """Record one step between two locations."""
+        key = (from_node, to_node)
+        self.edge_counts[key] = self.edge_counts.get(key, 0) + 1
+        if self.compact:
+            self._record(from_node, to_node)
+        else:
+            self.file.write(f"{self.locations[from_node]} -> {self.locations[to_node]}\n")
+
+    def _record(self, from_node, to_node):
+        self.buffer.append(from_node)
+        self.buffer.append(to_node)
+        self.count += 1
+        if len(self.buffer) >= 2 * BUFFER_RECORDS:
+            self._flush()
+
+    def _flush(self):
+        if sys.byteorder != "little":
+            self.buffer.byteswap()
+        self.file.write(self.buffer.tobytes())
+        self.buffer = array("I")
+
+    def close(self):
+        """Finish the file, writing the location table in compact mode."""
+        if self.compact:
+            self._flush()
+            offset = self.file.tell()
+            self.file.write(json.dumps(self.locations).encode())
+            self.file.seek(0)
+            self.file.write(HEADER.pack(MAGIC, self.count, offset))
+        self.file.close()
+
+
+def write_dot(filename, nodes, edge_counts):
+    """Write a DOT graph with one edge per distinct transition, labelled with its count."""
+    heaviest = max(edge_counts.values(), default=1)
+    with open(filename, "w") as f:
+        f.write("digraph ControlFlow {\n")
+        f.write("  node [shape=box, style=filled, fillcolor=lightblue];\n")
+
+        # Write nodes
+        for loc, node_id in nodes.items():
+            clean_loc = loc.replace('"', '\\"')
+            f.write(f'  node{node_id} [label="{clean_loc}"];\n')
+
+        # Write edges, thicker the more often they were taken
+        for (from_node, to_node), count in edge_counts.items():
+            width = 1 + 4 * count / heaviest
+            f.write(f'  node{from_node} -> node{to_node} [label="{count}", weight={count}, penwidth={width:.2f}];\n')
+
+        f.write("}\n")
+
+
+def is_compact(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _read_table(f, path):
+    """Check the header of an open compact trace; returns (record count, location table)."""
+    magic, count, offset = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a compact trace")
+    f.seek(offset)
+    table = json.loads(f.read())
+    f.seek(HEADER.size)
+    return count, table
+
+
+def _read_records(f, count):
+    records = array("I")
+    records.frombytes(f.read(8 * count))
+    if sys.byteorder != "little":
+        records.byteswap()
+    return records
+
+
+def read_compact(path):
+    """Return (location table, flat uint32 array of from/to ID pairs) of a compact trace."""
+    with open(path, "rb") as f:
+        count, table = _read_table(f, path)
+        records = _read_records(f, count)
+    return table, records
+
+
+def iter_transitions(path):
+    """
+    Yield (source, target) location strings of a compact trace, like the text
+    format. Records are read BUFFER_RECORDS at a time, so memory stays bounded
+    by the location table.
+    """
+    with open(path, "rb") as f:
+        remaining, table = _read_table(f, path)
+        while remaining:
+            block = min(remaining, BUFFER_RECORDS)
+            records = _read_records(f, block)
+            remaining -= block
+            for i in range(0, len(records), 2):
+                yield table[records[i]], table[records[i + 1]]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python trace_format.py <statement_trace.bin>")
+        sys.exit(1)
+
+    for source, target in iter_transitions(sys.argv[1]):
+        print(f"{source} -> {target}")
+
+
+if __name__ == "__main__":
+    main()
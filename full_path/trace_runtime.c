@@ -0,0 +1,111 @@
+/*
+ * Tracing runtime for instrumented_tracer.py.
+ *
+ * Link this (compiled without instrumentation) into a program built with
+ *   -fsanitize-coverage=trace-pc -finstrument-functions
+ * Every basic block entry, function entry and function exit is written as
+ * one 64-bit record into a ring buffer in the file named by $TRACE_RING,
+ * which the tracer maps too and drains while the program runs:
+ *
+ *   bits 63..62  kind: 0 block, 1 function entry, 2 function exit
+ *   bits 61..0   address relative to __executable_start (the return
+ *                address of the hook, i.e. the call site for entries)
+ *
+ * The writer blocks while the ring is full, so no record is ever lost.
+ * Without $TRACE_RING the hooks do nothing.
+ */
+
+#include <fcntl.h>
+#include <sched.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#define NO_TRACE __attribute__((no_instrument_function))
+
+#define KIND_BLOCK 0ULL
+#define KIND_ENTER 1ULL
+#define KIND_EXIT 2ULL
+#define KIND_SHIFT 62
+#define ADDRESS_MASK ((1ULL << KIND_SHIFT) - 1)
+
+/* Must match RING_HEADER in instrumented_tracer.py; head and tail sit on
+ * their own cache lines so the writer and the reader do not contend. */
+struct ring {
+    uint64_t capacity;      /* number of slots, a power of two */
+    uint64_t done;          /* set when the program exits normally */
+    uint64_t pad0[6];
+    uint64_t head;          /* next slot the program writes */
+    uint64_t pad1[7];
+    uint64_t tail;          /* next slot the tracer reads */
+    uint64_t pad2[7];
+    uint64_t slots[];
+};
+
+extern char __executable_start;
+
+static struct ring *ring;
+static uint64_t head;
+static uint64_t limit;
+
+static NO_TRACE void put(uint64_t kind, void *address)
+{
+    if (!ring)
+        return;
+    if (head == limit) {
+        /* Wait for the tracer to make room */
+        while (head - __atomic_load_n(&ring->tail, __ATOMIC_ACQUIRE) >= ring->capacity)
+            sched_yield();
+        limit = __atomic_load_n(&ring->tail, __ATOMIC_ACQUIRE) + ring->capacity;
+    }
+    uint64_t offset = (uint64_t)((uintptr_t)address - (uintptr_t)&__executable_start) & ADDRESS_MASK;
+    ring->slots[head & (ring->capacity - 1)] = (kind << KIND_SHIFT) | offset;
+    __atomic_store_n(&ring->head, ++head, __ATOMIC_RELEASE);
+}
+
+NO_TRACE void __sanitizer_cov_trace_pc(void)
+{
+    put(KIND_BLOCK, __builtin_return_address(0));
+}
+
+NO_TRACE void __cyg_profile_func_enter(void *function, void *call_site)
+{
+    (void)function;
+    put(KIND_ENTER, call_site);
+}
+
+NO_TRACE void __cyg_profile_func_exit(void *function, void *call_site)
+{
+    (void)function;
+    put(KIND_EXIT, call_site);
+}
+
+static NO_TRACE __attribute__((constructor)) void open_ring(void)
+{
+    const char *path = getenv("TRACE_RING");
+    struct stat st;
+    int fd;
+
+    if (!path || (fd = open(path, O_RDWR)) < 0)
+        return;
+    if (fstat(fd, &st) == 0) {
+        void *map = mmap(NULL, st.st_size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+        if (map != MAP_FAILED) {
+            ring = map;
+            head = ring->head;
+            limit = ring->tail + ring->capacity;
+        }
+    }
+    close(fd);
+}
+
+/* Lowest priority, so this runs after the program's own destructors and
+ * done is the last thing written: the tracer stops draining once it is set
+ * and the ring is empty. */
+static NO_TRACE __attribute__((destructor(101))) void close_ring(void)
+{
+    if (ring)
+        __atomic_store_n(&ring->done, 1, __ATOMIC_RELEASE);
+}
@@ -2,38 +2,67 @@
 """
 Script to visualize the statement trace from GDB and generate a cleaner control flow graph.
 This handles simplifying the trace by removing repetitions and creating a more readable graph.
+
+The trace is processed as a stream: transitions are parsed one at a time,
+edges are deduplicated in a dictionary (with the number of times each was
+taken), and the annotated source keeps a bounded summary per line. Memory
+therefore depends on the number of distinct lines and edges, not on the
+length of the trace. Compact traces (statement_trace.bin, see
+trace_format.py) are read the same way.
+
+    python trace_visualizer.py [--mmap] [--profile FILE] <trace_file> [source_file]
+
+--profile FILE writes the time, memory and throughput of each pass as JSON
+(see test_files/profiling.py).
 """
 
 import sys
 import re
 import os
+import mmap
+
+from trace_format import is_compact, iter_transitions
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "test_files"))
+from profiling import from_argv
+
+# Execution orders listed per line in the annotated source
+ORDERS_SHOWN = 10
+
+def _trace_lines(trace_file, use_mmap=False):
+    """Yield the lines of a text trace, read through mmap if requested."""
+    if use_mmap and os.path.getsize(trace_file) > 0:
+        with open(trace_file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            for line in iter(m.readline, b""):
+                yield line.decode()
+    else:
+        with open(trace_file, 'r') as f:
+            yield from f
 
-def parse_trace_file(trace_file):
-    """Parse the statement trace file to extract execution flow."""
-    transitions = []
-    
-    with open(trace_file, 'r') as f:
-        for line in f:
-            line = line.strip()
-            if '->' in line:
-                parts = line.split('->')
-                source = parts[0].strip()
-                target = parts[1].strip()
-                transitions.append((source, target))
-    
-    return transitions
+def parse_trace_file(trace_file, use_mmap=False):
+    """Parse the statement trace file, yielding (source, target) transitions."""
+    if is_compact(trace_file):
+        yield from iter_transitions(trace_file)
+        return
+
+    for line in _trace_lines(trace_file, use_mmap):
+        source, arrow, target = line.partition('->')
+        if arrow:
+            yield source.strip(), target.strip()
 
 def simplify_transitions(transitions):
     """Simplify transitions by removing consecutive duplicates."""
-    if not transitions:
-        return []
-        
-    simplified = [transitions[0]]
-    for i in range(1, len(transitions)):
-        if transitions[i] != transitions[i-1]:
-            simplified.append(transitions[i])
-    
-    return simplified
+    previous = None
+    for transition in transitions:
+        if transition != previous:
+            yield transition
+            previous = transition
+
+def count_transitions(transitions, counter):
+    """Pass transitions through, counting them in counter[0]."""
+    for transition in transitions:
+        counter[0] += 1
+        yield transition
 
 def extract_file_info(location):
     """Extract filename and line number from location string."""
@@ -45,128 +74,136 @@ def extract_file_info(location):
     return location, "?"
 
 def generate_dot_file(transitions, output_file):
-    """Generate a DOT file for visualization with Graphviz."""
+    """
+    Generate a DOT file for visualization with Graphviz.
+
+    Nodes are written as they are first seen; each distinct edge is written
+    once at the end, labelled with the number of times it was taken.
+    """
     nodes = {}
-    edges = []
-    node_count = 0
-    
+    edges = {}
+
+    def node_id(location, f):
+        if location == "START":
+            if "START" not in nodes:
+                nodes["START"] = "start"
+                f.write('  start [label="START", shape=oval, fillcolor=green];\n')
+            return "start"
+
+        filename, line = extract_file_info(location)
+        key = f"{filename}:{line}"
+        node = nodes.get(key)
+        if node is None:
+            node = nodes[key] = f"node{len(nodes) + 1 - ('START' in nodes)}"
+            f.write(f'  {node} [label="{filename}\\nLine {line}"];\n')
+        return node
+
     # Create DOT file
     with open(output_file, 'w') as f:
         f.write("digraph ControlFlow {\n")
         f.write("  node [shape=box, style=filled, fillcolor=lightblue];\n")
         f.write("  edge [color=darkblue];\n")
         f.write("  rankdir=LR;\n")  # Left to right layout
-        
-        # Process each transition to build nodes and edges
+
+        # Process each transition to build nodes and count edges
         for source, target in transitions:
-            # Handle source node
-            if source == "START":
-                if "START" not in nodes:
-                    nodes["START"] = "start"
-                    f.write('  start [label="START", shape=oval, fillcolor=green];\n')
-                source_id = "start"
-            else:
-                source_file, source_line = extract_file_info(source)
-                source_key = f"{source_file}:{source_line}"
-                if source_key not in nodes:
-                    node_count += 1
-                    node_id = f"node{node_count}"
-                    nodes[source_key] = node_id
-                    f.write(f'  {node_id} [label="{source_file}\\nLine {source_line}"];\n')
-                source_id = nodes[source_key]
-            
-            # Handle target node
-            target_file, target_line = extract_file_info(target)
-            target_key = f"{target_file}:{target_line}"
-            if target_key not in nodes:
-                node_count += 1
-                node_id = f"node{node_count}"
-                nodes[target_key] = node_id
-                f.write(f'  {node_id} [label="{target_file}\\nLine {target_line}"];\n')
-            target_id = nodes[target_key]
-            
-            # Add edge if it's not already there
-            edge = (source_id, target_id)
-            if edge not in edges:
-                edges.append(edge)
-                f.write(f"  {source_id} -> {target_id};\n")
-        
+            edge = (node_id(source, f), node_id(target, f))
+            edges[edge] = edges.get(edge, 0) + 1
+
+        for (source_id, target_id), count in edges.items():
+            f.write(f'  {source_id} -> {target_id} [label="{count}"];\n')
+
         f.write("}\n")
-    
+
     return len(nodes), len(edges)
 
-def create_annotated_source(trace_file, source_file):
-    """Create an annotated version of the source file showing execution order."""
+def create_annotated_source(trace_file, source_file, use_mmap=False, orders_shown=ORDERS_SHOWN):
+    """
+    Create an annotated version of the source file showing execution order.
+
+    Each executed line lists its first orders_shown execution orders; lines
+    executed more often also show the total count and the last order.
+    """
     if not os.path.exists(source_file):
         print(f"Warning: Source file {source_file} not found.")
         return
-    
-    # Extract execution order by line
+
+    # Per line: [first orders, execution count, last order]
     executions = {}
-    with open(trace_file, 'r') as f:
-        order = 1
-        for line in f:
-            line = line.strip()
-            if '->' in line:
-                target = line.split('->')[1].strip()
-                if ':' in target:
-                    file_path, line_num = target.split(':')
-                    filename = file_path.split('/')[-1]
-                    if filename == os.path.basename(source_file):
-                        try:
-                            line_num = int(line_num)
-                            if line_num not in executions:
-                                executions[line_num] = []
-                            executions[line_num].append(order)
-                            order += 1
-                        except ValueError:
-                            continue
-    
+    basename = os.path.basename(source_file)
+    order = 1
+    for _, target in parse_trace_file(trace_file, use_mmap):
+        file_path, _, line_num = target.rpartition(':')
+        if file_path.split('/')[-1] != basename:
+            continue
+        try:
+            line_num = int(line_num)
+        except ValueError:
+            continue
+        summary = executions.get(line_num)
+        if summary is None:
+            summary = executions[line_num] = [[], 0, 0]
+        if len(summary[0]) < orders_shown:
+            summary[0].append(order)
+        summary[1] += 1
+        summary[2] = order
+        order += 1
+
     # Read source file
     with open(source_file, 'r') as f:
         source_lines = f.readlines()
-    
+
     # Create annotated file
     annotated_file = f"{source_file}.annotated.txt"
     with open(annotated_file, 'w') as f:
         f.write(f"ANNOTATED SOURCE: {source_file}\n")
         f.write("Line numbers show execution order\n")
         f.write("-" * 60 + "\n\n")
-        
+
         for i, line in enumerate(source_lines, 1):
             if i in executions:
-                exec_order = ", ".join(map(str, executions[i]))
+                orders, count, last = executions[i]
+                exec_order = ", ".join(map(str, orders))
+                if count > len(orders):
+                    exec_order += f", ... ({count} times, last {last})"
                 f.write(f"{i:4d} [{exec_order:10s}] {line}")
             else:
                 f.write(f"{i:4d} [          ] {line}")
-    
+
     print(f"Annotated source created: {annotated_file}")
     return annotated_file
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python trace_visualizer.py <trace_file> [source_file]")
+    profiler, args = from_argv("trace_visualizer.py", sys.argv[1:])
+    use_mmap = "--mmap" in args
+    args = [arg for arg in args if arg != "--mmap"]
+    if not args:
+        print("Usage: python trace_visualizer.py [--mmap] [--profile FILE] [--cprofile DIR] <trace_file> [source_file]")
         sys.exit(1)
-    
-    trace_file = sys.argv[1]
-    source_file = sys.argv[2] if len(sys.argv) > 2 else None
-    
-    print(f"Parsing trace file: {trace_file}")
-    transitions = parse_trace_file(trace_file)
-    print(f"Found {len(transitions)} transitions")
-    
-    simplified = simplify_transitions(transitions)
-    print(f"Simplified to {len(simplified)} unique transitions")
-    
-    dot_file = "simplified_control_flow.dot"
-    nodes, edges = generate_dot_file(simplified, dot_file)
-    print(f"Generated DOT file with {nodes} nodes and {edges} edges: {dot_file}")
-    print("To visualize, run:")
-    print(f"  dot -Tpng {dot_file} -o control_flow.png")
-    
-    # Create annotated source if source file is provided
-    if source_file and os.path.exists(source_file):
-        create_annotated_source(trace_file, source_file)
+
+    trace_file = args[0]
+    source_file = args[1] if len(args) > 1 else None
+
+    with profiler:
+        print(f"Parsing trace file: {trace_file}")
+        total, kept = [0], [0]
+        dot_file = "simplified_control_flow.dot"
+        # Parsing, simplifying and writing the graph are one streaming pass
+        with profiler.stage("parse_simplify_dot") as stage:
+            transitions = count_transitions(parse_trace_file(trace_file, use_mmap), total)
+            simplified = count_transitions(simplify_transitions(transitions), kept)
+            nodes, edges = generate_dot_file(simplified, dot_file)
+            stage.items = total[0]
+        print(f"Found {total[0]} transitions")
+        print(f"Simplified to {kept[0]} unique transitions")
+        print(f"Generated DOT file with {nodes} nodes and {edges} edges: {dot_file}")
+        print("To visualize, run:")
+        print(f"  dot -Tpng {dot_file} -o control_flow.png")
+
+        # Create annotated source if source file is provided
+        if source_file and os.path.exists(source_file):
+            with profiler.stage("annotate", items=total[0]):
+                create_annotated_source(trace_file, source_file, use_mmap)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
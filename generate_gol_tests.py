@@ -1,40 +1,96 @@
-import subprocess
-import random
+import argparse
 import csv
 import os
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
-# Path to compiled C program
+# Reference implementation to cross-check against with --check
 EXECUTABLE = "./gol"
 CSV_FILE = "gol_tests.csv"
 NUM_TESTS = 100
+SEED = 0
+# Cases per shard; each shard has its own random stream, so the suite does
+# not depend on how many processes generate it
+SHARD_SIZE = 10000
+
+MIN_SIZE, MAX_SIZE = 5, 20
+MIN_STEPS, MAX_STEPS = 1, 10
+
+
+def life(grids, steps):
+    """
+    Run Game of Life on a batch of equally sized boards, as gol.c does: the
+    border cells are dead after every step.
+
+    grids is a (boards x size x size) 0/1 array and steps the number of
+    steps for each board; returns the final boards.
+    """
+    grids = np.asarray(grids, dtype=np.uint8).copy()
+    steps = np.asarray(steps)
+    out = grids.copy()
+    for step in range(1, int(steps.max(initial=0)) + 1):
+        # Neighbour counts of the interior cells from the eight shifted views
+        n = (
+            grids[:, :-2, :-2] + grids[:, :-2, 1:-1] + grids[:, :-2, 2:]
+            + grids[:, 1:-1, :-2] + grids[:, 1:-1, 2:]
+            + grids[:, 2:, :-2] + grids[:, 2:, 1:-1] + grids[:, 2:, 2:]
+        )
+        alive = (n == 3) | ((n == 2) & (grids[:, 1:-1, 1:-1] == 1))
+        grids = np.zeros_like(grids)
+        grids[:, 1:-1, 1:-1] = alive
+        done = steps == step
+        out[done] = grids[done]
+    return out
+
 
-if not os.path.exists(EXECUTABLE):
-    raise FileNotFoundError(f"Executable not found: {EXECUTABLE}")
+def generate_shard(seed_sequence, count):
+    """Generate and solve count random cases; returns (size, steps, seed, output) rows."""
+    rng = np.random.default_rng(seed_sequence)
+    sizes = rng.integers(MIN_SIZE, MAX_SIZE + 1, count)
+    steps = rng.integers(MIN_STEPS, MAX_STEPS + 1, count)
+    cells = [rng.integers(0, 2, size * size, dtype=np.uint8) for size in sizes.tolist()]
 
-def generate_random_test():
-    size = random.randint(5, 20)
-    steps = random.randint(1, 10)
-    seed = ''.join(random.choices('01', k=size * size))
-    return size, steps, seed
+    rows = [None] * count
+    # One batched simulation per board size
+    for size in np.unique(sizes).tolist():
+        group = np.flatnonzero(sizes == size)
+        grids = np.stack([cells[i] for i in group.tolist()]).reshape(len(group), size, size)
+        final = life(grids, steps[group]).reshape(len(group), -1)
+        for i, seed, output in zip(group.tolist(), grids.reshape(len(group), -1), final):
+            rows[i] = (size, int(steps[i]), (seed + ord("0")).tobytes().decode(), (output + ord("0")).tobytes().decode())
+    return rows
 
-def run_test(size, steps, seed):
-    try:
+
+def generate_tests(num_tests=NUM_TESTS, seed=SEED, jobs=None):
+    """Generate num_tests solved cases, reproducibly from seed, across processes."""
+    shards = [min(SHARD_SIZE, num_tests - start) for start in range(0, num_tests, SHARD_SIZE)]
+    seeds = np.random.SeedSequence(seed).spawn(len(shards))
+    if jobs == 1 or len(shards) <= 1:
+        parts = map(generate_shard, seeds, shards)
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            parts = list(pool.map(generate_shard, seeds, shards))
+    return [row for part in parts for row in part]
+
+
+def check_tests(tests, executable=EXECUTABLE):
+    """Run cases through the C program; returns the ones where it disagrees with the oracle."""
+    if not os.path.exists(executable):
+        raise FileNotFoundError(f"Executable not found: {executable}")
+    mismatches = []
+    for size, steps, seed, output in tests:
         result = subprocess.run(
-            [EXECUTABLE, str(size), str(steps), seed],
+            [executable, str(size), str(steps), seed],
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            check=True,
             text=True
         )
-        output = result.stdout.strip()
-        if len(output) == size * size and all(c in '01' for c in output):
-            return output
-        else:
-            print(f"Unexpected output for size={size}, steps={steps}:\n{output}")
-            return None
-    except subprocess.CalledProcessError as e:
-        print(f"Error running test: {e.stderr}")
-        return None
+        if result.stdout.strip() != output:
+            mismatches.append((size, steps, seed, output))
+    return mismatches
+
 
 def append_to_csv(filename, data):
     exists = os.path.isfile(filename)
@@ -45,13 +101,24 @@ def append_to_csv(filename, data):
         writer.writerows(data)
 
 
-all_results = []
-for _ in range(NUM_TESTS):
-    size, steps, seed = generate_random_test()
-    output = run_test(size, steps, seed)
-    if output:
-        all_results.append((size, steps, seed, output))
-    else:
-        print(f"ERROR")
-append_to_csv(CSV_FILE, all_results)
+def main():
+    parser = argparse.ArgumentParser(description="Generate Game of Life tests with a NumPy reference oracle.")
+    parser.add_argument("-n", "--num-tests", type=int, default=NUM_TESTS)
+    parser.add_argument("--seed", type=int, default=SEED, help="random seed; the same seed gives the same suite")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument("-o", "--output", default=CSV_FILE, help="CSV file to append to")
+    parser.add_argument("--check", type=int, default=0, metavar="N",
+                        help=f"also run the first N cases through {EXECUTABLE} and report disagreements")
+    args = parser.parse_args()
+
+    all_results = generate_tests(args.num_tests, args.seed, args.jobs)
+    append_to_csv(args.output, all_results)
+    print(f"Appended {len(all_results)} tests to {args.output}")
+
+    if args.check:
+        mismatches = check_tests(all_results[:args.check])
+        print(f"{EXECUTABLE} disagrees with the oracle on {len(mismatches)} of {min(args.check, len(all_results))} tests")
+
 
+if __name__ == "__main__":
+    main()
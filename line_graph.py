@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Whole-program line graph over integer arrays.
+
+build_graph.ipynb builds one line graph per function. This merges the
+functions of one or more source files into a single graph: every distinct
+(file, line) gets an integer ID up front and the edges go straight into a
+CSR adjacency matrix. There are three kinds of edges:
+
+    flow    the line graph edges of each function (CompactCFG.line_edges)
+    call    call site -> first line of the callee
+    return  last line of every block that exits the callee -> call site
+
+Only calls to functions defined in the given sources are linked; library
+calls and calls through function pointers stay plain lines. If the same
+function name is defined in several files the first definition is used.
+
+    python line_graph.py test_files/quicksort.c
+
+--profile FILE records the time and memory of loading the CFGs and building
+the graph as JSON (see test_files/profiling.py).
+"""
+
+import os
+import sys
+
+import numpy as np
+
+from cfg_format import LINE_SHIFT
+from propagation import adjacency_matrix
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_files"))
+from profiling import from_argv
+
+LINE_MASK = (1 << LINE_SHIFT) - 1
+
+
+class LineGraph:
+    """One CSR line graph for a whole program, with integer node IDs."""
+
+    def __init__(self, adjacency, files, node_file, node_line, node_function, function_names, edge_counts):
+        self.adjacency = adjacency
+        self.files = files
+        self.node_file = node_file
+        self.node_line = node_line
+        self.node_function = node_function
+        self.function_names = function_names
+        self.edge_counts = edge_counts
+        self._keys = (node_file.astype(np.int64) << LINE_SHIFT) | node_line.astype(np.int64)
+
+    @property
+    def n_nodes(self):
+        return self.adjacency.shape[0]
+
+    @property
+    def n_edges(self):
+        return self.adjacency.nnz
+
+    def node_index(self, filename, line):
+        """Node ID of a source line, or -1 if the line is not in the graph."""
+        if filename not in self.files:
+            return -1
+        key = (self.files.index(filename) << LINE_SHIFT) | line
+        i = np.searchsorted(self._keys, key)
+        return int(i) if i < len(self._keys) and self._keys[i] == key else -1
+
+    def label(self, i):
+        """"file.c:line" of a node ID."""
+        return f"{self.files[self.node_file[i]]}:{self.node_line[i]}"
+
+    def function_nodes(self, f):
+        """Node IDs of the lines of function f."""
+        return np.flatnonzero(self.node_function == f)
+
+
+def _global_keys(keys, file_map):
+    """Rewrite line keys of one CompactCFG onto the global file table."""
+    return (file_map[keys >> LINE_SHIFT].astype(np.int64) << LINE_SHIFT) | (keys & LINE_MASK)
+
+
+def _function_ends(cfg):
+    """
+    Line keys of the entry line of every function (-1 if it has no lines) and
+    (function, key) arrays of the lines that return from a function.
+    """
+    sizes = np.diff(cfg.line_ptr)
+    keys = cfg.line_keys()
+    func_of_block = cfg.block_function()
+
+    # First non-empty block of each function in block order (bb1 is the entry)
+    entry = np.full(cfg.n_functions, -1, dtype=np.int64)
+    non_empty = np.flatnonzero(sizes > 0)
+    funcs, first = np.unique(func_of_block[non_empty], return_index=True)
+    entry[funcs] = keys[cfg.line_ptr[non_empty[first]]]
+
+    # Blocks with an edge into the function's exit block ("bbend", the last block)
+    src, dst = cfg.block_edges()
+    last_block = cfg.function_block_ptr[func_of_block[src] + 1] - 1
+    returns = (dst == last_block) & (sizes[src] > 0)
+    return entry, func_of_block[src[returns]], keys[cfg.line_ptr[src[returns] + 1] - 1]
+
+
+def _ragged_gather(ptr, groups):
+    """Indices ptr[g]..ptr[g+1] for every g in groups, and the position of g for each."""
+    counts = ptr[groups + 1] - ptr[groups]
+    owner = np.repeat(np.arange(len(groups)), counts)
+    within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return ptr[groups][owner] + within, owner
+
+
+def build_line_graph(cfgs):
+    """Merge the CompactCFGs of all source files of a program into one LineGraph."""
+    files, function_names = [], []
+    file_index, function_index = {}, {}
+    line_keys, line_funcs = [], []
+    flow_src, flow_dst = [], []
+    entries, exit_funcs, exit_keys = [], [], []
+    call_keys, call_names = [], []
+
+    for cfg in cfgs:
+        file_map = np.array([file_index.setdefault(f, len(file_index)) for f in cfg.files], dtype=np.int64)
+        offset = len(function_names)
+        for name in cfg.function_names:
+            function_index.setdefault(name, len(function_names))
+            function_names.append(name)
+
+        line_keys.append(_global_keys(cfg.line_keys(), file_map))
+        line_funcs.append(cfg.block_function()[np.repeat(np.arange(cfg.n_blocks), np.diff(cfg.line_ptr))] + offset)
+
+        src, dst, _ = cfg.line_edges()
+        flow_src.append(_global_keys(src, file_map))
+        flow_dst.append(_global_keys(dst, file_map))
+
+        entry, exit_func, exit_key = _function_ends(cfg)
+        entries.append(np.where(entry >= 0, _global_keys(np.maximum(entry, 0), file_map), -1))
+        exit_funcs.append(exit_func + offset)
+        exit_keys.append(_global_keys(exit_key, file_map))
+
+        call_keys.append(_global_keys(cfg.call_keys(), file_map))
+        call_names.extend(cfg.callee_names[c] for c in cfg.call_callee)
+    files.extend(file_index)
+
+    # Integer IDs for every distinct line, ordered by (file, line)
+    all_keys = np.concatenate(line_keys) if line_keys else np.zeros(0, dtype=np.int64)
+    node_keys, inverse = np.unique(all_keys, return_inverse=True)
+    n = len(node_keys)
+    # A line shared by several functions belongs to the first one
+    node_function = np.full(n, -1, dtype=np.int64)
+    funcs = np.concatenate(line_funcs) if line_funcs else np.zeros(0, dtype=np.int64)
+    node_function[inverse[::-1]] = funcs[::-1]
+
+    def ids(keys):
+        return np.searchsorted(node_keys, keys)
+
+    src = [ids(np.concatenate(flow_src))] if flow_src else []
+    dst = [ids(np.concatenate(flow_dst))] if flow_dst else []
+    counts = {"flow": sum(len(s) for s in src), "call": 0, "return": 0}
+
+    # Resolve callees to defined functions; everything else stays a plain line
+    callee = np.array([function_index.get(name, -1) for name in call_names], dtype=np.int64)
+    entry = np.concatenate(entries) if entries else np.zeros(0, dtype=np.int64)
+    linked = callee >= 0
+    linked[linked] = entry[callee[linked]] >= 0
+    if linked.any():
+        site = ids(np.concatenate(call_keys)[linked])
+        callee = callee[linked]
+        src.append(site)
+        dst.append(ids(entry[callee]))
+        counts["call"] = len(site)
+
+        # Exit lines grouped by function, then one return edge per exit per call
+        exit_func = np.concatenate(exit_funcs)
+        order = np.argsort(exit_func, kind="stable")
+        exit_ids = ids(np.concatenate(exit_keys)[order])
+        exit_ptr = np.concatenate([[0], np.cumsum(np.bincount(exit_func, minlength=len(function_names)))])
+        gathered, owner = _ragged_gather(exit_ptr, callee)
+        src.append(exit_ids[gathered])
+        dst.append(site[owner])
+        counts["return"] = len(gathered)
+
+    adjacency = adjacency_matrix(
+        n,
+        np.concatenate(src) if src else np.zeros(0, dtype=np.int64),
+        np.concatenate(dst) if dst else np.zeros(0, dtype=np.int64)
+    )
+    return LineGraph(
+        adjacency, files,
+        (node_keys >> LINE_SHIFT).astype(np.int32), (node_keys & LINE_MASK).astype(np.int32),
+        node_function, function_names, counts
+    )
+
+
+def load_cfgs(sources, processes=None):
+    """The CompactCFG of every source file, via the CFG cache."""
+    from cfg_cache import load_compact, load_many
+
+    if len(sources) == 1:
+        return [load_compact(sources[0])]
+    return [cfg for cfg, _ in load_many(sources, processes=processes)]
+
+
+def load_line_graph(sources, processes=None):
+    """Build the LineGraph of a program from its source files, via the CFG cache."""
+    return build_line_graph(load_cfgs(sources, processes))
+
+
+def main():
+    profiler, sources = from_argv("line_graph.py", sys.argv[1:])
+    if not sources:
+        print("Usage: python line_graph.py [--profile FILE] [--cprofile DIR] <file.c> [file.c ...]")
+        sys.exit(1)
+
+    with profiler:
+        with profiler.stage("load_cfg", items=len(sources)):
+            cfgs = load_cfgs(sources)
+        with profiler.stage("build") as stage:
+            graph = build_line_graph(cfgs)
+            stage.items = graph.n_nodes
+    print(f"{graph.n_nodes} lines, {graph.n_edges} edges in {len(graph.function_names)} functions")
+    for kind, count in graph.edge_counts.items():
+        print(f"  {kind}: {count}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Pipelined fault localization over many program versions.
+
+run_all.sh ran the versions one after the other in one shared directory.
+Here every version of a manifest (fault_versions.json, see
+rank_benchmark.py) gets its own working directory below --work-dir, and its
+work is split into stages that form a dependency graph:
+
+    compile     gcc with coverage instrumentation       -> binary, .gcno
+    cfg_dump    gcc -fdump-tree-cfg-lineno               -> .cfg dump
+    cfg_parse   cfg_parser.py, in the cfg_format.py form -> cfg.npz
+    tests       every test of tests.csv, native gcov     -> spectrum.bin
+    score       all SBFL formulas (compile -> tests -> score)
+    propagate   every propagation x centrality combination (needs cfg_parse and score)
+    evaluate    rank bounds and EXAM of the fault lines  -> results.csv
+
+A process pool runs every stage whose dependencies are done, across all
+versions at once, so the CFG of one version is parsed while the tests of
+another run. Each stage has a key: a hash of its own inputs (source and
+tests.csv contents, compiler version, formulas, faults) and of the keys of
+the stages it depends on. A stage is skipped when the key stored with its
+last run is the same and its outputs still exist, and a stage that is not
+skipped also runs the dependencies it needs. Changing one version's source
+re-runs only that version; changing only its faults re-runs only evaluate.
+Changes to the scripts themselves are not tracked; use --force after them.
+--profile FILE writes the time, CPU, peak memory and item count of every
+stage that ran as JSON (see test_files/profiling.py).
+
+    python pipeline.py fault_versions.json -o results.csv
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from cfg_cache import DEFAULT_FLAGS, compiler_version, write_dump
+from cfg_format import FORMAT_VERSION, encode_graphs, load_cfg, save_cfg
+from cfg_parser import parse_call_sites, parse_to_graphs
+from line_graph import build_line_graph
+from rank_benchmark import ALPHA, load_manifest, place_scores, result_rows, score_matrix, summarize
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_files"))
+from profiling import Profiler, add_arguments
+from run_coverage import build_spectrum, compile_program, read_tests, run_coverage
+from sbfl import DEFAULT_FORMULAS, score, spectrum_counters
+from spectrum import Spectrum
+
+WORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".pipeline")
+STAMP_DIR = ".stamps"
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def stage_compile(version, work_dir, inputs, options):
+    program = version["program"]
+    binary = compile_program(program, work_dir, options["forkserver"])
+    return [binary, os.path.join(work_dir, f"{program}.gcno")], {}
+
+
+def stage_cfg_dump(version, work_dir, inputs, options):
+    return [write_dump(os.path.join(work_dir, f"{version['program']}.c"), work_dir)], {}
+
+
+def stage_cfg_parse(version, work_dir, inputs, options):
+    dump = inputs["cfg_dump"][0]
+    cfg = encode_graphs(parse_to_graphs(dump), parse_call_sites(dump))
+    output = os.path.join(work_dir, "cfg.npz")
+    save_cfg(cfg, output)
+    return [output], {"items": cfg.n_functions}
+
+
+def stage_tests(version, work_dir, inputs, options):
+    program = version["program"]
+    tests = read_tests(version["tests"])
+    run = run_coverage(
+        program, tests, work_dir, jobs=options["test_jobs"], native=True,
+        forkserver=options["forkserver"], binary=inputs["compile"][0]
+    )
+    output = os.path.join(work_dir, "spectrum.bin")
+    build_spectrum(run, program).save(output)
+    return [output], {"items": len(tests), "passing": len(run["passing"]), "failing": len(run["failing"])}
+
+
+def stage_score(version, work_dir, inputs, options):
+    spectrum = Spectrum.open(inputs["tests"][0])
+    output = os.path.join(work_dir, "sbfl.npz")
+    np.savez(
+        output, lines=spectrum.lines, scores=score(spectrum_counters(spectrum), options["formulas"]),
+        failing=int(spectrum.failed.sum())
+    )
+    return [output], {"items": spectrum.n_lines}
+
+
+def stage_propagate(version, work_dir, inputs, options):
+    graph = build_line_graph([load_cfg(inputs["cfg_parse"][0])])
+    sbfl = np.load(inputs["score"][0])
+    line_scores = place_scores(graph, sbfl["lines"].tolist(), sbfl["scores"])
+    scores, combinations, _ = score_matrix(graph.adjacency, line_scores, options["formulas"])
+    output = os.path.join(work_dir, "scores.npz")
+    np.savez(output, scores=scores, combinations=np.array(combinations))
+    return [output], {"items": graph.n_nodes}
+
+
+def stage_evaluate(version, work_dir, inputs, options):
+    graph = build_line_graph([load_cfg(inputs["cfg_parse"][0])])
+    propagated = np.load(inputs["propagate"][0])
+    failing = int(np.load(inputs["score"][0])["failing"])
+    combinations = [tuple(c) for c in propagated["combinations"].tolist()]
+    rows = result_rows(version["name"], graph, propagated["scores"], combinations, version["faults"], failing)
+    output = os.path.join(work_dir, "results.csv")
+    pd.DataFrame(rows).to_csv(output, index=False)
+    return [output], {"items": len(rows)}
+
+
+# name: (function, stages it depends on), in dependency order
+STAGES = {
+    "compile": (stage_compile, ()),
+    "cfg_dump": (stage_cfg_dump, ()),
+    "cfg_parse": (stage_cfg_parse, ("cfg_dump",)),
+    "tests": (stage_tests, ("compile",)),
+    "score": (stage_score, ("tests",)),
+    "propagate": (stage_propagate, ("cfg_parse", "score")),
+    "evaluate": (stage_evaluate, ("propagate", "cfg_parse", "score")),
+}
+
+
+def stage_inputs(stage, version, options):
+    """Everything besides its dependencies that determines a stage's outputs."""
+    if stage == "compile":
+        return {"source": version["source_hash"], "gcc": compiler_version(), "forkserver": options["forkserver"]}
+    if stage == "cfg_dump":
+        return {"source": version["source_hash"], "gcc": compiler_version(), "flags": list(DEFAULT_FLAGS)}
+    if stage == "cfg_parse":
+        return {"format": FORMAT_VERSION}
+    if stage == "tests":
+        return {"tests": version["tests_hash"]}
+    if stage == "score":
+        return {"formulas": list(options["formulas"])}
+    if stage == "propagate":
+        return {"formulas": list(options["formulas"]), "alpha": ALPHA}
+    return {"name": version["name"], "faults": version["faults"]}
+
+
+def stamp_path(work_dir, stage):
+    return os.path.join(work_dir, STAMP_DIR, stage + ".json")
+
+
+def read_stamp(work_dir, stage):
+    try:
+        with open(stamp_path(work_dir, stage)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_stamp(work_dir, stage, key, outputs):
+    path = stamp_path(work_dir, stage)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"key": key, "outputs": [os.path.relpath(p, work_dir) for p in outputs]}, f)
+
+
+def prepare(version, work_root):
+    """Give a version its working directory with a copy of the source; adds program, work_dir and hashes."""
+    version = dict(version)
+    version["program"] = os.path.splitext(os.path.basename(version["source"]))[0]
+    version["work_dir"] = os.path.join(os.path.abspath(work_root), version["name"])
+    version["source_hash"] = file_hash(version["source"])
+    version["tests_hash"] = file_hash(version["tests"])
+    os.makedirs(version["work_dir"], exist_ok=True)
+    copy = os.path.join(version["work_dir"], f"{version['program']}.c")
+    if not os.path.exists(copy) or file_hash(copy) != version["source_hash"]:
+        shutil.copy(version["source"], copy)
+    return version
+
+
+def plan(versions, options, force=False):
+    """
+    Key, stored outputs and whether it has to run, for every (version, stage).
+
+    A stage is stale if its key changed or an output is missing. It runs if
+    it is stale and something downstream runs too, or it is the last stage.
+    """
+    tasks = {}
+    for version in versions:
+        for stage, (_, after) in STAGES.items():
+            h = hashlib.sha256(json.dumps({
+                "stage": stage,
+                "inputs": stage_inputs(stage, version, options),
+                "after": [tasks[version["name"], dep]["key"] for dep in after],
+            }, sort_keys=True).encode())
+            stamp = None if force else read_stamp(version["work_dir"], stage)
+            outputs = [os.path.join(version["work_dir"], p) for p in stamp["outputs"]] if stamp else []
+            stale = stamp is None or stamp["key"] != h.hexdigest() or not all(map(os.path.exists, outputs))
+            tasks[version["name"], stage] = {
+                "version": version, "stage": stage, "key": h.hexdigest(), "outputs": outputs, "stale": stale,
+            }
+
+        needed = set()
+        for stage in reversed(list(STAGES)):
+            dependents = [s for s, (_, after) in STAGES.items() if stage in after]
+            if tasks[version["name"], stage]["stale"] and (not dependents or needed & set(dependents)):
+                needed.add(stage)
+        for stage in STAGES:
+            tasks[version["name"], stage]["run"] = stage in needed
+    return tasks
+
+
+def _run_stage(stage, version, inputs, options):
+    """Run one stage in a worker; its measurements travel back as a profiling.Stage."""
+    profiler = Profiler("pipeline.py", cprofile_dir=options["cprofile"])
+    # Always measured: the wall time is also the seconds of the summary table
+    profiler.enabled = True
+    with profiler.stage(f"{version['name']}.{stage}") as record:
+        outputs, info = STAGES[stage][0](version, version["work_dir"], inputs, options)
+        record.items = info.get("items")
+    return outputs, info, record
+
+
+def run_pipeline(versions, work_root=WORK_DIR, formulas=DEFAULT_FORMULAS, jobs=None, test_jobs=None,
+                 forkserver=False, force=False, profiler=None):
+    """
+    Run every stale stage of every version, as many at once as jobs allows.
+    With a profiler (see profiling.py) every stage that runs is added to it
+    as <version>.<stage>, with its CPU time, peak memory and item count.
+
+    Returns (results DataFrame of the versions that finished, {version:
+    {stage: seconds, "cached", "failed" or "skipped"}}, {(version, stage): error}).
+    """
+    versions = [prepare(version, work_root) for version in versions]
+    if test_jobs is None:
+        test_jobs = max(1, (os.cpu_count() or 1) // max(len(versions), 1))
+    options = {
+        "formulas": list(formulas), "test_jobs": test_jobs, "forkserver": forkserver,
+        "cprofile": profiler.cprofile_dir if profiler is not None else None,
+    }
+    tasks = plan(versions, options, force)
+
+    report = {version["name"]: {} for version in versions}
+    pending = {name for name, task in tasks.items() if task["run"]}
+    done = set(tasks) - pending
+    for name in done:
+        report[name[0]][name[1]] = "cached"
+    errors, running = {}, {}
+    order = {stage: i for i, stage in enumerate(STAGES)}
+
+    with ProcessPoolExecutor(jobs) as pool:
+        while pending or running:
+            ready = [name for name in pending if all((name[0], dep) in done for dep in STAGES[name[1]][1])]
+            for name in sorted(ready, key=lambda name: (order[name[1]], name[0])):
+                task = tasks[name]
+                pending.discard(name)
+                # A run that dies half way must not look up to date
+                stale_stamp = stamp_path(task["version"]["work_dir"], task["stage"])
+                if os.path.exists(stale_stamp):
+                    os.remove(stale_stamp)
+                inputs = {dep: tasks[name[0], dep]["outputs"] for dep in STAGES[name[1]][1]}
+                running[pool.submit(_run_stage, task["stage"], task["version"], inputs, options)] = name
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                task = tasks[name]
+                try:
+                    outputs, info, record = future.result()
+                except Exception as e:
+                    errors[name] = e
+                    report[name[0]][name[1]] = "failed"
+                    # Everything downstream of a failed stage in this version is dropped
+                    blocked = {name[1]}
+                    for stage, (_, after) in STAGES.items():
+                        if blocked & set(after):
+                            blocked.add(stage)
+                            if (name[0], stage) in pending:
+                                pending.discard((name[0], stage))
+                                report[name[0]][stage] = "skipped"
+                    continue
+                task["outputs"] = outputs
+                write_stamp(task["version"]["work_dir"], task["stage"], task["key"], outputs)
+                report[name[0]][name[1]] = record.wall
+                if profiler is not None:
+                    profiler.add(record)
+                done.add(name)
+
+    frames = [
+        pd.read_csv(tasks[version["name"], "evaluate"]["outputs"][0])
+        for version in versions if (version["name"], "evaluate") in done
+    ]
+    results = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return results, report, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Localize the faults of many program versions as a pipeline of stages.")
+    parser.add_argument("manifest", nargs="?", default="fault_versions.json")
+    parser.add_argument("--formulas", nargs="+", default=DEFAULT_FORMULAS)
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="stages run at once")
+    parser.add_argument("--test-jobs", type=int,
+                        help="workers running the tests of each version (default: cores / versions)")
+    parser.add_argument("--work-dir", default=WORK_DIR, help="per-version working directories go here")
+    parser.add_argument("--forkserver", action="store_true", help="run the tests through the fork server")
+    parser.add_argument("--force", action="store_true", help="run every stage even if its inputs are unchanged")
+    parser.add_argument("-o", "--output", help="write the full results table to this CSV file")
+    parser.add_argument("--top", type=int, default=10)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    versions = load_manifest(args.manifest)
+    start = time.perf_counter()
+    with Profiler("pipeline.py", args.profile, args.cprofile) as profiler:
+        results, report, errors = run_pipeline(
+            versions, args.work_dir, args.formulas, args.jobs, args.test_jobs, args.forkserver, args.force,
+            profiler
+        )
+    elapsed = time.perf_counter() - start
+
+    stages = pd.DataFrame(report).T.reindex(columns=list(STAGES))
+    print(f"{len(versions)} versions in {elapsed:.2f}s; stage seconds:")
+    print(stages.to_string(float_format=lambda x: f"{x:.3f}"))
+    for (name, stage), error in sorted(errors.items()):
+        print(f"{name} {stage} failed: {error}")
+
+    if len(results):
+        skipped = sorted(set(results["version"]) - set(results[results["failing"] > 0]["version"]))
+        if skipped:
+            print(f"No failing tests, left out of the summary: {', '.join(skipped)}")
+        print(summarize(results).head(args.top).to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+        if args.output:
+            results.to_csv(args.output, index=False)
+            print(f"\nResults written to {args.output}")
+    if errors:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
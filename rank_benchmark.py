@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Fault localization benchmark over faulty program versions.
+
+For every version in a manifest (fault_versions.json: source, tests and the
+known fault lines) the pipeline of build_graph.ipynb runs end to end:
+
+    coverage      per-test line spectrum (run_coverage.py, native mode)
+    graph         whole-program line graph (line_graph.py)
+    sbfl          every formula at once, a lines x formulas matrix (sbfl.py)
+    propagation   none / flow / in_suspiciousness / out_suspiciousness
+    centrality    none or a score x centrality weighting, per measure
+    ranking       best, worst and average rank of the fault, and EXAM
+
+All formula x propagation x centrality combinations are stacked into one
+score matrix per version, and the ranks of all its columns come from one
+vectorized tie-counting pass (rank_bounds). Ties are scores within
+TIE_TOLERANCE of the fault's score, as in the notebook. With several fault
+lines, the best-scored one counts. Versions run in parallel and
+the time of every stage is recorded, so quality and speed can be tracked
+run over run (--history appends one JSON line per run).
+
+    python rank_benchmark.py fault_versions.json -o results.csv
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from centrality import centrality
+from line_graph import load_line_graph
+from propagation import propagate
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_files"))
+from run_coverage import build_spectrum, read_tests, run_coverage
+from sbfl import DEFAULT_FORMULAS, score, spectrum_counters
+from spectrum import Spectrum
+
+PROPAGATIONS = ("none", "flow", "in_suspiciousness", "out_suspiciousness")
+CENTRALITIES = ("none", "in_degree", "out_degree", "pagerank", "betweenness", "closeness", "eigenvector")
+TIE_TOLERANCE = 1e-6
+ALPHA = 0.5
+
+
+def rank_bounds(scores, targets, tolerance=TIE_TOLERANCE):
+    """
+    1-based best and worst rank of the best-scored target row in every
+    column of an (n x k) score matrix. Scores within tolerance of the
+    target's score are ties; best ranks the target first among them, worst last.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    scores = scores.reshape(len(scores), -1)
+    target = scores[np.asarray(targets, dtype=np.int64)].max(axis=0)
+    best = 1 + (scores >= target + tolerance).sum(axis=0)
+    worst = (scores > target - tolerance).sum(axis=0)
+    return best, worst
+
+
+def load_manifest(path):
+    """Versions of a manifest, with paths made relative to its directory."""
+    with open(path) as f:
+        manifest = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    versions = []
+    for version in manifest["versions"]:
+        version = dict(version)
+        for key in ("source", "tests", "spectrum"):
+            if key in version:
+                version[key] = os.path.join(base, version[key])
+        version.setdefault("name", os.path.splitext(os.path.basename(version["source"]))[0])
+        versions.append(version)
+    return versions
+
+
+def version_spectrum(version, jobs=1):
+    """The stored spectrum of a version if the manifest names one, else a fresh native coverage run."""
+    if version.get("spectrum") and os.path.exists(version["spectrum"]):
+        return Spectrum.open(version["spectrum"])
+    program = os.path.splitext(os.path.basename(version["source"]))[0]
+    run = run_coverage(program, read_tests(version["tests"]), os.path.dirname(version["source"]),
+                       jobs=jobs, native=True)
+    return build_spectrum(run, program)
+
+
+def score_matrix(A, line_scores, formulas, alpha=ALPHA):
+    """
+    Stack every formula x propagation x centrality combination of the
+    (lines x formulas) SBFL scores into one (lines x combinations) matrix.
+    """
+    timings = {}
+    start = time.perf_counter()
+    propagated = propagate(A, line_scores, alpha)
+    variants = [line_scores] + [propagated[name] for name in PROPAGATIONS[1:]]
+    timings["propagation"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    measures = centrality(A, CENTRALITIES[1:])
+    weights = np.stack([np.ones(A.shape[0])] + [measures[name] for name in CENTRALITIES[1:]], axis=1)
+    timings["centrality"] = time.perf_counter() - start
+
+    # (lines, propagations, formulas, centralities) -> (lines, combinations)
+    stacked = np.stack(variants, axis=1)[:, :, :, None] * weights[:, None, None, :]
+    combinations = [
+        (formula, propagation, weighting)
+        for propagation in PROPAGATIONS for formula in formulas for weighting in CENTRALITIES
+    ]
+    return stacked.reshape(A.shape[0], -1), combinations, timings
+
+
+def place_scores(graph, lines, line_scores):
+    """
+    Put the (spectrum lines x formulas) scores of the program's first file
+    onto the graph nodes. Lines no test executed keep a score of 0, as in
+    the notebook.
+    """
+    placed = np.zeros((graph.n_nodes, line_scores.shape[1]))
+    nodes = np.array([graph.node_index(graph.files[0], line) for line in lines], dtype=np.int64)
+    known = nodes >= 0
+    placed[nodes[known]] = line_scores[known]
+    return placed
+
+
+def result_rows(name, graph, scores, combinations, faults, failing):
+    """One result row per scoring combination: rank bounds and EXAM of the fault lines."""
+    targets = [graph.node_index(graph.files[0], line) for line in faults]
+    targets = [t for t in targets if t >= 0]
+    n = graph.n_nodes
+    if targets:
+        best, worst = rank_bounds(scores, targets)
+    else:
+        best = worst = np.full(scores.shape[1], n)
+    return [
+        {
+            "version": name, "formula": formula, "propagation": propagation, "centrality": weighting,
+            "best": int(b), "worst": int(w), "average": (b + w) / 2, "exam": (b + w) / 2 / n,
+            "lines": n, "failing": failing, "fault_found": bool(targets),
+        }
+        for (formula, propagation, weighting), b, w in zip(combinations, best.tolist(), worst.tolist())
+    ]
+
+
+def evaluate_version(version, formulas=DEFAULT_FORMULAS, jobs=1):
+    """Run the whole pipeline on one version; returns (result rows, stage timings)."""
+    timings = {}
+    start = time.perf_counter()
+    spectrum = version_spectrum(version, jobs)
+    timings["coverage"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    graph = load_line_graph([version["source"]])
+    timings["graph"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    line_scores = place_scores(graph, spectrum.lines.tolist(), score(spectrum_counters(spectrum), formulas))
+    timings["sbfl"] = time.perf_counter() - start
+
+    scores, combinations, stage_timings = score_matrix(graph.adjacency, line_scores, formulas)
+    timings.update(stage_timings)
+
+    start = time.perf_counter()
+    rows = result_rows(version["name"], graph, scores, combinations, version["faults"], int(spectrum.failed.sum()))
+    timings["ranking"] = time.perf_counter() - start
+    return rows, timings
+
+
+def _evaluate(task):
+    version, formulas, jobs = task
+    return version["name"], evaluate_version(version, formulas, jobs)
+
+
+def run_benchmark(versions, formulas=DEFAULT_FORMULAS, jobs=None, test_jobs=1):
+    """Evaluate all versions in parallel; returns (results DataFrame, {version: stage timings})."""
+    tasks = [(version, formulas, test_jobs) for version in versions]
+    if jobs == 1 or len(tasks) <= 1:
+        outcomes = list(map(_evaluate, tasks))
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            outcomes = list(pool.map(_evaluate, tasks))
+    rows = [row for _, (version_rows, _) in outcomes for row in version_rows]
+    return pd.DataFrame(rows), {name: timings for name, (_, timings) in outcomes}
+
+
+def summarize(results):
+    """Mean ranks and EXAM per combination over the versions with failing tests, best first."""
+    usable = results[(results["failing"] > 0) & results["fault_found"]]
+    summary = usable.groupby(["formula", "propagation", "centrality"], as_index=False)[
+        ["best", "worst", "average", "exam"]
+    ].mean()
+    return summary.sort_values(["exam", "formula", "propagation", "centrality"]).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank the known faults of program versions under every scoring combination.")
+    parser.add_argument("manifest", nargs="?", default="fault_versions.json")
+    parser.add_argument("--formulas", nargs="+", default=DEFAULT_FORMULAS)
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="versions evaluated at once")
+    parser.add_argument("--test-jobs", type=int, default=1, help="workers running the tests of each version")
+    parser.add_argument("-o", "--output", help="write the full results table to this CSV file")
+    parser.add_argument("--history", help="append this run's timings and summary to a JSON-lines file")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    versions = load_manifest(args.manifest)
+    start = time.perf_counter()
+    results, timings = run_benchmark(versions, args.formulas, args.jobs, args.test_jobs)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(results)
+    print(f"{len(versions)} versions x {len(results) // max(len(versions), 1)} combinations in {elapsed:.2f}s")
+    skipped = sorted(set(results["version"]) - set(results[results["failing"] > 0]["version"]))
+    if skipped:
+        print(f"No failing tests, left out of the summary: {', '.join(skipped)}")
+    print(summary.head(args.top).to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+
+    stages = pd.DataFrame(timings).T
+    print("\nStage timings (s):")
+    print(stages.to_string(float_format=lambda x: f"{x:.3f}"))
+
+    if args.output:
+        results.to_csv(args.output, index=False)
+        print(f"\nResults written to {args.output}")
+    if args.history:
+        record = {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "elapsed": elapsed,
+            "timings": timings,
+            "summary": summary.head(args.top).to_dict(orient="records"),
+        }
+        with open(args.history, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Adaptive test execution that stops once the D* ranking settles.
+
+Running every row of tests.csv with coverage is mostly spent on passing
+tests that no longer move the top of the ranking. Here:
+
+  1. every test is run once without coverage through the fork server
+     (forkserver.py) to learn which ones fail, which is cheap;
+  2. all failing tests are run with coverage first, so ef and nf are final;
+  3. passing tests follow in batches, in farthest-first order over their
+     arguments (each next test is the one differing in the most arguments
+     from every test picked so far), so the batches spread over the input
+     space instead of repeating similar runs;
+  4. after each batch the ef/ep counters are updated by that batch only and
+     the top-k lines are recomputed.
+
+Passing tests only ever raise ep, so every line's score can only move
+within bounds given by how many passing tests remain. Execution stops when
+the top-k set has been the same for `patience` batches, or when the
+estimated confidence that it is final reaches the threshold. The estimate
+assumes the remaining tests cover each line at the rate seen so far, within
+a Hoeffding margin over all lines. Confidence 1 means no remaining test can
+change the set.
+
+    python adaptive.py tcas2 --top-k 10 --patience 3 --confidence 0.95
+"""
+
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from fl_dstar import print_ranking
+from forkserver import ForkServer, compile_forkserver
+from run_coverage import init_worker, make_config, rank_counters, read_tests, remove_build, run_test, test_passed
+from sbfl import dstar, make_counters
+
+BATCH_SIZE = 50
+TOP_K = 10
+PATIENCE = 3
+CONFIDENCE = 0.95
+
+
+def test_outcomes(program, tests, source_dir):
+    """Pass/fail of every test from one uninstrumented fork-server run."""
+    with tempfile.TemporaryDirectory(prefix="adaptive_") as work_dir:
+        binary = compile_forkserver(program, source_dir, coverage=False, output=os.path.join(work_dir, program))
+        with ForkServer(binary) as server:
+            return [test_passed(*server.run(args), expected) for args, expected in tests]
+
+
+def diversity_order(tests, seed=0):
+    """
+    Yield indices of tests in farthest-first order: each next test has the
+    largest number of differing arguments to its nearest already picked test.
+    """
+    n = len(tests)
+    if n == 0:
+        return
+    width = max(len(args) for args, _ in tests)
+    columns = [{} for _ in range(width)]
+    tokens = np.array([
+        [columns[j].setdefault(args[j] if j < len(args) else None, len(columns[j])) for j in range(width)]
+        for args, _ in tests
+    ], dtype=np.int64).reshape(n, width)
+
+    distance = np.full(n, np.inf)
+    i = int(np.random.default_rng(seed).integers(n))
+    for _ in range(n):
+        yield i
+        distance = np.minimum(distance, (tokens != tokens[i]).sum(axis=1))
+        # Picked tests rank below everything, exact duplicates (0) included
+        distance[i] = -1
+        i = int(np.argmax(distance))
+
+
+def top_lines(scores, lines, k):
+    """Indices of the k highest scores, ties broken by line number."""
+    return np.lexsort((lines, -scores))[:k]
+
+
+def _dstar_range(ef, nf, ep_low, ep_high):
+    """Lowest and highest D* a line can reach with ep anywhere in [ep_low, ep_high]."""
+    score = dstar(2)
+
+    def at(ep):
+        return score(make_counters(ef, ep, ef + nf, 0))
+
+    # D* falls as ep grows, except that ep + nf == 0 scores 0 (as fl_dstar.py does)
+    first_nonzero = np.where(ep_low + nf > 0, ep_low, np.minimum(ep_high, 1))
+    return np.minimum(at(ep_low), at(ep_high)), np.maximum(at(ep_low), at(first_nonzero))
+
+
+def top_k_confidence(ef, ep, nf, passed_run, remaining, top):
+    """
+    Estimated probability that the remaining passing tests leave the top-k
+    set unchanged.
+
+    The remaining tests are assumed to cover each line at the rate seen in
+    the passed_run tests so far, within a margin epsilon (Hoeffding, union
+    bound over all lines). The largest epsilon that still keeps the top-k
+    strictly above every other line gives the confidence. 1 means even the
+    worst case cannot change the set.
+    """
+    if remaining == 0:
+        return 1.0
+    rate = ep / passed_run if passed_run else np.full(len(ep), 0.5)
+    others = np.ones(len(ef), dtype=bool)
+    others[top] = False
+    if not others.any():
+        return 1.0
+
+    def separated(epsilon):
+        low_ep = ep + np.floor(remaining * np.clip(rate - epsilon, 0, 1))
+        high_ep = ep + np.ceil(remaining * np.clip(rate + epsilon, 0, 1))
+        low, high = _dstar_range(ef, nf, low_ep, high_ep)
+        return low[top].min() > high[others].max()
+
+    if separated(1.0):
+        return 1.0
+    if not passed_run or not separated(0.0):
+        return 0.0
+    lo, hi = 0.0, 1.0
+    for _ in range(30):
+        mid = (lo + hi) / 2
+        lo, hi = (mid, hi) if separated(mid) else (lo, mid)
+    return max(0.0, 1 - 2 * len(ef) * math.exp(-2 * passed_run * lo ** 2))
+
+
+def run_adaptive(program, tests, source_dir=".", jobs=None, batch_size=BATCH_SIZE, top_k=TOP_K,
+                 patience=PATIENCE, confidence=CONFIDENCE, seed=0, forkserver=True):
+    """
+    Run tests until the top-k of the D* ranking is stable.
+
+    Returns a dict with the instrumented "lines", the ef/ep "counters", the
+    test IDs that were "run", the "batches", the final "confidence", why it
+    "stopped" and the "elapsed" seconds.
+    """
+    start = time.perf_counter()
+    outcomes = test_outcomes(program, tests, source_dir)
+    failing = [i for i, passed in enumerate(outcomes) if not passed]
+    passing = [i for i, passed in enumerate(outcomes) if passed]
+    order = (passing[j] for j in diversity_order([tests[i] for i in passing], seed))
+
+    config = make_config(program, source_dir, native=True, forkserver=forkserver)
+    lines = np.asarray(config["model"].lines)
+    ef = np.zeros(len(lines))
+    ep = np.zeros(len(lines))
+    total_failed = passed_run = 0
+    run, batches = [], 0
+    previous, stable = None, 0
+    estimate, stopped = 0.0, "all tests run" if failing else "no failing tests"
+
+    try:
+        with tempfile.TemporaryDirectory(prefix="coverage_") as scratch_root:
+            with Pool(jobs, initializer=init_worker, initargs=(config, scratch_root)) as pool:
+                # The first batch is every failing test, then passing tests batch by batch
+                batch = failing
+                while batch:
+                    tasks = [(i + 1, *tests[i]) for i in batch]
+                    for index, passed, line_bits, _, _ in pool.imap_unordered(run_test, tasks, chunksize=4):
+                        covered = np.unpackbits(line_bits, count=len(lines)).astype(bool)
+                        if passed:
+                            ep += covered
+                            passed_run += 1
+                        else:
+                            ef += covered
+                            total_failed += 1
+                        run.append(index)
+                    batches += 1
+
+                    nf = total_failed - ef
+                    scores = dstar(2)(make_counters(ef, ep, total_failed, passed_run))
+                    top = top_lines(scores, lines, top_k)
+                    current = set(lines[top].tolist())
+                    stable = stable + 1 if current == previous else 0
+                    previous = current
+                    estimate = top_k_confidence(ef, ep, nf, passed_run, len(tests) - len(run), top)
+                    if batches > 1 and stable >= patience:
+                        stopped = f"top-{top_k} unchanged for {patience} batches"
+                        break
+                    if batches > 1 and estimate >= confidence:
+                        stopped = f"confidence {estimate:.3f} reached"
+                        break
+                    batch = [i for _, i in zip(range(batch_size), order)]
+                pool.close()
+                pool.join()
+    finally:
+        remove_build(config)
+
+    return {
+        "lines": lines.tolist(),
+        "counters": make_counters(ef, ep, total_failed, passed_run),
+        "run": sorted(run),
+        "batches": batches,
+        "confidence": estimate,
+        "stopped": stopped,
+        "elapsed": time.perf_counter() - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run tests until the top of the D* ranking is stable.")
+    parser.add_argument("program", help="program name, e.g. tcas0 for tcas0.c")
+    parser.add_argument("--tests", default="tests.csv", help="CSV of <args>,<expected output>")
+    parser.add_argument("--source-dir", default=".", help="directory containing <program>.c")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of workers")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="passing tests per batch")
+    parser.add_argument("--top-k", type=int, default=TOP_K, help="ranking positions that must settle")
+    parser.add_argument("--patience", type=int, default=PATIENCE,
+                        help="stop after the top-k set is unchanged for this many batches")
+    parser.add_argument("--confidence", type=float, default=CONFIDENCE,
+                        help="stop once the estimated probability that the top-k is final reaches this")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the diversity order")
+    args = parser.parse_args()
+
+    tests = read_tests(args.tests)
+    if not tests:
+        print(f"No tests found in {args.tests}")
+        sys.exit(1)
+
+    result = run_adaptive(
+        args.program, tests, args.source_dir, args.jobs, args.batch_size, args.top_k,
+        args.patience, args.confidence, args.seed
+    )
+    counters = result["counters"]
+    print(f"Ran {len(result['run'])} of {len(tests)} tests ({int(counters.ef[0] + counters.nf[0])} failing) "
+          f"in {result['batches']} batches, {result['elapsed']:.2f}s")
+    print(f"Stopped: {result['stopped']}; estimated top-{args.top_k} stability {result['confidence']:.3f}")
+    source = os.path.join(args.source_dir, f"{args.program}.c")
+    print_ranking(rank_counters(result["lines"], counters, source))
+
+
+if __name__ == "__main__":
+    main()
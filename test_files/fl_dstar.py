@@ -3,6 +3,9 @@ import os
 import glob
 import pandas as pd
 
+from profiling import from_argv
+from sbfl import dstar, make_counters
+
 def parse_gcov_file(filename):
     results = {}
     with open(filename, 'r') as f:
@@ -21,51 +24,74 @@ def parse_gcov_file(filename):
             results[line_num] = (executed, statement)
     return results
 
-passing_dir = sys.argv[1]
-failing_dir = sys.argv[2]
-
-passed_counts = {}
-failed_counts = {}
-statements = {}
-
-passing_files = glob.glob(os.path.join(passing_dir, "*.gcov"))
-for gcov_file in passing_files:
-    cov_data = parse_gcov_file(gcov_file)
-    for line_num, (executed, statement) in cov_data.items():
-        if line_num not in statements:
-            statements[line_num] = statement
-        if executed:
-            passed_counts[line_num] = passed_counts.get(line_num, 0) + 1
-
-failing_files = glob.glob(os.path.join(failing_dir, "*.gcov"))
-total_failed = len(failing_files)
-for gcov_file in failing_files:
-    cov_data = parse_gcov_file(gcov_file)
-    for line_num, (executed, statement) in cov_data.items():
-        if line_num not in statements:
-            statements[line_num] = statement
-        if executed:
-            failed_counts[line_num] = failed_counts.get(line_num, 0) + 1
-
-results = []
-for line_num, stmt in statements.items():
-    failed = failed_counts.get(line_num, 0)
-    passed = passed_counts.get(line_num, 0)
-    denominator = passed + total_failed - failed
-    if denominator == 0:
-        suspiciousness = 0
-    else:
-        suspiciousness = (failed ** 2) / denominator
-    results.append((line_num, stmt, failed, passed, total_failed, suspiciousness))
-
-results.sort(key=lambda x: (-x[5], x[0]))
-
-df = pd.DataFrame(results, columns=["Line", "Statement", "#failedTests(s)", "#passedTests(s)", "totalFailed", "Suspiciousness"])
-
-width = 30
-df["Statement"] = df["Statement"].apply(lambda s: s.replace("\t", " " * 4))
-df["Statement"] = df["Statement"].apply(lambda s: s if len(s) <= width else s[:width - 4] + " ...")
-
-df["Suspiciousness"] = df["Suspiciousness"].apply(lambda x: f"{x:.2f}")
-
-print(df.head(10).to_string(index=False))
+def count_coverage(passing_files, failing_files):
+    """Tally how many passing and failing .gcov files execute each line."""
+    passed_counts = {}
+    failed_counts = {}
+    statements = {}
+
+    for gcov_file in passing_files:
+        cov_data = parse_gcov_file(gcov_file)
+        for line_num, (executed, statement) in cov_data.items():
+            if line_num not in statements:
+                statements[line_num] = statement
+            if executed:
+                passed_counts[line_num] = passed_counts.get(line_num, 0) + 1
+
+    for gcov_file in failing_files:
+        cov_data = parse_gcov_file(gcov_file)
+        for line_num, (executed, statement) in cov_data.items():
+            if line_num not in statements:
+                statements[line_num] = statement
+            if executed:
+                failed_counts[line_num] = failed_counts.get(line_num, 0) + 1
+
+    return passed_counts, failed_counts, statements
+
+def compute_suspiciousness(statements, passed_counts, failed_counts, total_failed):
+    """Score every line with D* (power 2), most suspicious first."""
+    line_nums = list(statements)
+    failed = [failed_counts.get(line_num, 0) for line_num in line_nums]
+    passed = [passed_counts.get(line_num, 0) for line_num in line_nums]
+    # Only ef, ep and nf enter D*, so the passing total is irrelevant here
+    counters = make_counters(failed, passed, total_failed, 0)
+    scores = dstar(2)(counters).tolist()
+
+    results = list(zip(line_nums, statements.values(), failed, passed, [total_failed] * len(line_nums), scores))
+
+    results.sort(key=lambda x: (-x[5], x[0]))
+    return results
+
+def print_ranking(results, top=10):
+    """Print the most suspicious lines as a table."""
+    df = pd.DataFrame(results, columns=["Line", "Statement", "#failedTests(s)", "#passedTests(s)", "totalFailed", "Suspiciousness"])
+
+    width = 30
+    df["Statement"] = df["Statement"].apply(lambda s: s.replace("\t", " " * 4))
+    df["Statement"] = df["Statement"].apply(lambda s: s if len(s) <= width else s[:width - 4] + " ...")
+
+    df["Suspiciousness"] = df["Suspiciousness"].apply(lambda x: f"{x:.2f}")
+
+    print(df.head(top).to_string(index=False))
+
+def main():
+    # --profile FILE / --cprofile DIR may appear anywhere (see profiling.py)
+    profiler, args = from_argv("fl_dstar.py", sys.argv[1:])
+    passing_dir = args[0]
+    failing_dir = args[1]
+
+    with profiler:
+        with profiler.stage("collect") as stage:
+            passing_files = glob.glob(os.path.join(passing_dir, "*.gcov"))
+            failing_files = glob.glob(os.path.join(failing_dir, "*.gcov"))
+            stage.items = len(passing_files) + len(failing_files)
+        with profiler.stage("parse_gcov", items=len(passing_files) + len(failing_files)):
+            passed_counts, failed_counts, statements = count_coverage(passing_files, failing_files)
+
+        with profiler.stage("score", items=len(statements)):
+            results = compute_suspiciousness(statements, passed_counts, failed_counts, len(failing_files))
+        with profiler.stage("report"):
+            print_ranking(results)
+
+if __name__ == "__main__":
+    main()
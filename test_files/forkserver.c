@@ -0,0 +1,118 @@
+/*
+ * Fork server for forkserver.py.
+ *
+ * The program under test is compiled with its main renamed to
+ * forkserver_target_main (forkserver.py does this on the object file, so
+ * the gcov notes still say "main") and linked with this file. Started with
+ * $FORKSERVER_FDS = "<control fd> <status fd> <output fd>", the process is
+ * loaded, linked and initialized once and then serves requests:
+ *
+ *   control  uint32 length, then length bytes of NUL-terminated arguments
+ *   status   int32 wait status of the child that ran them
+ *
+ * Every request forks a child that resets the gcov counters, writes its
+ * stdout to the start of the output file and calls the real main. The
+ * counters are dumped to the .gcda file when the child exits, as in a
+ * normal run. The server itself exits with _exit() on end of input, so it
+ * never dumps counters. Without $FORKSERVER_FDS the program runs as usual.
+ */
+
+#include <fcntl.h>
+#include <signal.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+int forkserver_target_main(int argc, char **argv);
+
+/* Present only when linked with -fprofile-arcs */
+extern void __gcov_reset(void) __attribute__((weak));
+
+static int read_all(int fd, void *buffer, size_t size)
+{
+    char *p = buffer;
+    while (size) {
+        ssize_t n = read(fd, p, size);
+        if (n <= 0)
+            return -1;
+        p += n;
+        size -= n;
+    }
+    return 0;
+}
+
+static void run_child(int output, char **argv, int argc)
+{
+    int null = open("/dev/null", O_RDONLY);
+    if (null >= 0) {
+        dup2(null, STDIN_FILENO);
+        close(null);
+    }
+    if (ftruncate(output, 0) == 0 && lseek(output, 0, SEEK_SET) == 0)
+        dup2(output, STDOUT_FILENO);
+    close(output);
+
+    if (__gcov_reset)
+        __gcov_reset();
+    const char *timeout = getenv("FORKSERVER_TIMEOUT");
+    if (timeout)
+        alarm(atoi(timeout));
+    exit(forkserver_target_main(argc, argv));
+}
+
+int main(int argc, char **argv)
+{
+    const char *fds = getenv("FORKSERVER_FDS");
+    int control, status, output;
+
+    if (!fds || sscanf(fds, "%d %d %d", &control, &status, &output) != 3)
+        return forkserver_target_main(argc, argv);
+
+    /* Tell the controller the program is loaded */
+    int32_t hello = 0;
+    if (write(status, &hello, sizeof(hello)) != sizeof(hello))
+        _exit(1);
+
+    for (;;) {
+        uint32_t length;
+        if (read_all(control, &length, sizeof(length)) < 0)
+            _exit(0);
+        char *payload = malloc(length + 1);
+        if (!payload || read_all(control, payload, length) < 0)
+            _exit(1);
+        payload[length] = '\0';
+
+        /* argv[0] is the server's own, the payload holds the rest */
+        int child_argc = 1;
+        for (uint32_t i = 0; i < length; i++)
+            child_argc += payload[i] == '\0';
+        char **child_argv = malloc(sizeof(char *) * (child_argc + 1));
+        if (!child_argv)
+            _exit(1);
+        child_argv[0] = argv[0];
+        char *p = payload;
+        for (int i = 1; i < child_argc; i++) {
+            child_argv[i] = p;
+            p += strlen(p) + 1;
+        }
+        child_argv[child_argc] = NULL;
+
+        pid_t pid = fork();
+        if (pid == 0) {
+            close(control);
+            close(status);
+            run_child(output, child_argv, child_argc);
+        }
+
+        int32_t wait_status = -1;
+        if (pid > 0 && waitpid(pid, &wait_status, 0) < 0)
+            wait_status = -1;
+        free(child_argv);
+        free(payload);
+        if (write(status, &wait_status, sizeof(wait_status)) != sizeof(wait_status))
+            _exit(1);
+    }
+}
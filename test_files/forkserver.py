@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Fork-server test executor.
+
+Launching ./tcas0 for every row of tests.csv pays for exec, dynamic linking
+and gcov start-up each time, which costs more than the test itself. Here the
+program is linked with forkserver.c and started once; every test is a fork
+of that already-initialized process, driven over a pipe:
+
+    server = ForkServer(binary, env=...)
+    returncode, stdout = server.run(["958", "1", "1", ...])
+
+The child resets the gcov counters before main and dumps them to the
+.gcda file on exit, so coverage is read exactly as after a normal run
+(remove the .gcda before each test, as run_coverage.py does). The fork
+server is used by run_coverage.py --forkserver.
+
+    python forkserver.py tcas0          # time every test of tests.csv through the fork server
+"""
+
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "forkserver.c")
+TARGET_MAIN = "forkserver_target_main"
+STATUS = struct.Struct("<i")
+LENGTH = struct.Struct("<I")
+
+
+class ForkServerError(RuntimeError):
+    """The fork server died or did not answer."""
+
+
+def compile_forkserver(program, source_dir, coverage=True, output=None):
+    """
+    Compile <program>.c (with gcov instrumentation if coverage) and link it
+    with the fork server; returns the binary path.
+
+    main is renamed on the object file rather than with -Dmain=..., so the
+    .gcno notes keep the original function name.
+    """
+    source_dir = os.path.abspath(source_dir)
+    output = os.path.abspath(output or os.path.join(source_dir, f"{program}_forkserver"))
+    flags = ["-fprofile-arcs", "-ftest-coverage"] if coverage else []
+    with tempfile.TemporaryDirectory(prefix="forkserver_") as work_dir:
+        server = os.path.join(work_dir, "forkserver.o")
+        subprocess.run(["gcc", "-O2", "-c", SERVER_SOURCE, "-o", server], check=True)
+        # The object stays private to this build, but -dumpdir/-dumpbase keep the
+        # .gcno next to the source and the .gcda path as run_tests.sh has them
+        target = os.path.join(work_dir, f"{program}.o")
+        subprocess.run(
+            ["gcc", "-w", *flags, "-c", f"{program}.c", "-o", target,
+             "-dumpdir", source_dir + os.sep, "-dumpbase", program],
+            cwd=source_dir,
+            check=True
+        )
+        subprocess.run(["objcopy", f"--redefine-sym=main={TARGET_MAIN}", target], check=True)
+        subprocess.run(["gcc", *flags, target, server, "-o", output], check=True)
+    return output
+
+
+class ForkServer:
+    """One running fork server; run() executes a test in a fresh fork of it."""
+
+    def __init__(self, binary, env=None, timeout=None, cwd=None):
+        control_read, self._control = os.pipe()
+        self._status, status_write = os.pipe()
+        self._output = tempfile.TemporaryFile()
+        output_fd = self._output.fileno()
+
+        env = dict(os.environ if env is None else env)
+        env["FORKSERVER_FDS"] = f"{control_read} {status_write} {output_fd}"
+        if timeout:
+            env["FORKSERVER_TIMEOUT"] = str(int(timeout))
+        self.process = subprocess.Popen(
+            [binary], env=env, cwd=cwd, pass_fds=(control_read, status_write, output_fd),
+            stdin=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        os.close(control_read)
+        os.close(status_write)
+        self._read_status()
+
+    def _read_status(self):
+        data = b""
+        while len(data) < STATUS.size:
+            chunk = os.read(self._status, STATUS.size - len(data))
+            if not chunk:
+                raise ForkServerError(f"fork server exited with code {self.process.wait()}")
+            data += chunk
+        return STATUS.unpack(data)[0]
+
+    def run(self, args):
+        """Run main with args in a new fork; returns (exit code, stdout text)."""
+        payload = b"".join(os.fsencode(arg) + b"\0" for arg in args)
+        os.write(self._control, LENGTH.pack(len(payload)) + payload)
+        status = self._read_status()
+        returncode = os.waitstatus_to_exitcode(status) if status >= 0 else -1
+        # The child shares the file offset, so read by position
+        fd = self._output.fileno()
+        stdout = os.pread(fd, os.fstat(fd).st_size, 0)
+        return returncode, stdout.decode(errors="replace")
+
+    def close(self):
+        """Stop the server: it exits on end of input without dumping counters."""
+        if self._control is not None:
+            os.close(self._control)
+            self._control = None
+            self.process.wait()
+            os.close(self._status)
+            self._output.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python forkserver.py <program> [tests.csv]")
+        sys.exit(1)
+
+    from run_coverage import read_tests
+
+    program = sys.argv[1]
+    tests = read_tests(sys.argv[2] if len(sys.argv) > 2 else "tests.csv")
+    binary = compile_forkserver(program, ".", coverage=False)
+    try:
+        start = time.perf_counter()
+        with ForkServer(binary) as server:
+            passed = sum(expected in server.run(args)[1] for args, expected in tests)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.remove(binary)
+    print(f"Ran {len(tests)} tests in {elapsed:.2f}s ({len(tests) / elapsed:.1f} tests/s), {passed} passing")
+
+
+if __name__ == "__main__":
+    main()
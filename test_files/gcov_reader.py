@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Native reader for GCC's .gcno (notes) and .gcda (counter) files.
+
+The .gcno file describes every instrumented function as a graph of basic
+blocks, the arcs between them and the source lines each block covers. The
+.gcda file written by the instrumented binary only stores counters for arcs
+that are not on the spanning tree; the remaining arc counts follow from flow
+conservation. Because that inference only depends on the graph, it is done
+once per .gcno: every arc and line count is expressed as a linear
+combination of the raw counters, so decoding one test is a single
+matrix-vector product instead of a gcov process and a text file.
+
+Supports the format written by GCC 12 and later (byte-sized record lengths,
+unpadded strings).
+"""
+
+import struct
+import sys
+
+import numpy as np
+
+GCNO_MAGIC = 0x67636e6f  # "gcno"
+GCDA_MAGIC = 0x67636461  # "gcda"
+
+TAG_FUNCTION = 0x01000000
+TAG_BLOCKS = 0x01410000
+TAG_ARCS = 0x01430000
+TAG_LINES = 0x01450000
+TAG_COUNTER_ARCS = 0x01a10000
+
+ARC_ON_TREE = 1
+ARC_FAKE = 2
+ARC_FALLTHROUGH = 4
+
+ENTRY_BLOCK = 0
+EXIT_BLOCK = 1
+
+
+class GcovReader:
+    """Sequential reader for the word/string encoding shared by .gcno and .gcda."""
+
+    def __init__(self, data, magic):
+        self.data = data
+        self.pos = 0
+        self.endian = "<"
+        found = struct.unpack_from("<I", data, 0)[0]
+        if found != magic:
+            self.endian = ">"
+            found = struct.unpack_from(">I", data, 0)[0]
+            if found != magic:
+                raise ValueError(f"Bad magic 0x{found:08x}, expected 0x{magic:08x}")
+        self.pos = 4
+
+    def at_end(self):
+        return self.pos + 8 > len(self.data)
+
+    def unsigned(self):
+        value = struct.unpack_from(self.endian + "I", self.data, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def signed(self):
+        value = struct.unpack_from(self.endian + "i", self.data, self.pos)[0]
+        self.pos += 4
+        return value
+
+    def string(self):
+        length = self.unsigned()
+        if length == 0:
+            return None
+        raw = self.data[self.pos:self.pos + length]
+        self.pos += length
+        return raw.rstrip(b"\0").decode()
+
+    def counters(self, count):
+        values = np.frombuffer(self.data, dtype=self.endian + "u4", count=2 * count, offset=self.pos)
+        self.pos += 8 * count
+        # Counters are stored as (low word, high word) pairs
+        return values[0::2].astype(np.int64) | (values[1::2].astype(np.int64) << 32)
+
+
+class GcnoFunction:
+    """Basic-block graph of one instrumented function."""
+
+    def __init__(self, ident, cfg_checksum, name, source, start_line):
+        self.ident = ident
+        self.cfg_checksum = cfg_checksum
+        self.name = name
+        self.source = source
+        self.start_line = start_line
+        self.num_blocks = 0
+        self.arcs = []         # (src_block, dst_block, flags) in .gcno order
+        self.block_lines = {}  # block -> [(file, line)]
+
+    def counted_arcs(self):
+        """Indices of arcs that have a counter in the .gcda file."""
+        return [i for i, (_, _, flags) in enumerate(self.arcs) if not flags & ARC_ON_TREE]
+
+
+def read_gcno(path):
+    """Parse a .gcno file into a list of GcnoFunction objects."""
+    with open(path, "rb") as f:
+        reader = GcovReader(f.read(), GCNO_MAGIC)
+    reader.unsigned()  # version
+    reader.unsigned()  # stamp
+    reader.unsigned()  # checksum
+    reader.string()    # compilation directory
+    reader.unsigned()  # supports unexecuted blocks
+
+    functions = []
+    current = None
+    while not reader.at_end():
+        tag = reader.unsigned()
+        length = reader.unsigned()
+        end = reader.pos + length
+
+        if tag == TAG_FUNCTION:
+            ident = reader.unsigned()
+            reader.unsigned()  # lineno checksum
+            cfg_checksum = reader.unsigned()
+            name = reader.string()
+            reader.unsigned()  # artificial
+            source = reader.string()
+            start_line = reader.unsigned()
+            current = GcnoFunction(ident, cfg_checksum, name, source, start_line)
+            functions.append(current)
+        elif tag == TAG_BLOCKS:
+            current.num_blocks = reader.unsigned()
+        elif tag == TAG_ARCS:
+            src = reader.unsigned()
+            while reader.pos < end:
+                dst = reader.unsigned()
+                flags = reader.unsigned()
+                current.arcs.append((src, dst, flags))
+        elif tag == TAG_LINES:
+            block = reader.unsigned()
+            lines = current.block_lines.setdefault(block, [])
+            filename = current.source
+            while reader.pos < end:
+                line = reader.unsigned()
+                if line:
+                    lines.append((filename, line))
+                    continue
+                filename = reader.string()
+                if filename is None:
+                    break
+
+        reader.pos = end
+    return functions
+
+
+def read_gcda(path):
+    """Parse a .gcda file into {function ident: (cfg checksum, arc counters)}."""
+    with open(path, "rb") as f:
+        reader = GcovReader(f.read(), GCDA_MAGIC)
+    reader.unsigned()  # version
+    reader.unsigned()  # stamp
+    reader.unsigned()  # checksum
+
+    functions = {}
+    ident = None
+    checksum = None
+    while not reader.at_end():
+        tag = reader.unsigned()
+        length = reader.signed()
+        end = reader.pos + max(length, 0)
+
+        if tag == TAG_FUNCTION and length > 0:
+            ident = reader.unsigned()
+            reader.unsigned()  # lineno checksum
+            checksum = reader.unsigned()
+        elif tag == TAG_COUNTER_ARCS:
+            if length < 0:
+                # All-zero counter blocks are written with a negated length and no payload
+                functions[ident] = (checksum, np.zeros(-length // 8, dtype=np.int64))
+            else:
+                functions[ident] = (checksum, reader.counters(length // 8))
+
+        reader.pos = end
+    return functions
+
+
+def solve_arc_coefficients(function):
+    """
+    Express every arc count of a function as a combination of its counters.
+
+    Returns an (arcs x counters) integer matrix. Flow is conserved at every
+    block except ENTRY (no predecessors) and EXIT (no successors), which is
+    enough to recover the spanning-tree arcs that gcc does not instrument.
+    """
+    counted = function.counted_arcs()
+    n_counters = len(counted)
+    arc_coef = [None] * len(function.arcs)
+    for k, arc_index in enumerate(counted):
+        vec = np.zeros(n_counters, dtype=np.int64)
+        vec[k] = 1
+        arc_coef[arc_index] = vec
+
+    preds = [[] for _ in range(function.num_blocks)]
+    succs = [[] for _ in range(function.num_blocks)]
+    for i, (src, dst, _) in enumerate(function.arcs):
+        succs[src].append(i)
+        preds[dst].append(i)
+    block_coef = [None] * function.num_blocks
+
+    changed = True
+    while changed:
+        changed = False
+        for block in range(function.num_blocks):
+            for group in (preds[block], succs[block]):
+                if block_coef[block] is None:
+                    if group and all(arc_coef[i] is not None for i in group):
+                        block_coef[block] = sum(arc_coef[i] for i in group)
+                        changed = True
+                    continue
+                unknown = [i for i in group if arc_coef[i] is None]
+                if len(unknown) == 1:
+                    known = [arc_coef[i] for i in group if arc_coef[i] is not None]
+                    arc_coef[unknown[0]] = block_coef[block] - sum(known, np.zeros(n_counters, dtype=np.int64))
+                    changed = True
+
+    if any(coef is None for coef in arc_coef):
+        raise ValueError(f"Could not solve the flow graph of {function.name}")
+    if not arc_coef:
+        return np.zeros((0, n_counters), dtype=np.int64)
+    return np.vstack(arc_coef)
+
+
+class CoverageModel:
+    """
+    Linear map from raw .gcda counters to per-arc and per-line counts.
+
+    Line counts follow gcov: a line's count is the number of times control
+    entered one of its blocks from a block on a different line. Loops that
+    never leave a single line are counted once per entry, not per iteration.
+
+    Edges are the arcs that control can actually take (every arc except the
+    fake ones gcc adds around calls that may not return). Each edge is
+    labelled with the last line of its source block and the first line of
+    its destination block, 0 where the block has no line (function entry
+    and exit).
+    """
+
+    def __init__(self, gcno_path, source=None):
+        self.functions = read_gcno(gcno_path)
+        if source is None and self.functions:
+            source = self.functions[0].source
+        self.source = source
+
+        self.offsets = {}  # ident -> (first counter, counter count, function)
+        self.arcs = []     # (function name, src block, dst block, flags)
+        arc_blocks = []
+        n_counters = 0
+        for function in self.functions:
+            coef = solve_arc_coefficients(function)
+            self.offsets[function.ident] = (n_counters, coef.shape[1], function)
+            arc_blocks.append((n_counters, coef))
+            n_counters += coef.shape[1]
+            for src, dst, flags in function.arcs:
+                self.arcs.append((function.name, src, dst, flags))
+        self.num_counters = n_counters
+
+        # Global arc matrix: arcs x counters
+        self.arc_matrix = np.zeros((len(self.arcs), n_counters), dtype=np.int64)
+        row = 0
+        for start, coef in arc_blocks:
+            self.arc_matrix[row:row + coef.shape[0], start:start + coef.shape[1]] = coef
+            row += coef.shape[0]
+
+        # Line matrix: each line sums the arcs entering it from elsewhere
+        line_arcs = {}
+        arc_index = 0
+        for function in self.functions:
+            blocks_of_line = {}
+            for block, lines in function.block_lines.items():
+                for filename, line in lines:
+                    if filename == source:
+                        blocks_of_line.setdefault(line, set()).add(block)
+            for i, (src, dst, _) in enumerate(function.arcs):
+                for line, blocks in blocks_of_line.items():
+                    if dst in blocks and src not in blocks:
+                        line_arcs.setdefault(line, []).append(arc_index + i)
+            for line in blocks_of_line:
+                line_arcs.setdefault(line, [])
+            arc_index += len(function.arcs)
+
+        edges, edge_lines = [], []
+        arc_index = 0
+        for function in self.functions:
+            own_lines = {
+                block: [line for filename, line in lines if filename == source]
+                for block, lines in function.block_lines.items()
+            }
+            for i, (src, dst, flags) in enumerate(function.arcs):
+                if flags & ARC_FAKE:
+                    continue
+                edges.append(arc_index + i)
+                edge_lines.append(((own_lines.get(src) or [0])[-1], (own_lines.get(dst) or [0])[0]))
+            arc_index += len(function.arcs)
+        self.edges = np.array(edges, dtype=np.int64)           # indices into self.arcs
+        self.edge_lines = np.array(edge_lines, dtype=np.int64).reshape(-1, 2)
+        self.edge_matrix = self.arc_matrix[self.edges]
+
+        self.lines = np.array(sorted(line_arcs), dtype=np.int64)
+        self.line_matrix = np.zeros((len(self.lines), n_counters), dtype=np.int64)
+        for row, line in enumerate(self.lines):
+            for i in line_arcs[line]:
+                self.line_matrix[row] += self.arc_matrix[i]
+
+    def read_counters(self, gcda_path):
+        """Read a .gcda file into one counter vector laid out like this model."""
+        counters = np.zeros(self.num_counters, dtype=np.int64)
+        for ident, (checksum, values) in read_gcda(gcda_path).items():
+            if ident not in self.offsets:
+                continue
+            start, count, function = self.offsets[ident]
+            if checksum != function.cfg_checksum or len(values) != count:
+                raise ValueError(f"{gcda_path} does not match the notes for {function.name}")
+            counters[start:start + count] = values
+        return counters
+
+    def line_counts(self, counters):
+        """Per-line execution counts (aligned with self.lines) for a counter vector."""
+        return self.line_matrix @ counters
+
+    def arc_counts(self, counters):
+        """Per-arc execution counts (aligned with self.arcs) for a counter vector."""
+        return self.arc_matrix @ counters
+
+    def edge_counts(self, counters):
+        """Per-edge execution counts (aligned with self.edges) for a counter vector."""
+        return self.edge_matrix @ counters
+
+    def edge_labels(self):
+        """
+        [function, source block, destination block, source line, destination line]
+        of every edge. Blocks tell apart the edges between conditions on one line.
+        """
+        return [
+            [self.arcs[arc][0], self.arcs[arc][1], self.arcs[arc][2], int(src), int(dst)]
+            for arc, (src, dst) in zip(self.edges, self.edge_lines)
+        ]
+
+    def line_coverage(self, gcda_path):
+        """Read a .gcda file and return {line number: execution count}."""
+        counts = self.line_counts(self.read_counters(gcda_path))
+        return dict(zip(self.lines.tolist(), counts.tolist()))
+
+
+def main():
+    if len(sys.argv) < 3:
+        print("Usage: python gcov_reader.py <file.gcno> <file.gcda>")
+        sys.exit(1)
+
+    model = CoverageModel(sys.argv[1])
+    for line, count in model.line_coverage(sys.argv[2]).items():
+        print(f"{count if count else '#####':>9}:{line:>5}")
+
+
+if __name__ == "__main__":
+    main()
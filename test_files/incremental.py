@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Incremental maintenance of a coverage spectrum as tests.csv grows.
+
+A manifest stored next to the spectrum file (<spectrum>.manifest.json)
+records, for every test ID (1-based row of tests.csv) already in the
+spectrum, a fingerprint of its arguments and expected output and the row it
+occupies. It also keeps the running ef/ep counters. New tests are appended
+to the spectrum, tests whose row in tests.csv changed are re-executed and
+overwritten in place, and the counters are adjusted by exactly those rows,
+so refreshing the ranking costs time proportional to the new tests.
+
+The manifest also stores a hash of the program source; if the source
+changes, the line layout may change too and the spectrum is rebuilt.
+
+An update first saves the new manifest marked "pending", then writes the
+records, then saves it again without the mark. A manifest that is still
+pending, or whose record count differs from the file's, belongs to an
+update that did not finish; it is ignored and the spectrum is rebuilt.
+"""
+
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+from sbfl import make_counters
+from spectrum import Spectrum, append_records
+
+
+def manifest_path(spectrum_path):
+    return spectrum_path + ".manifest.json"
+
+
+def source_hash(source):
+    with open(source, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def fingerprint(args, expected):
+    """Identify the content of one tests.csv row."""
+    return hashlib.sha1((" ".join(args) + "," + expected).encode()).hexdigest()[:16]
+
+
+def load_manifest(spectrum_path, source):
+    """
+    Load the manifest, or return None if there is none, the source changed
+    or it does not describe the spectrum file (an interrupted update).
+    """
+    path = manifest_path(spectrum_path)
+    if not os.path.exists(path) or not os.path.exists(spectrum_path):
+        return None
+    with open(path, "r") as f:
+        manifest = json.load(f)
+    if manifest["source_hash"] != source_hash(source):
+        return None
+    if manifest.get("pending") or manifest.get("records") != Spectrum.open(spectrum_path).n_tests:
+        return None
+    return manifest
+
+
+def save_manifest(spectrum_path, manifest):
+    # Written under a temporary name and renamed, so it is never half written
+    path = manifest_path(spectrum_path)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    os.replace(path + ".tmp", path)
+
+
+def plan_update(manifest, tests):
+    """Return the 1-based test IDs that are new or whose tests.csv row changed."""
+    if manifest is None:
+        return list(range(1, len(tests) + 1))
+    known = manifest["tests"]
+    pending = []
+    for test_id, (args, expected) in enumerate(tests, 1):
+        entry = known.get(str(test_id))
+        if entry is None or entry[0] != fingerprint(args, expected):
+            pending.append(test_id)
+    return pending
+
+
+def _tally(covered, failed):
+    """ef and ep contributions of a block of unpacked coverage rows."""
+    ef = covered[failed].sum(axis=0)
+    ep = covered[~failed].sum(axis=0)
+    return ef, ep
+
+
+def create_spectrum(spectrum_path, spectrum, tests, source):
+    """Write a spectrum from scratch together with a fresh manifest."""
+    if os.path.exists(manifest_path(spectrum_path)):
+        os.remove(manifest_path(spectrum_path))
+    spectrum.save(spectrum_path)
+    failed = spectrum.failed
+    ef, ep = _tally(spectrum.covered(), failed)
+    manifest = {
+        "source_hash": source_hash(source),
+        "lines": spectrum.lines.tolist(),
+        "tests": {
+            str(test_id): [fingerprint(*tests[test_id - 1]), row]
+            for row, test_id in enumerate(spectrum.test_ids.tolist())
+        },
+        "ef": ef.tolist(),
+        "ep": ep.tolist(),
+        "failed": int(failed.sum()),
+        "passed": int((~failed).sum()),
+        "records": spectrum.n_tests,
+    }
+    save_manifest(spectrum_path, manifest)
+    return manifest
+
+
+def update_spectrum(spectrum_path, manifest, delta, tests):
+    """
+    Merge a spectrum of freshly executed tests into the stored one.
+
+    Tests already in the manifest are overwritten in place (their old
+    contribution is removed from the counters first); the rest are appended
+    after the file's last record. Only the rows in delta are read or
+    written.
+    """
+    if manifest["lines"] != delta.lines.tolist():
+        raise ValueError("New coverage does not match the lines of the stored spectrum")
+
+    ef = np.array(manifest["ef"], dtype=np.int64)
+    ep = np.array(manifest["ep"], dtype=np.int64)
+    known = manifest["tests"]
+    stored = Spectrum.open(spectrum_path, mode="r+")
+
+    replace = np.array([str(t) in known for t in delta.test_ids.tolist()], dtype=bool)
+    rows = np.array([known[str(t)][1] for t in delta.test_ids[replace].tolist()], dtype=np.int64)
+    if replace.any():
+        old_ef, old_ep = _tally(stored.covered(rows), stored.failed[rows])
+        ef -= old_ef
+        ep -= old_ep
+        manifest["failed"] -= int(stored.failed[rows].sum())
+        manifest["passed"] -= int((~stored.failed[rows]).sum())
+
+    # New records go after the last one actually in the file
+    appended = delta.records[~replace]
+    first_row = stored.n_tests
+    for offset, test_id in enumerate(appended["test_id"].tolist()):
+        known[str(test_id)] = [None, first_row + offset]
+
+    new_ef, new_ep = _tally(delta.covered(), delta.failed)
+    manifest["ef"] = (ef + new_ef).tolist()
+    manifest["ep"] = (ep + new_ep).tolist()
+    manifest["failed"] += int(delta.failed.sum())
+    manifest["passed"] += int((~delta.failed).sum())
+    manifest["records"] = first_row + len(appended)
+    for test_id in delta.test_ids.tolist():
+        known[str(test_id)][0] = fingerprint(*tests[test_id - 1])
+
+    # Until the records are written the manifest marks itself as unfinished
+    manifest["pending"] = True
+    save_manifest(spectrum_path, manifest)
+    if replace.any():
+        stored.records[rows] = delta.records[replace]
+        stored.records.flush()
+    del stored
+    if len(appended):
+        append_records(spectrum_path, appended)
+    del manifest["pending"]
+    save_manifest(spectrum_path, manifest)
+    return manifest
+
+
+def manifest_counters(manifest):
+    """SBFL counters of the whole stored spectrum, straight from the manifest."""
+    return make_counters(manifest["ef"], manifest["ep"], manifest["failed"], manifest["passed"])
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python incremental.py <file.spectrum>")
+        sys.exit(1)
+
+    with open(manifest_path(sys.argv[1]), "r") as f:
+        manifest = json.load(f)
+    print(f"{len(manifest['tests'])} tests in spectrum "
+          f"({manifest['failed']} failing, {manifest['passed']} passing), "
+          f"{len(manifest['lines'])} lines")
+
+
+if __name__ == "__main__":
+    main()
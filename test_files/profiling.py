@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Per-stage profiling of the localization scripts.
+
+fl_dstar.py, run_coverage.py, pipeline.py, the tracers, trace_visualizer.py,
+cfg_parser.py, line_graph.py and centrality.py accept --profile FILE (and
+--cprofile DIR). Their work is split into named stages:
+
+    with profiler.stage("parse", items=len(files)) as stage:
+        ...
+        stage.items = count     # or once it is known
+
+and for every stage the profiler records the wall time, the CPU time of
+this process and of the child processes reaped meanwhile (gcc, gdb, the
+program under test), the peak RSS, the number of items and the throughput
+in items per wall second. Peak RSS is the high-water mark of this process
+within the stage: on Linux the mark is reset at the start of every stage
+through /proc/self/clear_refs; where that is not possible it is the peak
+since the process started. Stages may nest. Work done in worker processes
+is added as a stage with profiler.record(name, seconds, items), or measured
+there and passed back with profiler.add(stage).
+
+The report is written as JSON when the profiled run ends (FILE "-" prints
+it to stderr):
+
+    {"script": "fl_dstar.py", "argv": [...], "started": "...", "wall": 1.2,
+     "cpu": 1.1, "children_cpu": 0.0, "peak_rss": 52736000,
+     "stages": [{"name": "parse_gcov", "wall": 0.9, "cpu": 0.9, "children_cpu": 0.0,
+                 "peak_rss": 48128000, "items": 1606, "throughput": 1784.4, "depth": 0}]}
+
+With --cprofile every outermost stage also runs under cProfile and its
+stats go to DIR/<script>.<stage>.prof (python -m pstats DIR/...). Without
+either option a stage only yields its record and measures nothing.
+
+    python profiling.py report.json     # print a saved report as a table
+"""
+
+import cProfile
+import datetime
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+CLEAR_REFS = "/proc/self/clear_refs"
+STATUS = "/proc/self/status"
+# ru_maxrss is in kilobytes on Linux and in bytes on macOS
+MAXRSS_UNIT = 1 if sys.platform == "darwin" else 1024
+
+
+def _reset_peak():
+    """Restart the high-water mark of this process's RSS where the kernel allows it."""
+    try:
+        with open(CLEAR_REFS, "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def peak_rss():
+    """High-water mark of this process's RSS in bytes."""
+    try:
+        with open(STATUS) as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * MAXRSS_UNIT
+
+
+def _children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Stage:
+    """Measurements of one stage; items can be set while it runs."""
+
+    def __init__(self, name, items=None, depth=0):
+        self.name = name
+        self.items = items
+        self.depth = depth
+        self.wall = self.cpu = self.children_cpu = 0.0
+        self.peak_rss = 0
+        self.profile = None
+
+    def to_dict(self):
+        record = {
+            "name": self.name, "wall": self.wall, "cpu": self.cpu, "children_cpu": self.children_cpu,
+            "peak_rss": self.peak_rss, "items": self.items,
+            "throughput": self.items / self.wall if self.items is not None and self.wall > 0 else None,
+            "depth": self.depth,
+        }
+        if self.profile:
+            record["profile"] = self.profile
+        return record
+
+
+class Profiler:
+    """Collects the stages of one run and writes them as JSON on close() or at the end of a with block."""
+
+    def __init__(self, script, output=None, cprofile_dir=None, argv=None):
+        self.script = script
+        self.output = output
+        self.cprofile_dir = cprofile_dir
+        self.argv = list(sys.argv[1:] if argv is None else argv)
+        self.enabled = output is not None or cprofile_dir is not None
+        self.stages = []
+        self._peaks = []         # running peak RSS of every open stage, outermost first
+        self._profiling = False  # cProfile cannot nest
+        self._start = (datetime.datetime.now(), time.perf_counter(), time.process_time(), _children_cpu())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        """Write the report to the output given at construction, if any."""
+        if self.output is not None:
+            self.write(self.output)
+
+    @contextmanager
+    def stage(self, name, items=None):
+        """Measure the enclosed block as one stage; yields its Stage record."""
+        stage = Stage(name, items, len(self._peaks))
+        if not self.enabled:
+            yield stage
+            return
+
+        # The peak so far belongs to the enclosing stage before the mark is reset
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], peak_rss())
+        self._peaks.append(0)
+        _reset_peak()
+        # Listed in the order stages start, so nested stages follow their parent
+        self.stages.append(stage)
+
+        profile = None
+        if self.cprofile_dir is not None and not self._profiling:
+            profile = cProfile.Profile()
+            self._profiling = True
+            profile.enable()
+        wall, cpu, children = time.perf_counter(), time.process_time(), _children_cpu()
+        try:
+            yield stage
+        finally:
+            stage.wall = time.perf_counter() - wall
+            stage.cpu = time.process_time() - cpu
+            stage.children_cpu = _children_cpu() - children
+            if profile is not None:
+                profile.disable()
+                self._profiling = False
+                os.makedirs(self.cprofile_dir, exist_ok=True)
+                stage.profile = os.path.join(self.cprofile_dir, f"{os.path.splitext(self.script)[0]}.{name}.prof")
+                profile.dump_stats(stage.profile)
+            stage.peak_rss = max(self._peaks.pop(), peak_rss())
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], stage.peak_rss)
+
+    def add(self, stage):
+        """Add a Stage measured in another process as a stage of the one now open."""
+        stage.depth = len(self._peaks)
+        if self.enabled:
+            self.stages.append(stage)
+        return stage
+
+    def record(self, name, seconds, items=None):
+        """
+        Add a stage that ran in other processes, e.g. pool workers, where
+        only its time (summed over the workers, so it can exceed the
+        enclosing wall time) and items are known.
+        """
+        stage = Stage(name, items)
+        stage.wall = seconds
+        return self.add(stage)
+
+    def report(self):
+        """The run and its stages, in the order they started."""
+        started, wall, cpu, children = self._start
+        return {
+            "script": self.script,
+            "argv": self.argv,
+            "started": started.isoformat(timespec="seconds"),
+            "wall": time.perf_counter() - wall,
+            "cpu": time.process_time() - cpu,
+            "children_cpu": _children_cpu() - children,
+            # Resetting the mark also resets ru_maxrss, so the stages keep the run's peak
+            "peak_rss": max([peak_rss()] + [stage.peak_rss for stage in self.stages]),
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def write(self, path):
+        text = json.dumps(self.report(), indent=2)
+        if path == "-":
+            print(text, file=sys.stderr)
+            return
+        with open(path, "w") as f:
+            f.write(text + "\n")
+
+
+def split_args(args):
+    """Take --profile FILE and --cprofile DIR out of an argument list: (profile, cprofile, rest)."""
+    options = {"--profile": None, "--cprofile": None}
+    rest = []
+    args = iter(args)
+    for arg in args:
+        name, equals, value = arg.partition("=")
+        if name in options:
+            options[name] = value if equals else next(args, None)
+        else:
+            rest.append(arg)
+    return options["--profile"], options["--cprofile"], rest
+
+
+def from_argv(script, args):
+    """A Profiler configured by --profile/--cprofile anywhere in args, and the other arguments."""
+    profile, cprofile, rest = split_args(args)
+    return Profiler(script, profile, cprofile, args), rest
+
+
+def from_command(script, arg):
+    """
+    Like from_argv for the argument string of a gdb command, where only
+    leading options are taken so the program's own arguments stay untouched.
+    """
+    words = arg.split()
+    taken = 0
+    while taken + 1 < len(words) and words[taken] in ("--profile", "--cprofile"):
+        taken += 2
+    profile, cprofile, _ = split_args(words[:taken])
+    rest = arg.split(None, taken)[taken] if len(words) > taken else ""
+    return Profiler(script, profile, cprofile, words), rest
+
+
+def add_arguments(parser):
+    """Add --profile and --cprofile to an argparse parser (see Profiler)."""
+    parser.add_argument("--profile", metavar="FILE", help="write per-stage timings and memory as JSON ('-' for stderr)")
+    parser.add_argument("--cprofile", metavar="DIR", help="also dump a cProfile of every stage into this directory")
+
+
+def format_report(report):
+    """A saved report as a text table."""
+    lines = [f"{report['script']} {' '.join(report['argv'])}",
+             f"{'stage':<28}{'wall s':>10}{'cpu s':>10}{'child s':>10}{'peak MB':>10}{'items':>10}{'items/s':>12}"]
+    for stage in report["stages"]:
+        items = "" if stage["items"] is None else stage["items"]
+        throughput = "" if stage["throughput"] is None else f"{stage['throughput']:.1f}"
+        lines.append(
+            f"{'  ' * stage['depth'] + stage['name']:<28}{stage['wall']:>10.3f}{stage['cpu']:>10.3f}"
+            f"{stage['children_cpu']:>10.3f}{stage['peak_rss'] / 1e6:>10.1f}{items:>10}{throughput:>12}"
+        )
+    lines.append(f"{'total':<28}{report['wall']:>10.3f}{report['cpu']:>10.3f}"
+                 f"{report['children_cpu']:>10.3f}{report['peak_rss'] / 1e6:>10.1f}")
+    return "\n".join(lines)
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python profiling.py <report.json> [report.json ...]")
+        sys.exit(1)
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            print(format_report(json.load(f)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Spectrum-preserving reduction of tests.csv.
+
+Many tests execute exactly the same lines. Tests are grouped by their
+packed coverage row together with their outcome, and the number of tests
+kept from each group is chosen in three steps:
+
+  1. ambiguity groups: one test of every distinct failing row, then the
+     distinct passing rows that split the most still-merged groups of lines
+     until the lines fall into the same ambiguity groups (lines with
+     identical coverage columns) as with the full suite;
+  2. ranking: ef, ep, nf and the totals only depend on how many tests of
+     each group run, and formulas built on their ratios keep their order
+     when all counts shrink by one factor. Bisection finds a small factor
+     whose rounded counts order every pair of lines as the full suite does
+     (equal scores must stay ties), for all lines or only the full suite's
+     top k. The order is compared through one tie-aware rank vector per
+     formula, never line by line;
+  3. single tests are dropped from the largest groups while the order holds.
+
+Every step is checked against the full spectrum, so the reduced suite
+ranks this version exactly as the full one. The selected rows are written
+unchanged, in their original order, as a filtered tests.csv for running
+later versions.
+
+    python reduce_tests.py tcas2 -o tests_reduced.csv
+    python reduce_tests.py tcas2 --spectrum tcas2.spectrum --top-k 10 -o tests_reduced.csv
+"""
+
+import argparse
+import csv
+import os
+import sys
+
+import numpy as np
+
+from run_coverage import build_spectrum, read_tests, run_coverage
+from sbfl import get_formula, make_counters
+from spectrum import Spectrum
+
+TIE_TOLERANCE = 1e-9
+
+
+def distinct_rows(covered, failed):
+    """
+    Group tests with identical coverage and outcome.
+
+    Returns (first test of each group, group of each test, group sizes).
+    """
+    keys = np.concatenate([np.packbits(covered, axis=1), failed[:, None].astype(np.uint8)], axis=1)
+    _, first, group, sizes = np.unique(keys, axis=0, return_index=True, return_inverse=True, return_counts=True)
+    return first, group.ravel(), sizes
+
+
+def ambiguity_groups(covered):
+    """Label each line by the distinct coverage column it has; equal labels are indistinguishable."""
+    if covered.shape[0] == 0:
+        return np.zeros(covered.shape[1], dtype=np.int64)
+    return np.unique(covered.T, axis=0, return_inverse=True)[1].ravel()
+
+
+def _scores(formulas, ef, ep, total_failed, total_passed):
+    """(..., lines, formulas) scores of broadcastable counter arrays."""
+    counters = make_counters(ef, ep, total_failed, total_passed)
+    return np.stack([get_formula(name)(counters) for name in formulas], axis=-1)
+
+
+def _order_keys(scores, rows):
+    """
+    Where each line's score falls among the distinct scores of the row lines,
+    per formula: 2i + 1 for equal to the i-th lowest (ties within
+    TIE_TOLERANCE), 2i for between it and the one below. Two score matrices
+    order every (row line, line) pair alike exactly when their keys are equal.
+    O(lines log lines); rows = all lines gives a tie-aware dense rank.
+    """
+    keys = np.empty(scores.shape, dtype=np.int64)
+    for f in range(scores.shape[1]):
+        values = np.round(scores[:, f] / TIE_TOLERANCE)
+        distinct = np.unique(values[rows])
+        position = np.searchsorted(distinct, values)
+        equal = distinct[np.minimum(position, len(distinct) - 1)] == values
+        keys[:, f] = 2 * position + equal
+    return keys
+
+
+def reduce_suite(covered, failed, formulas=("dstar2",), top_k=None):
+    """
+    Choose tests (row indices of covered) that keep the ambiguity groups and
+    the ranking of the full suite. Returns the sorted selection.
+    """
+    covered = np.asarray(covered, dtype=bool)
+    failed = np.asarray(failed, dtype=bool)
+    n_lines = covered.shape[1]
+    first, group, sizes = distinct_rows(covered, failed)
+    row_covered = covered[first].astype(np.int64)
+    row_failed = failed[first]
+
+    # Step 1: failing rows, then passing rows that split ambiguity groups
+    required = row_failed.copy()
+    target_groups = len(np.unique(ambiguity_groups(covered)))
+    labels = ambiguity_groups(covered[first[required]])
+    while len(np.unique(labels)) < target_groups and not required.all():
+        labels = np.unique(labels, return_inverse=True)[1].ravel()
+        members = np.zeros((n_lines, labels.max() + 1))
+        members[np.arange(n_lines), labels] = 1
+        hits = row_covered @ members
+        splits = ((hits > 0) & (hits < members.sum(axis=0))).sum(axis=1)
+        splits[required] = -1
+        best = int(np.argmax(splits))
+        if splits[best] <= 0:
+            break
+        required[best] = True
+        labels = labels * 2 + row_covered[best]
+
+    # Step 2: copies per distinct row, scaled down as far as the pair order allows
+    def scores(weights):
+        ef = (weights * row_failed) @ row_covered
+        ep = (weights * ~row_failed) @ row_covered
+        return _scores(formulas, ef, ep, int((weights * row_failed).sum()), int((weights * ~row_failed).sum()))
+
+    full_scores = scores(sizes)
+    if top_k is None:
+        rows = np.arange(n_lines)
+    else:
+        rows = np.lexsort((np.arange(n_lines), -full_scores[:, 0]))[:top_k]
+    full_order = _order_keys(full_scores, rows)
+
+    def preserved(weights):
+        return np.array_equal(_order_keys(scores(weights), rows), full_order)
+
+    minimum = required.astype(np.int64)
+
+    def scaled(factor):
+        return np.clip(np.round(sizes * factor).astype(np.int64), minimum, sizes)
+
+    # Scaling every count by the same factor leaves ratio-based scores in the
+    # same order; bisect for a small factor that still holds (factor 1 always does)
+    factors = np.unique(np.concatenate([np.arange(1, size + 1) / size for size in sizes.tolist()]))
+    low, high = -1, len(factors) - 1
+    while high - low > 1:
+        middle = (low + high) // 2
+        if preserved(scaled(factors[middle])):
+            high = middle
+        else:
+            low = middle
+    weights = scaled(factors[high])
+
+    # Step 3: drop single tests while the order still holds
+    changed = True
+    while changed:
+        changed = False
+        for r in np.argsort(-weights, kind="stable"):
+            if weights[r] > minimum[r]:
+                weights[r] -= 1
+                if preserved(weights):
+                    changed = True
+                else:
+                    weights[r] += 1
+
+    # The first tests of every group, in file order
+    selected = [t for r in range(len(first)) for t in np.flatnonzero(group == r)[:weights[r]].tolist()]
+    return sorted(selected)
+
+
+def write_tests(tests_file, output, test_ids):
+    """Copy the rows of the given 1-based test IDs from tests_file, unchanged and in order."""
+    keep = set(test_ids)
+    test_id = 0
+    with open(tests_file, 'r', newline='') as f, open(output, 'w', newline='') as out:
+        for line in f:
+            row = next(csv.reader([line]), [])
+            if len(row) < 2:
+                continue
+            test_id += 1
+            if test_id in keep:
+                out.write(line if line.endswith("\n") else line + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reduce tests.csv without changing the localization result.")
+    parser.add_argument("program", help="program name, e.g. tcas0 for tcas0.c")
+    parser.add_argument("--tests", default="tests.csv", help="CSV of <args>,<expected output>")
+    parser.add_argument("--source-dir", default=".", help="directory containing <program>.c")
+    parser.add_argument("--spectrum", help="use this spectrum file instead of running the tests")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of workers")
+    parser.add_argument("--formulas", nargs="+", default=["dstar2"], help="rankings to preserve")
+    parser.add_argument("--top-k", type=int, help="only preserve the order around the top k lines")
+    parser.add_argument("-o", "--output", default="tests_reduced.csv")
+    args = parser.parse_args()
+
+    tests = read_tests(args.tests)
+    if not tests:
+        print(f"No tests found in {args.tests}")
+        sys.exit(1)
+
+    if args.spectrum:
+        spectrum = Spectrum.open(args.spectrum)
+    else:
+        run = run_coverage(args.program, tests, args.source_dir, jobs=args.jobs, native=True)
+        spectrum = build_spectrum(run, args.program)
+
+    covered = spectrum.covered()
+    failed = spectrum.failed
+    first, _, _ = distinct_rows(covered, failed)
+    selected = reduce_suite(covered, failed, args.formulas, args.top_k)
+    write_tests(args.tests, args.output, spectrum.test_ids[selected].tolist())
+
+    kept = covered[selected]
+    preserved = len(np.unique(ambiguity_groups(kept))) == len(np.unique(ambiguity_groups(covered)))
+    print(f"{spectrum.n_tests} tests, {len(first)} distinct coverage rows")
+    print(f"Kept {len(selected)} tests ({int(failed[selected].sum())} failing): "
+          f"ambiguity groups {'preserved' if preserved else 'NOT preserved'}, ranking preserved")
+    print(f"Reduced suite written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,5 @@
 #!/bin/bash
 
-pip3 install pandas
-
-for i in {0..3}; do
-    echo -e "\ntcas$i:"
-    ./run_tests.sh "tcas$i"
-    python3 fl_dstar.py "$(pwd)/passing_dir" "$(pwd)/failing_dir"
-done
-
+# Every version of fault_versions.json, each in its own working directory.
+# Stages whose inputs are unchanged since the last run are skipped (see pipeline.py).
+cd "$(dirname "$0")/.." && python3 pipeline.py fault_versions.json "$@"
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+"""
+Parallel replacement for the per-test loop in run_tests.sh.
+
+The program is compiled once with coverage instrumentation and every row of
+tests.csv is executed on a pool of workers. Each worker writes its counters
+below its own GCOV_PREFIX directory, so concurrent runs never merge into the
+same .gcda file. The resulting .gcov files land in passing_dir/failing_dir
+exactly like run_tests.sh produces them, ready for fl_dstar.py.
+
+With --native the workers decode their .gcda files in-process through
+gcov_reader.py instead, so no gcov process or .gcov file is created and the
+D* ranking is printed directly. The per-test coverage can be saved as a
+bit-packed spectrum file (see spectrum.py) with --spectrum, and with
+--incremental only tests that are not yet in that spectrum are executed
+(see incremental.py). --edge-spectrum also records which CFG edges every
+test took, saves them in the same format and ranks them with D*.
+
+With --forkserver each worker starts the program once through
+forkserver.py and runs every test as a fork of it, skipping exec, dynamic
+linking and gcov start-up per test.
+
+--profile FILE writes the time, memory and throughput of compiling, running
+the tests, decoding their coverage and building (or, with --incremental,
+updating) the spectrum as JSON (see profiling.py).
+"""
+
+import argparse
+import csv
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool, util
+
+import numpy as np
+
+from fl_dstar import compute_suspiciousness, print_ranking
+from forkserver import ForkServer, compile_forkserver
+from gcov_reader import CoverageModel
+from incremental import create_spectrum, load_manifest, manifest_counters, plan_update, update_spectrum
+from profiling import Profiler, add_arguments
+from sbfl import print_scores, score, spectrum_counters
+from spectrum import Spectrum
+
+# Per-process state set up by init_worker
+_worker = {}
+
+
+def read_tests(tests_file):
+    """Read (arguments, expected output) pairs from a tests.csv file."""
+    tests = []
+    with open(tests_file, 'r', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                continue
+            tests.append((row[0].split(), row[1].strip()))
+    return tests
+
+
+def compile_program(program, source_dir, forkserver=False):
+    """Compile <program>.c with gcov instrumentation, returning the binary path."""
+    if forkserver:
+        return compile_forkserver(program, source_dir)
+    subprocess.run(
+        ["gcc", "-w", "-fprofile-arcs", "-ftest-coverage", "-o", program, f"{program}.c"],
+        cwd=source_dir,
+        check=True
+    )
+    return os.path.join(source_dir, program)
+
+
+def test_passed(returncode, stdout, expected):
+    """A test passes if it printed the expected output and was not killed by a signal (a crash or timeout)."""
+    return returncode >= 0 and expected in stdout
+
+
+def init_worker(config, scratch_root):
+    """Give this worker a private GCOV_PREFIX directory."""
+    work_dir = tempfile.mkdtemp(prefix="worker_", dir=scratch_root)
+
+    # gcov needs the notes file and the source next to the counters it reads
+    os.symlink(config["gcno"], os.path.join(work_dir, os.path.basename(config["gcno"])))
+    os.symlink(config["source"], os.path.join(work_dir, os.path.basename(config["source"])))
+
+    env = dict(os.environ)
+    env["GCOV_PREFIX"] = work_dir
+    env["GCOV_PREFIX_STRIP"] = str(config["prefix_strip"])
+
+    _worker.update(config)
+    _worker["dir"] = work_dir
+    _worker["env"] = env
+    _worker["gcda"] = os.path.join(work_dir, config["program"] + ".gcda")
+    _worker["server"] = ForkServer(config["binary"], env=env) if config["forkserver"] else None
+    if _worker["server"] is not None:
+        # Runs when the worker exits after Pool.close(); workers skip atexit
+        util.Finalize(_worker["server"], _worker["server"].close, exitpriority=0)
+
+
+def run_test(task):
+    """
+    Run one test in this worker's GCOV_PREFIX.
+
+    Returns (index, passed, line coverage, edge coverage, decode seconds).
+    Coverage comes from decoding the .gcda directly when a coverage model is
+    configured (edges only if enabled), as np.packbits rows of the executed
+    entries, or as the full counts when the config asks for counts;
+    otherwise gcov is run, its .gcov file is stored and the coverage is
+    None. Decode seconds is the time spent on either after the program
+    exited.
+    """
+    index, args, expected = task
+
+    if os.path.exists(_worker["gcda"]):
+        os.remove(_worker["gcda"])
+
+    if _worker["server"] is not None:
+        returncode, stdout = _worker["server"].run(args)
+    else:
+        result = subprocess.run(
+            [_worker["binary"]] + args,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            env=_worker["env"],
+            text=True
+        )
+        returncode, stdout = result.returncode, result.stdout
+    passed = test_passed(returncode, stdout, expected)
+    start = time.perf_counter()
+
+    if _worker["model"] is not None:
+        model = _worker["model"]
+        if os.path.exists(_worker["gcda"]):
+            counters = model.read_counters(_worker["gcda"])
+        else:
+            counters = np.zeros(model.num_counters, dtype=np.int64)
+        line_counts = model.line_counts(counters)
+        edge_counts = model.edge_counts(counters) if _worker["edges"] else None
+        if not _worker["counts"]:
+            # One bit per entry is all a spectrum keeps; the counts would be 64x larger
+            line_counts = np.packbits(line_counts > 0)
+            edge_counts = None if edge_counts is None else np.packbits(edge_counts > 0)
+        return index, passed, line_counts, edge_counts, time.perf_counter() - start
+
+    subprocess.run(
+        ["gcov", "-o", _worker["dir"], os.path.basename(_worker["source"])],
+        cwd=_worker["dir"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    out_dir = _worker["passing_dir"] if passed else _worker["failing_dir"]
+    program = _worker["program"]
+    shutil.move(
+        os.path.join(_worker["dir"], f"{program}.c.gcov"),
+        os.path.join(out_dir, f"{program}_test{index}.gcov")
+    )
+    return index, passed, None, None, time.perf_counter() - start
+
+
+def read_statements(source):
+    """Map each line number of a source file to its stripped text."""
+    with open(source, 'r') as f:
+        return {i: line.strip() for i, line in enumerate(f, 1)}
+
+
+def make_config(program, source_dir, passing_dir=None, failing_dir=None, native=False, edges=False,
+                forkserver=False, binary=None, counts=False):
+    """
+    Compile the program (unless an already built binary is given) and
+    describe it for init_worker; undo with remove_build. With counts,
+    run_test returns full execution counts instead of packed coverage bits.
+    """
+    source_dir = os.path.abspath(source_dir)
+    if binary is None:
+        binary = compile_program(program, source_dir, forkserver)
+    config = {
+        "program": program,
+        "binary": binary,
+        "source": os.path.join(source_dir, f"{program}.c"),
+        "gcno": os.path.join(source_dir, f"{program}.gcno"),
+        # Strip the whole object directory so counters land directly in GCOV_PREFIX
+        "prefix_strip": len(source_dir.strip(os.sep).split(os.sep)),
+        "passing_dir": passing_dir and os.path.abspath(passing_dir),
+        "failing_dir": failing_dir and os.path.abspath(failing_dir),
+    }
+    config["model"] = CoverageModel(config["gcno"], f"{program}.c") if native else None
+    config["edges"] = native and edges
+    config["forkserver"] = forkserver
+    config["counts"] = counts
+    return config
+
+
+def remove_build(config):
+    """Delete the binary and notes file made by make_config."""
+    os.remove(config["binary"])
+    os.remove(config["gcno"])
+
+
+def run_coverage(program, tests, source_dir, passing_dir=None, failing_dir=None, jobs=None, native=False,
+                 indices=None, edges=False, forkserver=False, binary=None, counts=False):
+    """
+    Execute all tests in parallel. indices gives the test ID of each entry of
+    tests and defaults to its 1-based position.
+
+    Returns a dict with the sorted "passing" and "failing" test indices, the
+    "elapsed" seconds, the "decode" seconds the workers spent reading
+    coverage (summed over tests) and, in native mode, the instrumented source
+    "lines" and the per-test line "bits" ({index: np.packbits row of the
+    executed lines}). With edges (native mode only) it also has the arc IDs
+    of the "edges", their "edge_labels" and the per-test "edge_bits". Only
+    with counts are the full execution counts kept as well, in "counts" and
+    "edge_counts" ({index: counts aligned with lines or edges}): they take
+    64 times the memory of the bits. forkserver runs the tests as forks of
+    one started process per worker. binary is a program already built by
+    compile_program in source_dir; it is used as is and left in place.
+    """
+    source_dir = os.path.abspath(source_dir)
+    if not native:
+        for d in (passing_dir, failing_dir):
+            shutil.rmtree(d, ignore_errors=True)
+            os.makedirs(d)
+
+    config = make_config(program, source_dir, passing_dir, failing_dir, native, edges, forkserver, binary, counts)
+    if indices is None:
+        indices = range(1, len(tests) + 1)
+    tasks = [(i, args, expected) for i, (args, expected) in zip(indices, tests)]
+
+    passing, failing = [], []
+    bits, edge_bits = {}, {}
+    line_counts, edge_counts = {}, {}
+    decode = 0.0
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="coverage_") as scratch_root:
+        with Pool(jobs, initializer=init_worker, initargs=(config, scratch_root)) as pool:
+            for index, passed, lines, arcs, seconds in pool.imap_unordered(run_test, tasks, chunksize=16):
+                (passing if passed else failing).append(index)
+                decode += seconds
+                if counts and lines is not None:
+                    line_counts[index] = lines
+                    lines = np.packbits(lines > 0)
+                if counts and arcs is not None:
+                    edge_counts[index] = arcs
+                    arcs = np.packbits(arcs > 0)
+                if lines is not None:
+                    bits[index] = lines
+                if arcs is not None:
+                    edge_bits[index] = arcs
+            pool.close()
+            pool.join()
+    elapsed = time.perf_counter() - start
+
+    if binary is None:
+        remove_build(config)
+    model = config["model"]
+    run = {
+        "passing": sorted(passing),
+        "failing": sorted(failing),
+        "lines": model.lines if native else None,
+        "bits": bits,
+        "edges": model.edges if config["edges"] else None,
+        "edge_labels": model.edge_labels() if config["edges"] else None,
+        "edge_bits": edge_bits,
+        "elapsed": elapsed,
+        "decode": decode,
+    }
+    if counts:
+        run["counts"] = line_counts
+        run["edge_counts"] = edge_counts
+    return run
+
+
+def build_spectrum(run, program, entity="lines"):
+    """Collect the per-test line (or edge) bits of a native run into a Spectrum."""
+    if entity == "edges":
+        columns, bits = run["edges"], run["edge_bits"]
+        meta = {"program": program, "source": f"{program}.c", "entity": "edges", "edges": run["edge_labels"]}
+    else:
+        columns, bits = run["lines"], run["bits"]
+        meta = {"program": program, "source": f"{program}.c"}
+    test_ids = sorted(bits)
+    failing = set(run["failing"])
+    rows = (bits[i] for i in test_ids)
+    return Spectrum.from_packed(columns, test_ids, [i in failing for i in test_ids], rows, meta=meta)
+
+
+def rank_counters(lines, counters, source):
+    """Compute the fl_dstar.py ranking from per-line SBFL counters."""
+    lines = list(lines)
+    failed_counts = dict(zip(lines, counters.ef.astype(int).tolist()))
+    passed_counts = dict(zip(lines, counters.ep.astype(int).tolist()))
+    total_failed = int(counters.ef[0] + counters.nf[0]) if lines else 0
+    return compute_suspiciousness(read_statements(source), passed_counts, failed_counts, total_failed)
+
+
+def run_incremental(args, tests, source, profiler):
+    """Run only new or changed tests and fold them into the stored spectrum."""
+    with profiler.stage("plan", items=len(tests)):
+        manifest = load_manifest(args.spectrum, source)
+        pending = plan_update(manifest, tests)
+    print(f"{len(tests) - len(pending)} tests already in {args.spectrum}, {len(pending)} to run")
+
+    if pending:
+        with profiler.stage("compile"):
+            binary = compile_program(args.program, args.source_dir, args.forkserver)
+        try:
+            with profiler.stage("run_tests", items=len(pending)):
+                run = run_coverage(
+                    args.program, [tests[i - 1] for i in pending], args.source_dir,
+                    jobs=args.jobs, native=True, indices=pending, forkserver=args.forkserver, binary=binary
+                )
+                profiler.record("decode", run["decode"], items=len(pending))
+        finally:
+            os.remove(binary)
+            os.remove(os.path.join(args.source_dir, f"{args.program}.gcno"))
+        print(f"Elapsed {run['elapsed']:.2f}s ({len(pending) / run['elapsed']:.1f} tests/s)")
+        with profiler.stage("update", items=len(pending)):
+            delta = build_spectrum(run, args.program)
+            if manifest is None:
+                manifest = create_spectrum(args.spectrum, delta, tests, source)
+            else:
+                manifest = update_spectrum(args.spectrum, manifest, delta, tests)
+
+    print(f"Spectrum holds {manifest['failed']} failing and {manifest['passed']} passing tests")
+    with profiler.stage("rank", items=len(manifest["lines"])):
+        ranking = rank_counters(manifest["lines"], manifest_counters(manifest), source)
+    print_ranking(ranking)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect per-test gcov coverage in parallel.")
+    parser.add_argument("program", help="program name, e.g. tcas0 for tcas0.c")
+    parser.add_argument("--tests", default="tests.csv", help="CSV of <args>,<expected output>")
+    parser.add_argument("--source-dir", default=".", help="directory containing <program>.c")
+    parser.add_argument("--passing-dir", default="passing_dir")
+    parser.add_argument("--failing-dir", default="failing_dir")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of workers")
+    parser.add_argument("--native", action="store_true",
+                        help="decode .gcda files in-process and print the D* ranking instead of writing .gcov files")
+    parser.add_argument("--spectrum", help="with --native, also save the coverage spectrum to this file")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only run tests missing from (or changed since) --spectrum and update it in place")
+    parser.add_argument("--edge-spectrum",
+                        help="with --native, also record per-test CFG edge coverage, save it to this file "
+                             "and rank the edges")
+    parser.add_argument("--forkserver", action="store_true",
+                        help="run the tests as forks of one started program per worker")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    tests = read_tests(args.tests)
+    if not tests:
+        print(f"No tests found in {args.tests}")
+        sys.exit(1)
+
+    if args.incremental:
+        if not args.spectrum:
+            parser.error("--incremental requires --spectrum")
+        with Profiler("run_coverage.py", args.profile, args.cprofile) as profiler:
+            run_incremental(args, tests, os.path.join(args.source_dir, f"{args.program}.c"), profiler)
+        return
+
+    if args.edge_spectrum and not args.native:
+        parser.error("--edge-spectrum requires --native")
+
+    with Profiler("run_coverage.py", args.profile, args.cprofile) as profiler:
+        with profiler.stage("compile"):
+            binary = compile_program(args.program, args.source_dir, args.forkserver)
+        try:
+            with profiler.stage("run_tests", items=len(tests)):
+                run = run_coverage(
+                    args.program, tests, args.source_dir, args.passing_dir, args.failing_dir, args.jobs,
+                    args.native, edges=bool(args.edge_spectrum), forkserver=args.forkserver, binary=binary
+                )
+                profiler.record("decode", run["decode"], items=len(tests))
+        finally:
+            os.remove(binary)
+            os.remove(os.path.join(args.source_dir, f"{args.program}.gcno"))
+        print(f"Ran {len(tests)} tests with {args.jobs} workers: "
+              f"{len(run['passing'])} passing, {len(run['failing'])} failing")
+        print(f"Elapsed {run['elapsed']:.2f}s ({len(tests) / run['elapsed']:.1f} tests/s)")
+
+        if args.native:
+            with profiler.stage("spectrum", items=len(run["bits"])):
+                spectrum = build_spectrum(run, args.program)
+                if args.spectrum:
+                    spectrum.save(args.spectrum)
+            if args.spectrum:
+                print(f"Saved {spectrum.n_tests} x {spectrum.n_lines} spectrum to {args.spectrum}")
+            source = os.path.join(args.source_dir, f"{args.program}.c")
+            with profiler.stage("rank", items=spectrum.n_lines):
+                ranking = rank_counters(spectrum.lines.tolist(), spectrum_counters(spectrum), source)
+            print_ranking(ranking)
+
+        if args.edge_spectrum:
+            with profiler.stage("edge_spectrum", items=len(run["edge_bits"])):
+                edge_spectrum = build_spectrum(run, args.program, entity="edges")
+                edge_spectrum.save(args.edge_spectrum)
+                edge_scores = score(spectrum_counters(edge_spectrum), ["dstar2"])
+            print(f"Saved {edge_spectrum.n_tests} x {edge_spectrum.n_lines} edge spectrum to {args.edge_spectrum}")
+            print_scores(edge_spectrum, edge_scores, ["dstar2"])
+
+
+if __name__ == "__main__":
+    main()
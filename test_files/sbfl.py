@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Vectorized spectrum-based fault localization (SBFL) scoring.
+
+Every formula is a function of four per-line counters:
+    ef / ep: failing / passing tests that execute the line
+    nf / np: failing / passing tests that do not execute it
+The counters are computed once for all lines with array operations, then a
+whole family of formulas is evaluated on them, giving a lines x formulas
+score matrix. Edge spectra (see spectrum.py) are scored the same way, one
+row per CFG edge.
+"""
+
+import sys
+from collections import namedtuple
+
+import numpy as np
+
+Counters = namedtuple("Counters", ["ef", "ep", "nf", "np"])
+
+DEFAULT_FORMULAS = ["dstar2", "ochiai", "tarantula", "op2", "barinel", "jaccard"]
+
+
+def _divide(numerator, denominator):
+    """Elementwise division that yields 0 wherever the denominator is 0."""
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.broadcast_to(np.asarray(denominator, dtype=np.float64), numerator.shape)
+    out = np.zeros(numerator.shape)
+    np.divide(numerator, denominator, out=out, where=denominator != 0)
+    return out
+
+
+def make_counters(ef, ep, total_failed, total_passed):
+    """Build Counters from per-line failing/passing execution counts."""
+    ef = np.asarray(ef, dtype=np.float64)
+    ep = np.asarray(ep, dtype=np.float64)
+    return Counters(ef, ep, total_failed - ef, total_passed - ep)
+
+
+def spectrum_counters(spectrum):
+    """Compute ef/ep/nf/np for every line of a Spectrum in one pass over its rows."""
+    failed = spectrum.failed
+    ef = np.zeros(spectrum.n_lines, dtype=np.int64)
+    executed = np.zeros(spectrum.n_lines, dtype=np.int64)
+    for rows, covered in spectrum.iter_chunks():
+        executed += covered.sum(axis=0)
+        ef += covered[failed[rows]].sum(axis=0)
+    total_failed = int(failed.sum())
+    return make_counters(ef, executed - ef, total_failed, spectrum.n_tests - total_failed)
+
+
+def dstar(power=2, zero_denominator=None):
+    """
+    D* formula: ef^power / (ep + nf).
+
+    zero_denominator is used in place of ep + nf where that is 0 (a line
+    executed by every failing test and no passing one). None scores those
+    lines 0, as fl_dstar.py always has; build_graph.ipynb uses 0.5.
+    """
+    def formula(c):
+        denominator = c.ep + c.nf
+        if zero_denominator is not None:
+            denominator = np.where(denominator == 0, zero_denominator, denominator)
+        return _divide(c.ef ** power, denominator)
+    formula.__name__ = f"dstar{power:g}"
+    return formula
+
+
+def ochiai(c):
+    return _divide(c.ef, np.sqrt((c.ef + c.nf) * (c.ef + c.ep)))
+
+
+def tarantula(c):
+    failed_ratio = _divide(c.ef, c.ef + c.nf)
+    passed_ratio = _divide(c.ep, c.ep + c.np)
+    return _divide(failed_ratio, failed_ratio + passed_ratio)
+
+
+def op2(c):
+    return c.ef - _divide(c.ep, c.ep + c.np + 1)
+
+
+def barinel(c):
+    # 1 - ep / (ep + ef), written so that unexecuted lines score 0
+    return _divide(c.ef, c.ef + c.ep)
+
+
+def jaccard(c):
+    return _divide(c.ef, c.ef + c.nf + c.ep)
+
+
+FORMULAS = {
+    "ochiai": ochiai,
+    "tarantula": tarantula,
+    "op2": op2,
+    "barinel": barinel,
+    "jaccard": jaccard,
+}
+
+
+def get_formula(name):
+    """Look up a formula by name; "dstar<p>" selects D* with power p."""
+    if name.startswith("dstar"):
+        return dstar(float(name[len("dstar"):] or 2))
+    if name not in FORMULAS:
+        raise ValueError(f"Unknown SBFL formula: {name}")
+    return FORMULAS[name]
+
+
+def score(counters, formulas=DEFAULT_FORMULAS):
+    """Evaluate formulas (names or callables) on counters, returning a lines x formulas matrix."""
+    formulas = [get_formula(f) if isinstance(f, str) else f for f in formulas]
+    scores = np.empty((len(counters.ef), len(formulas)))
+    for j, formula in enumerate(formulas):
+        scores[:, j] = formula(counters)
+    return scores
+
+
+def print_scores(spectrum, scores, formulas, top=10):
+    """Print the top rows of a score matrix, ranked by the first formula."""
+    # Ties broken by line number (arc ID for edge spectra)
+    order = np.lexsort((spectrum.lines, -scores[:, 0]))
+    labels = spectrum.labels()
+    width = max([5] + [len(labels[i]) for i in order[:top]])
+    header = "Line" if spectrum.entity == "lines" else "Edge"
+    print(f"{header:>{width}} " + " ".join(f"{name:>10}" for name in formulas))
+    for i in order[:top]:
+        print(f"{labels[i]:>{width}} " + " ".join(f"{s:>10.4f}" for s in scores[i]))
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python sbfl.py <file.spectrum> [formula ...]")
+        sys.exit(1)
+
+    from spectrum import Spectrum
+
+    spectrum = Spectrum.open(sys.argv[1])
+    formulas = sys.argv[2:] or DEFAULT_FORMULAS
+    print_scores(spectrum, score(spectrum_counters(spectrum), formulas), formulas)
+
+
+if __name__ == "__main__":
+    main()
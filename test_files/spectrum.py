@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Bit-packed coverage spectrum: which lines (or CFG edges) every test
+executed, plus whether the test failed.
+
+The spectrum is stored as one binary file that is memory-mapped on open, so
+reopening it costs no parsing:
+
+    magic "SPECTRM1"
+    uint64 n_lines, row_bytes, n_tests, meta_length
+    meta_length bytes of JSON metadata (program, source file, ...)
+    int64[n_lines] line numbers                          (8-byte aligned)
+    n_tests fixed-width test records                     (64-byte aligned)
+        int64 test_id, uint8 failed, uint8[row_bytes] packed coverage bits
+
+Keeping each test's outcome next to its coverage row means new tests can be
+appended (append_records) without moving anything that is already on disk.
+Bits are packed with np.packbits, most significant bit first, one bit per
+entry of lines.
+
+An edge spectrum has the same layout with arc IDs in place of line numbers;
+its metadata has "entity": "edges" and an "edges" list of
+[function, source block, destination block, source line, destination line]
+aligned with the IDs (see gcov_reader.CoverageModel.edge_labels). A
+transition spectrum (trace_tests.py) numbers the dynamic line-to-line
+transitions from 0 and lists them as "transitions".
+"""
+
+import json
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b"SPECTRM1"
+HEADER = struct.Struct("<8sQQQQ")
+RECORD_ALIGN = 64
+
+# Rows unpacked at a time when summing columns, bounding temporary memory
+UNPACK_BUDGET = 1 << 26
+
+
+def _align(offset, alignment):
+    return (offset + alignment - 1) // alignment * alignment
+
+
+def record_dtype(row_bytes):
+    """Structured dtype of one test record."""
+    return np.dtype([("test_id", "<i8"), ("failed", "u1"), ("bits", "u1", (row_bytes,))])
+
+
+def _layout(n_lines, meta_length):
+    """Byte offsets of the line table and the first test record."""
+    lines_offset = _align(HEADER.size + meta_length, 8)
+    records_offset = _align(lines_offset + 8 * n_lines, RECORD_ALIGN)
+    return lines_offset, records_offset
+
+
+class Spectrum:
+    """Tests x lines coverage bit-matrix with a pass/fail label per test."""
+
+    def __init__(self, lines, records, meta=None):
+        self.lines = np.asarray(lines, dtype=np.int64)
+        self.records = records
+        self.meta = meta or {}
+
+    @classmethod
+    def from_coverage(cls, lines, test_ids, failed, covered, meta=None):
+        """Build a spectrum from a (tests x lines) boolean or count matrix."""
+        lines = np.asarray(lines, dtype=np.int64)
+        covered = np.asarray(covered)
+        row_bytes = (len(lines) + 7) // 8
+        records = np.zeros(len(test_ids), dtype=record_dtype(row_bytes))
+        records["test_id"] = test_ids
+        records["failed"] = failed
+        if len(test_ids):
+            records["bits"] = np.packbits(covered > 0, axis=1)
+        return cls(lines, records, meta)
+
+    @classmethod
+    def from_packed(cls, lines, test_ids, failed, rows, meta=None):
+        """
+        Build a spectrum from one np.packbits row per test (any iterable),
+        copying each row into its record so no unpacked matrix is formed.
+        """
+        lines = np.asarray(lines, dtype=np.int64)
+        row_bytes = (len(lines) + 7) // 8
+        records = np.zeros(len(test_ids), dtype=record_dtype(row_bytes))
+        records["test_id"] = test_ids
+        records["failed"] = failed
+        bits = records["bits"]
+        for i, row in enumerate(rows):
+            bits[i] = row
+        return cls(lines, records, meta)
+
+    @classmethod
+    def from_sparse(cls, lines, test_ids, failed, counts, meta=None):
+        """
+        Build a spectrum from a (tests x lines) scipy sparse count matrix,
+        setting the bits of its stored nonzeros without a dense copy.
+        """
+        lines = np.asarray(lines, dtype=np.int64)
+        counts = counts.tocsr()
+        row_bytes = (len(lines) + 7) // 8
+        records = np.zeros(len(test_ids), dtype=record_dtype(row_bytes))
+        records["test_id"] = test_ids
+        records["failed"] = failed
+        rows = np.repeat(np.arange(counts.shape[0]), np.diff(counts.indptr))
+        hit = counts.data > 0
+        columns = counts.indices[hit].astype(np.int64)
+        # np.packbits order: the first column is the high bit of the first byte
+        bits = records["bits"]
+        np.bitwise_or.at(bits, (rows[hit], columns >> 3), (0x80 >> (columns & 7)).astype(np.uint8))
+        records["bits"] = bits
+        return cls(lines, records, meta)
+
+    @property
+    def n_tests(self):
+        return len(self.records)
+
+    @property
+    def n_lines(self):
+        return len(self.lines)
+
+    @property
+    def entity(self):
+        """"lines" or "edges": what the columns of the spectrum are."""
+        return self.meta.get("entity", "lines")
+
+    def labels(self):
+        """
+        Printable name of every column: the line number, "function:src->dst
+        (blocks)" for edges or "file:line -> file:line" for transitions.
+        """
+        if self.entity == "edges":
+            return [
+                f"{function}:{src}->{dst} ({src_block}->{dst_block})"
+                for function, src_block, dst_block, src, dst in self.meta["edges"]
+            ]
+        if self.entity == "transitions":
+            return self.meta["transitions"]
+        return [str(line) for line in self.lines.tolist()]
+
+    @property
+    def test_ids(self):
+        return self.records["test_id"]
+
+    @property
+    def failed(self):
+        return self.records["failed"].astype(bool)
+
+    @property
+    def bits(self):
+        """Packed (tests x row_bytes) coverage matrix."""
+        return self.records["bits"]
+
+    def covered(self, rows=slice(None)):
+        """Unpack the coverage of the selected tests into a boolean matrix."""
+        bits = self.bits[rows]
+        return np.unpackbits(bits, axis=-1, count=self.n_lines).astype(bool)
+
+    def iter_chunks(self):
+        """Yield (row slice, unpacked coverage) in blocks that fit the unpack budget."""
+        step = max(1, UNPACK_BUDGET // max(self.n_lines, 1))
+        for start in range(0, self.n_tests, step):
+            rows = slice(start, min(start + step, self.n_tests))
+            yield rows, self.covered(rows)
+
+    def line_counts(self, mask=None):
+        """Number of tests (optionally only those where mask is True) covering each line."""
+        counts = np.zeros(self.n_lines, dtype=np.int64)
+        for rows, covered in self.iter_chunks():
+            if mask is None:
+                counts += covered.sum(axis=0)
+            else:
+                counts += covered[mask[rows]].sum(axis=0)
+        return counts
+
+    def save(self, path):
+        """Write the spectrum to a single memory-mappable file."""
+        meta = json.dumps(self.meta).encode()
+        row_bytes = self.records.dtype["bits"].shape[0]
+        lines_offset, records_offset = _layout(self.n_lines, len(meta))
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, self.n_lines, row_bytes, self.n_tests, len(meta)))
+            f.write(meta)
+            f.seek(lines_offset)
+            f.write(self.lines.astype("<i8").tobytes())
+            f.seek(records_offset)
+            f.write(np.ascontiguousarray(self.records).tobytes())
+
+    @classmethod
+    def open(cls, path, mode="r"):
+        """Memory-map a spectrum file written by save()."""
+        with open(path, "rb") as f:
+            magic, n_lines, row_bytes, n_tests, meta_length = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a spectrum file")
+            meta = json.loads(f.read(meta_length) or b"{}")
+        lines_offset, records_offset = _layout(n_lines, meta_length)
+
+        lines = np.memmap(path, dtype="<i8", mode="r", offset=lines_offset, shape=(n_lines,))
+        if n_tests:
+            records = np.memmap(path, dtype=record_dtype(row_bytes), mode=mode,
+                                offset=records_offset, shape=(n_tests,))
+        else:
+            records = np.zeros(0, dtype=record_dtype(row_bytes))
+        return cls(np.array(lines), records, meta)
+
+
+def append_records(path, records):
+    """Append test records to a spectrum file in place, without rewriting it."""
+    with open(path, "r+b") as f:
+        magic, n_lines, row_bytes, n_tests, meta_length = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a spectrum file")
+        if records.dtype != record_dtype(row_bytes):
+            raise ValueError(f"Records do not match the {n_lines}-line layout of {path}")
+        _, records_offset = _layout(n_lines, meta_length)
+        f.seek(records_offset + n_tests * records.dtype.itemsize)
+        f.write(np.ascontiguousarray(records).tobytes())
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, n_lines, row_bytes, n_tests + len(records), meta_length))
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python spectrum.py <file.spectrum>")
+        sys.exit(1)
+
+    spectrum = Spectrum.open(sys.argv[1])
+    failed = spectrum.failed
+    print(f"{spectrum.meta.get('source', sys.argv[1])}: "
+          f"{spectrum.n_tests} tests ({failed.sum()} failing) x {spectrum.n_lines} {spectrum.entity}")
+    for label, ef, ep in zip(spectrum.labels(), spectrum.line_counts(failed), spectrum.line_counts(~failed)):
+        print(f"{label:>5}: failed {ef:>6}  passed {ep:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Dynamic control-flow spectrum: which source-line transitions every test
+took, and how often.
+
+The program is built once with the compiled-instrumentation tracer
+(full_path/instrumented_tracer.py) and every row of tests.csv runs on a
+pool of workers. Each trace gets its own ring buffer and each worker its
+own output file, so runs never share a statement_trace.txt. A worker folds
+its trace into (source line -> target line) counts as soon as the test
+ends, so only one trace per worker is ever held, never a text file per
+test.
+
+The result is a tests x dynamic edges count matrix (scipy CSR) with a
+pass/fail label per test, saved as .npz. It converts to a bit-packed
+Spectrum (entity "transitions") for sbfl.py, and line_weights() sums it
+into {(line, line): count} for weighting the edges of the line graph in
+build_graph.ipynb.
+
+    python trace_tests.py tcas0 -o tcas0_transitions.npz
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from scipy import sparse
+
+from run_coverage import read_tests
+from sbfl import print_scores, score, spectrum_counters
+from spectrum import Spectrum
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "full_path"))
+from instrumented_tracer import BinaryMap, build, trace
+
+# Per-process state set up by init_worker
+_worker = {}
+
+
+class TraceMatrix:
+    """Tests x transitions count matrix with a pass/fail label per test."""
+
+    def __init__(self, counts, transitions, test_ids, failed, meta=None):
+        self.counts = counts.tocsr()
+        self.transitions = transitions
+        self.test_ids = np.asarray(test_ids, dtype=np.int64)
+        self.failed = np.asarray(failed, dtype=bool)
+        self.meta = meta or {}
+
+    @property
+    def n_tests(self):
+        return self.counts.shape[0]
+
+    @property
+    def n_transitions(self):
+        return self.counts.shape[1]
+
+    def labels(self):
+        return [f"{source} -> {target}" for source, target in self.transitions]
+
+    def to_spectrum(self):
+        """Bit-packed Spectrum of which transitions each test took, for sbfl.py."""
+        meta = dict(self.meta, entity="transitions", transitions=self.labels())
+        return Spectrum.from_sparse(
+            np.arange(self.n_transitions), self.test_ids, self.failed, self.counts, meta=meta
+        )
+
+    def line_weights(self, source, tests=None):
+        """
+        Sum the counts of the selected tests (a boolean mask; all by default)
+        into {(line, line): count} for the transitions inside one source file.
+        """
+        counts = self.counts if tests is None else self.counts[np.asarray(tests, dtype=bool)]
+        totals = np.asarray(counts.sum(axis=0)).ravel()
+        name = os.path.basename(source)
+        weights = {}
+        for (from_location, to_location), total in zip(self.transitions, totals.tolist()):
+            from_file, _, from_line = from_location.rpartition(":")
+            to_file, _, to_line = to_location.rpartition(":")
+            if total and os.path.basename(from_file) == name and os.path.basename(to_file) == name:
+                weights[int(from_line), int(to_line)] = total
+        return weights
+
+    def save(self, path):
+        np.savez(
+            path,
+            data=self.counts.data, indices=self.counts.indices, indptr=self.counts.indptr,
+            shape=np.array(self.counts.shape), transitions=np.array(self.labels()),
+            test_ids=self.test_ids, failed=self.failed, meta=np.array(json.dumps(self.meta))
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            counts = sparse.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+            transitions = [tuple(label.split(" -> ", 1)) for label in f["transitions"].tolist()]
+            return cls(counts, transitions, f["test_ids"], f["failed"], json.loads(str(f["meta"])))
+
+
+def init_worker(binary):
+    """Decode the binary's line table once per worker and give it a private output file."""
+    _worker["binary"] = binary
+    _worker["map"] = BinaryMap(binary)
+    _worker["stdout"] = tempfile.TemporaryFile(mode="w+")
+
+
+def trace_test(task):
+    """Trace one test; returns (index, passed, {(from, to): count})."""
+    index, args, expected = task
+    stdout = _worker["stdout"]
+    stdout.seek(0)
+    stdout.truncate()
+    locations, _ = trace(_worker["binary"], args, _worker["map"], stdout=stdout)
+    stdout.seek(0)
+    passed = expected in stdout.read()
+
+    counts = {}
+    for transition in zip(locations, locations[1:]):
+        counts[transition] = counts.get(transition, 0) + 1
+    return index, passed, counts
+
+
+def trace_tests(program, tests, source_dir=".", jobs=None):
+    """Trace every test in parallel and fold the results into a TraceMatrix."""
+    source = os.path.abspath(os.path.join(source_dir, f"{program}.c"))
+    tasks = [(i, args, expected) for i, (args, expected) in enumerate(tests, 1)]
+
+    columns = {}
+    rows, cols, data = [], [], []
+    outcomes = {}
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="trace_tests_") as work_dir:
+        binary = build(source, os.path.join(work_dir, program))
+        with Pool(jobs, initializer=init_worker, initargs=(binary,)) as pool:
+            for index, passed, counts in pool.imap_unordered(trace_test, tasks, chunksize=16):
+                outcomes[index] = passed
+                for transition, count in counts.items():
+                    rows.append(index)
+                    cols.append(columns.setdefault(transition, len(columns)))
+                    data.append(count)
+    elapsed = time.perf_counter() - start
+
+    test_ids = sorted(outcomes)
+    row_of = {index: row for row, index in enumerate(test_ids)}
+    counts = sparse.csr_matrix(
+        (np.array(data, dtype=np.int64), (np.array([row_of[i] for i in rows], dtype=np.int64), np.array(cols))),
+        shape=(len(test_ids), len(columns))
+    )
+    matrix = TraceMatrix(
+        counts, list(columns), test_ids, [not outcomes[i] for i in test_ids],
+        meta={"program": program, "source": f"{program}.c"}
+    )
+    return matrix, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Trace every test and build a tests x transitions count matrix.")
+    parser.add_argument("program", help="program name, e.g. tcas0 for tcas0.c")
+    parser.add_argument("--tests", default="tests.csv", help="CSV of <args>,<expected output>")
+    parser.add_argument("--source-dir", default=".", help="directory containing <program>.c")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of workers")
+    parser.add_argument("-o", "--output", help="save the count matrix to this .npz file")
+    parser.add_argument("--spectrum", help="also save the transition spectrum to this file")
+    args = parser.parse_args()
+
+    tests = read_tests(args.tests)
+    if not tests:
+        print(f"No tests found in {args.tests}")
+        sys.exit(1)
+
+    matrix, elapsed = trace_tests(args.program, tests, args.source_dir, args.jobs)
+    print(f"Traced {matrix.n_tests} tests ({matrix.failed.sum()} failing) with {args.jobs} workers "
+          f"in {elapsed:.2f}s ({matrix.n_tests / elapsed:.1f} tests/s)")
+    print(f"{matrix.n_transitions} distinct transitions, {matrix.counts.sum()} taken in total")
+    if args.output:
+        matrix.save(args.output)
+        print(f"Saved count matrix to {args.output}")
+
+    spectrum = matrix.to_spectrum()
+    if args.spectrum:
+        spectrum.save(args.spectrum)
+        print(f"Saved {spectrum.n_tests} x {spectrum.n_lines} transition spectrum to {args.spectrum}")
+    print_scores(spectrum, score(spectrum_counters(spectrum), ["dstar2"]), ["dstar2"])
+
+
+if __name__ == "__main__":
+    main()